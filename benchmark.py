@@ -0,0 +1,402 @@
+"""
+Benchmarks for the delivery analytics pipeline.
+
+Scales the sample dataset up, by tiling it or with generate_data.py (whose clients and
+warehouses grow with the orders, as in a real extract), so the numbers are indicative of
+how each stage grows with order volume rather than of any particular production extract.
+
+Usage:
+  python benchmark.py reasons --sizes 15000 1000000 10000000
+  python benchmark.py workers --orders 1000000 --workers 1 2 4 8 16
+  python benchmark.py dedup --orders 1000000 10000000
+  python benchmark.py intent --repeat 200
+  python benchmark.py cube --orders 10000 1000000 --data_dir bench-data
+  python benchmark.py compare --orders 10000 1000000 --data_dir bench-data
+  python benchmark.py --json stages.json stages --orders 10000 1000000 --data_dir bench-data
+  python benchmark.py stages --orders 1000000 --data_dir bench-data --baseline stages.json
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+from tabulate import tabulate
+
+import delivery_analytics as da
+import generate_data
+
+# Columns the root-cause rules read, plus the two performance flags.
+REASON_COLUMNS = ['is_late', 'is_failed'] + [column for column, _, _ in da.REASON_RULES]
+
+
+def _sample_frame() -> pd.DataFrame:
+    data = da.load_data()
+    if not data:
+        raise SystemExit(f"Could not load the sample data from {da.DATA_DIR}")
+    return da.assess_performance(da.combine_data(data))
+
+
+def _tile(df: pd.DataFrame, rows: int) -> pd.DataFrame:
+    """Repeat `df` until it has `rows` rows."""
+    reps = -(-rows // len(df))
+    idx = np.tile(np.arange(len(df)), reps)[:rows]
+    return df.iloc[idx].reset_index(drop=True)
+
+
+def _timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+def _tile_data(data: dict, orders: int) -> dict:
+    """
+    Scale the sample tables to about `orders` orders: orders and every order-keyed log are
+    repeated with shifted order ids (and log ids), dimension tables are kept as they are.
+    """
+    base = data["orders"]
+    reps = -(-orders // len(base))
+    span = int(base['order_id'].max())
+    tiled = {name: data[name] for name in ("clients", "drivers", "warehouses")}
+    for name in da.PARTITIONED_TABLES:
+        table = data[name]
+        copies = []
+        for r in range(reps):
+            copy = table.copy()
+            copy['order_id'] = copy['order_id'] + r * span
+            copies.append(copy)
+        tiled[name] = pd.concat(copies, ignore_index=True)
+    tiled["orders"] = tiled["orders"].iloc[:orders]
+    return tiled
+
+
+def bench_workers(orders, worker_counts):
+    """Wall time of the join + enrichment step for each worker count."""
+    data = _tile_data(da.load_data(), orders)
+    serial, serial_s = _timed(lambda d: da.enrich_data(da.combine_data(d, verbose=False)), data)
+    results = []
+    for workers in worker_counts:
+        if workers == 1:
+            df, secs = serial, serial_s
+        else:
+            df, secs = _timed(da.combine_partitioned, data, None, workers)
+        results.append({"orders": orders, "workers": workers, "seconds": secs,
+                        "rows_per_s": orders / secs, "speedup": serial_s / secs,
+                        "identical": bool(df.astype(object).equals(serial.astype(object)))})
+    return results
+
+
+def _sort_latest(table: pd.DataFrame, ts_col: str) -> pd.DataFrame:
+    """Sort-based reference for latest_per_order(): same winners, O(n log n)."""
+    ordered = table.dropna(subset=['order_id']).sort_values(
+        ['order_id', ts_col], kind='stable', na_position='first')
+    return ordered.drop_duplicates('order_id', keep='last')
+
+
+def bench_dedup(order_counts):
+    """
+    Latest-record-per-order reduction of each log: the previous sort + groupby().last(),
+    a sort-based whole-record reference and the linear-time latest_per_order().
+    """
+    sample = da.load_data()
+    results = []
+    for orders in order_counts:
+        data = _tile_data(sample, orders)
+        for name, ts_col in da.LATEST_BY.items():
+            table = data[name]
+            _, groupby_s = _timed(
+                lambda t: t.sort_values(ts_col, kind='stable').groupby('order_id').last(), table)
+            reference, sort_s = _timed(_sort_latest, table, ts_col)
+            latest, linear_s = _timed(da.latest_per_order, table, ts_col)
+            identical = latest.sort_values('order_id', kind='stable').reset_index(drop=True)
+            results.append({"orders": orders, "table": name, "rows": len(table),
+                            "sort_groupby_s": groupby_s, "sort_dedup_s": sort_s,
+                            "linear_s": linear_s, "speedup": groupby_s / linear_s,
+                            "identical": bool(identical.equals(
+                                reference[identical.columns].reset_index(drop=True)))})
+        del data
+    return results
+
+
+# Question templates for the local intent matcher, filled with names from the sample data.
+INTENT_TEMPLATES = [
+    "Why were deliveries delayed in {city} last week?",
+    "Why did Client {client}'s orders fail?",
+    "Compare delivery failures between {city} and {other_city}",
+    "What are the top failure reasons for {warehouse}?",
+    "Why did order {order_id} fail?",
+    "What are the main delivery failure patterns?",
+    "What happens during festival periods?",
+]
+
+
+def bench_intent(repeat):
+    """Latency of the local intent fast-path and the share of questions it resolves."""
+    data = da.load_data()
+    entities = da.extract_entities(data)
+    matcher = da.IntentMatcher(entities)
+    rng = np.random.default_rng(0)
+    results = []
+    for template in INTENT_TEMPLATES:
+        timings, local = [], 0
+        for _ in range(repeat):
+            cities = rng.choice(entities["cities"], 2, replace=False)
+            question = template.format(
+                city=cities[0], other_city=cities[1], client=rng.choice(entities["clients"]),
+                warehouse=rng.choice(entities["warehouses"]), order_id=rng.integers(1, 10_000))
+            (_, confidence), secs = _timed(matcher.match, question)
+            timings.append(secs)
+            local += confidence >= da.LOCAL_INTENT_THRESHOLD
+        results.append({"template": template, "questions": repeat, "local_share": local / repeat,
+                        "p50_ms": 1000 * float(np.median(timings)),
+                        "p95_ms": 1000 * float(np.percentile(timings, 95))})
+    return results
+
+
+# Comparison breakdowns the cube can answer too (it has no driver_name).
+_CUBE_BREAKDOWNS = {col: spec for col, spec in da.COMPARISON_BREAKDOWNS.items() if col != 'driver_name'}
+
+
+def _summaries(view):
+    """
+    The summaries the entry points produce: full, one city, a client filter, a two-city
+    comparison and a comparison of every warehouse.
+    """
+    return [da.prepare_data_summary(view),
+            da.prepare_data_summary(view[view['city'] == 'Mumbai']),
+            da.prepare_data_summary(da.apply_cli_filters(view, client="saini")),
+            da.prepare_comparison_summary(view, "city", ['Mumbai', 'New Delhi'], _CUBE_BREAKDOWNS),
+            da.prepare_comparison_summary(view, "warehouse", None, _CUBE_BREAKDOWNS)]
+
+
+def _generated_frames(order_counts, data_dir=None, seed=0):
+    """
+    Yield (orders, rich_df) for synthetic datasets from generate_data.py, generated under
+    `data_dir` and reused by later runs (in a temporary directory when not given).
+    """
+    with tempfile.TemporaryDirectory() as scratch:
+        for orders in order_counts:
+            path = _generated(orders, data_dir or scratch, seed)
+            sample_dir, da.DATA_DIR = da.DATA_DIR, path
+            try:
+                rich_df = da.enrich_data(da.combine_data(da.load_data(), verbose=False))
+            finally:
+                da.DATA_DIR = sample_dir
+            yield orders, rich_df
+
+
+def bench_cube(order_counts, data_dir=None, seed=0):
+    """
+    Summary latency from full-frame scans vs from the pre-aggregated FailureCube, on
+    generated datasets, with the cube's size: cells (the day × low-cardinality key) and
+    members (cells split by client and warehouse) per order.
+    """
+    results = []
+    for orders, df in _generated_frames(order_counts, data_dir, seed):
+        cube, build_s = _timed(da.FailureCube.from_frame, df)
+        frame_text, frame_s = _timed(_summaries, df)
+        cube_text, cube_s = _timed(_summaries, cube)
+        results.append({"orders": orders, "cells": len(cube.cells), "members": len(cube.members),
+                        "cells_per_order": len(cube.cells) / orders,
+                        "members_per_order": len(cube.members) / orders, "build_s": build_s,
+                        "frame_summaries_s": frame_s, "cube_summaries_s": cube_s,
+                        "speedup": frame_s / cube_s, "identical": frame_text == cube_text})
+        del df, cube
+    return results
+
+
+def bench_compare(order_counts, data_dir=None, seed=0):
+    """Comparing every group of each dimension in one grouped pass vs one filter per group."""
+    results = []
+    for orders, df in _generated_frames(order_counts, data_dir, seed):
+        cube = da.FailureCube.from_frame(df)
+        for view_name, view in (("frame", df), ("cube", cube)):
+            def per_group(column, names):
+                if view is cube:
+                    return [da.summary_stats(cube.equal(column, name)) for name in names]
+                return [da.summary_stats(df[df[column] == name]) for name in names]
+
+            for dimension, (column, _) in da.COMPARE_DIMENSIONS.items():
+                comparison, grouped_s = _timed(da.compare_groups, view, column)
+                names = comparison.groups.index.tolist()
+                _, filtered_s = _timed(per_group, column, names)
+                results.append({"orders": orders, "view": view_name, "dimension": dimension,
+                                "groups": len(names), "grouped_s": grouped_s,
+                                "per_group_s": filtered_s, "speedup": filtered_s / grouped_s})
+        del df, cube
+    return results
+
+
+def _peak_rss_mb() -> float:
+    """High-water resident set size of this process so far (0 where unavailable)."""
+    return da._peak_rss_bytes() / 2**20
+
+
+def _pipeline_stages(orders: int, results: list):
+    """
+    Run every pipeline stage once on the dataset in da.DATA_DIR, appending one timing
+    and memory row per stage to `results`. LLM calls go to the offline client.
+    """
+    def stage(name, fn, *args):
+        result, secs = _timed(fn, *args)
+        results.append({"orders": orders, "stage": name, "seconds": secs,
+                        "orders_per_s": orders / secs if secs else None,
+                        "rss_mb": da._current_rss_bytes() / 2**20, "peak_rss_mb": _peak_rss_mb()})
+        return result
+
+    data     = stage("load_data", da.load_data)
+    df       = stage("combine_data", lambda d: da.combine_data(d, verbose=False), data)
+    rich_df  = stage("enrich_data", da.enrich_data, df)
+    del df
+    stage("prepare_data_summary", da.prepare_data_summary, rich_df)
+    cube     = stage("failure_cube", da.FailureCube.from_frame, rich_df)
+    stage("prepare_data_summary[cube]", da.prepare_data_summary, cube)
+    entities = da.extract_entities(data)
+    city, other = rich_df['city'].value_counts().index[:2]
+    order_id = int(rich_df['order_id'].iloc[len(rich_df) // 2])
+    stage("analyze_order", da.analyze_order, rich_df, order_id, da.ORDER_QUESTION.format(order_id))
+    stage("analyze_filtered", lambda: da.analyze_filtered(
+        da.apply_cli_filters(cube, city=city), f"Why are deliveries failing in {city}?",
+        f"Filtered view (City={city})"))
+    stage("analyze_comparison", da.analyze_comparison, cube, "city", [city, other],
+          f"Compare delivery failures between {city} and {other}")
+    stage("analyze_comparison[warehouses]", da.analyze_comparison, cube, "warehouse", None,
+          "Compare delivery failures across all warehouses")
+    stage("answer_question", da.answer_question, rich_df, entities,
+          f"Why were deliveries delayed in {city} last month?", cube)
+
+
+def _generated(orders: int, data_dir: str, seed: int) -> str:
+    """Directory of the generated dataset of `orders` orders under `data_dir`, generating it if missing."""
+    path = os.path.join(data_dir, f"orders-{orders}-seed-{seed}")
+    if not os.path.exists(os.path.join(path, da.SOURCE_FILES["feedback"])):
+        _, secs = _timed(lambda: generate_data.generate(path, orders, seed=seed))
+        print(f"Generated {orders:,} orders in {secs:.1f}s → {path}")
+    return path
+
+
+def bench_stages(order_counts, data_dir=None, seed=0):
+    """
+    Wall time and memory of each pipeline stage on synthetic datasets from
+    generate_data.py. Datasets are generated under `data_dir` and reused by later runs
+    (in a temporary directory, removed afterwards, when not given).
+    """
+    da._llm_client = da.OfflineLLMClient()
+    da.set_llm_cache_enabled(False)
+    results = []
+    with tempfile.TemporaryDirectory() as scratch:
+        for orders in order_counts:
+            path = _generated(orders, data_dir or scratch, seed)
+            sample_dir, da.DATA_DIR = da.DATA_DIR, path
+            try:
+                _pipeline_stages(orders, results)
+            finally:
+                da.DATA_DIR = sample_dir
+    return results
+
+
+def compare_baseline(results, baseline_path, tolerance):
+    """
+    Annotate stage results with the matching baseline timing (same orders and stage in a
+    previous --json file) and whether the stage is more than `tolerance` times slower.
+    """
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = {(r["orders"], r["stage"]): r["seconds"] for r in json.load(f)["results"]}
+    for row in results:
+        before = baseline.get((row["orders"], row["stage"]))
+        row["baseline_s"] = before
+        row["regressed"]  = before is not None and row["seconds"] > tolerance * before
+    return results
+
+
+def bench_reasons(sizes, rowwise_max):
+    """Rows/sec of the row-wise generate_reason apply vs the vectorized build_reasons."""
+    base = _sample_frame()[REASON_COLUMNS]
+    results = []
+    for rows in sizes:
+        df = _tile(base, rows)
+        vectorized, vec_s = _timed(da.build_reasons, df)
+        row = {"rows": rows, "vectorized_s": vec_s, "vectorized_rows_per_s": rows / vec_s,
+               "rowwise_s": None, "rowwise_rows_per_s": None, "speedup": None, "identical": None}
+        if rows <= rowwise_max:
+            rowwise, row_s = _timed(lambda d: d.apply(da.generate_reason, axis=1), df)
+            row.update(rowwise_s=row_s, rowwise_rows_per_s=rows / row_s, speedup=row_s / vec_s,
+                       identical=bool(rowwise.astype(object).equals(vectorized.astype(object))))
+        results.append(row)
+        del df
+    return results
+
+
+def _print_table(results):
+    print(tabulate(results, headers="keys", floatfmt=",.3f"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Delivery analytics pipeline benchmarks")
+    parser.add_argument("--json", type=str, help="Also write the results to this JSON file")
+    sub = parser.add_subparsers(dest="bench", required=True)
+
+    reasons = sub.add_parser("reasons", help="Row-wise vs vectorized root-cause generation")
+    reasons.add_argument("--sizes", type=int, nargs="+", default=[15_000, 1_000_000, 10_000_000])
+    reasons.add_argument("--rowwise_max", type=int, default=10_000_000,
+                         help="Skip the (slow) row-wise apply above this many rows")
+
+    workers = sub.add_parser("workers", help="Scaling of the partitioned join + enrichment")
+    workers.add_argument("--orders", type=int, default=1_000_000)
+    workers.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+
+    dedup = sub.add_parser("dedup", help="Latest-record-per-order reduction of the logs")
+    dedup.add_argument("--orders", type=int, nargs="+", default=[1_000_000, 10_000_000])
+
+    intent = sub.add_parser("intent", help="Local intent matching latency and coverage")
+    intent.add_argument("--repeat", type=int, default=200, help="Questions generated per template")
+
+    cube = sub.add_parser("cube", help="Summaries from full-frame scans vs the failure cube")
+    compare = sub.add_parser("compare", help="N-way group comparison: one grouped pass vs per-group filters")
+    for generated in (cube, compare):
+        generated.add_argument("--orders", type=int, nargs="+", default=[10_000, 1_000_000])
+        generated.add_argument("--data_dir", type=str, help="Keep generated datasets here and reuse them")
+        generated.add_argument("--seed", type=int, default=0)
+
+    stages = sub.add_parser("stages", help="Time and memory of every pipeline stage on synthetic data")
+    stages.add_argument("--orders", type=int, nargs="+", default=[10_000, 1_000_000])
+    stages.add_argument("--data_dir", type=str, help="Keep generated datasets here and reuse them")
+    stages.add_argument("--seed", type=int, default=0)
+    stages.add_argument("--baseline", type=str, help="Earlier --json results to compare against")
+    stages.add_argument("--tolerance", type=float, default=1.5,
+                        help="Flag stages slower than this multiple of the baseline (default: 1.5)")
+    args = parser.parse_args()
+
+    if args.bench == "reasons":
+        results = bench_reasons(args.sizes, args.rowwise_max)
+    elif args.bench == "workers":
+        results = bench_workers(args.orders, args.workers)
+    elif args.bench == "dedup":
+        results = bench_dedup(args.orders)
+    elif args.bench == "intent":
+        results = bench_intent(args.repeat)
+    elif args.bench == "cube":
+        results = bench_cube(args.orders, args.data_dir, args.seed)
+    elif args.bench == "compare":
+        results = bench_compare(args.orders, args.data_dir, args.seed)
+    elif args.bench == "stages":
+        results = bench_stages(args.orders, args.data_dir, args.seed)
+        if args.baseline:
+            results = compare_baseline(results, args.baseline, args.tolerance)
+
+    _print_table(results)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"benchmark": args.bench, "results": results}, f, indent=1)
+    if any(row.get("regressed") for row in results):
+        print(f"Regressions against {args.baseline}: "
+              + ", ".join(f"{r['stage']} ({r['orders']:,})" for r in results if r["regressed"]))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,25 +1,152 @@
+import numpy as np
 import pandas as pd
 import argparse
+import asyncio
+import collections
+import concurrent.futures
+import contextlib
+import cProfile
+import difflib
+import functools
+import hashlib
+import io
+import math
 import os
 import json
+import random
+import re
+import shlex
+import sqlite3
+import sys
+import threading
+import time
 from google import genai
 from google.genai import types
 
 # ---------------------------------------------------------------------------
 # Configuration
 # ---------------------------------------------------------------------------
-DATA_DIR = r"c:/Talentica/AI Assignments/3rd_assignment_ag/third-assignment-sample-data-set"
+DATA_DIR = os.environ.get(
+    "DELIVERY_DATA_DIR",
+    r"c:/Talentica/AI Assignments/3rd_assignment_ag/third-assignment-sample-data-set")
 OUTPUT_REPORT = "analysis_report.md"
 
+# Columnar cache of the enriched order table; override with DELIVERY_CACHE_DIR.
+# Bump CACHE_VERSION whenever combine_data()/enrich_data() change their output.
+CACHE_DIR = os.environ.get("DELIVERY_CACHE_DIR", os.path.join(DATA_DIR, ".cache"))
+CACHE_VERSION = 12
+# The cached table is stored in parts of this many rows, so a refresh rewrites only the
+# parts holding rows that changed.
+CACHE_PART_ROWS = 250_000
+
+# Column dtypes applied while parsing. Low-cardinality strings (including the free-text
+# note columns, which come from a small vocabulary) are read as categoricals so each
+# distinct value is stored once; ids use nullable ints so left merges keep them integral.
+SCHEMA = {
+    "orders": {
+        'order_id': 'Int32', 'client_id': 'Int32', 'pincode': 'Int32',
+        'city': 'category', 'state': 'category', 'status': 'category',
+        'payment_mode': 'category', 'failure_reason': 'category',
+    },
+    "clients": {
+        'client_id': 'Int32', 'pincode': 'Int32', 'client_name': 'category',
+        'city': 'category', 'state': 'category',
+    },
+    "drivers": {
+        'driver_id': 'Int32', 'partner_company': 'category', 'city': 'category',
+        'state': 'category', 'status': 'category',
+    },
+    "warehouses": {
+        'warehouse_id': 'Int32', 'pincode': 'Int32', 'capacity': 'Int32',
+        'warehouse_name': 'category', 'state': 'category', 'city': 'category',
+    },
+    "fleet_logs": {
+        'fleet_log_id': 'Int32', 'order_id': 'Int32', 'driver_id': 'Int32',
+        'route_code': 'category', 'gps_delay_notes': 'category',
+    },
+    "warehouse_logs": {
+        'log_id': 'Int32', 'order_id': 'Int32', 'warehouse_id': 'Int32', 'notes': 'category',
+    },
+    "weather": {
+        'factor_id': 'Int32', 'order_id': 'Int32', 'traffic_condition': 'category',
+        'weather_condition': 'category', 'event_type': 'category',
+    },
+    "feedback": {
+        'feedback_id': 'Int32', 'order_id': 'Int32', 'feedback_text': 'category',
+        'sentiment': 'category', 'rating': 'Int8',
+    },
+}
+
+SOURCE_FILES = {
+    "orders":         "orders.csv",
+    "clients":        "clients.csv",
+    "drivers":        "drivers.csv",
+    "warehouses":     "warehouses.csv",
+    "fleet_logs":     "fleet_logs.csv",
+    "warehouse_logs": "warehouse_logs.csv",
+    "weather":        "weather.csv",
+    "feedback":       "feedback.csv",
+}
+
 # Default model; override with GEMINI_MODEL env var if needed
 # Options: gemini-2.5-flash, gemini-2.0-flash, gemini-2.5-flash-lite
 GEMINI_MODEL = os.environ.get("GEMINI_MODEL", "gemini-2.5-flash")
 
+# Set DELIVERY_FAKE_LLM to a simulated latency in seconds (e.g. 0 or 0.5) to answer every
+# Gemini call offline — for benchmarks and dry runs without an API key.
+# DELIVERY_FAKE_LLM_RATE_LIMIT makes that share of offline calls fail like a 429.
+FAKE_LLM_LATENCY = os.environ.get("DELIVERY_FAKE_LLM")
+FAKE_LLM_RATE_LIMIT = float(os.environ.get("DELIVERY_FAKE_LLM_RATE_LIMIT", 0))
+
+
+class OfflineLLMClient:
+    """
+    Stand-in for genai.Client: JSON requests (intent parsing) get the show_insights intent
+    and everything else a placeholder narrative, after `latency` seconds. A `rate_limited`
+    share of calls (drawn from a seeded generator) raises RateLimited instead.
+    """
+
+    class Response:
+        def __init__(self, text: str):
+            self.text = text
+
+    class RateLimited(Exception):
+        """Shaped like Gemini's 429 RESOURCE_EXHAUSTED error, including a retryDelay hint."""
+        code = 429
+
+    def __init__(self, latency: float = 0.0, rate_limited: float = 0.0, seed: int = 0):
+        self.latency      = latency
+        self.rate_limited = rate_limited
+        self.models       = self
+        self.calls        = collections.Counter()
+        self._random      = random.Random(seed)
+        self._lock        = threading.Lock()
+
+    def generate_content(self, model, contents, config=None):
+        time.sleep(self.latency)
+        with self._lock:
+            limited = self._random.random() < self.rate_limited
+            self.calls["rate_limited" if limited else "answered"] += 1
+        if limited:
+            raise self.RateLimited('429 RESOURCE_EXHAUSTED. {"error": {"code": 429, '
+                                   '"details": [{"retryDelay": "0.05s"}]}}')
+        if config is not None and config.response_mime_type == "application/json":
+            return self.Response(json.dumps({
+                "action": "show_insights", "order_id": None, "cities": None, "time_range": None,
+                "filters": {"city": None, "client": None, "warehouse": None}}))
+        return self.Response(f"[offline] Narrative for a {len(contents)}-character prompt.")
+
+
 _llm_client = None
 
 def get_llm_client():
-    """Return a configured Gemini client, reading GEMINI_API_KEY from the environment."""
+    """
+    Return a configured Gemini client, reading GEMINI_API_KEY from the environment
+    (an OfflineLLMClient when DELIVERY_FAKE_LLM is set).
+    """
     global _llm_client
+    if _llm_client is None and FAKE_LLM_LATENCY is not None:
+        _llm_client = OfflineLLMClient(float(FAKE_LLM_LATENCY or 0), FAKE_LLM_RATE_LIMIT)
     if _llm_client is None:
         api_key = os.environ.get("GEMINI_API_KEY")
         if not api_key:
@@ -33,87 +160,466 @@ def get_llm_client():
     return _llm_client
 
 
+# ---------------------------------------------------------------------------
+# Profiling (--profile)
+# ---------------------------------------------------------------------------
+
+try:
+    import resource
+except ImportError:     # Windows: no peak-RSS figures
+    resource = None
+
+
+def _peak_rss_bytes() -> int:
+    """High-water resident set size of this process so far, or 0 when unavailable."""
+    if resource is None:
+        return 0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024   # macOS: bytes; Linux: KiB
+
+
+class _NullSpan:
+    """What span() returns while profiling is off: a context manager that does nothing."""
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set(self, **attrs):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Span:
+    """
+    One timed region of a profiled run: wall time, process CPU time, growth of the peak
+    RSS, and attributes such as rows_in/rows_out or prompt/response sizes (set()).
+    """
+    __slots__ = ("profiler", "name", "attrs", "depth", "thread", "start", "wall", "cpu",
+                 "peak_growth", "_cpu", "_peak")
+
+    def __init__(self, profiler, name: str, attrs: dict):
+        self.profiler = profiler
+        self.name     = name
+        self.attrs    = attrs
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def __enter__(self):
+        stack = self.profiler._stack()
+        self.depth, self.thread = len(stack), threading.get_ident()
+        stack.append(self)
+        self._peak  = _peak_rss_bytes()
+        self._cpu   = time.process_time()
+        self.start  = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.wall = time.perf_counter() - self.start
+        self.cpu  = time.process_time() - self._cpu
+        self.peak_growth = _peak_rss_bytes() - self._peak
+        self.profiler._stack().pop()
+        self.profiler.spans.append(self)
+        return False
+
+
+class Profiler:
+    """
+    Collects the spans of a run. summary() aggregates them per stage; chrome_trace()
+    lays them out on a timeline for chrome://tracing or Perfetto.
+    """
+
+    def __init__(self):
+        self.spans  = []
+        self.origin = time.perf_counter()
+        self._local = threading.local()
+
+    def _stack(self) -> list:
+        if not hasattr(self._local, "stack"):
+            self._local.stack = []
+        return self._local.stack
+
+    def summary(self) -> str:
+        """Per-stage totals in order of first completion, nested stages indented."""
+        stages = {}
+        for sp in sorted(self.spans, key=lambda sp: sp.start):
+            row = stages.setdefault(sp.name, {"depth": sp.depth, "calls": 0, "wall": 0.0,
+                                              "cpu": 0.0, "peak": 0, "attrs": {}})
+            row["calls"] += 1
+            row["wall"]  += sp.wall
+            row["cpu"]   += sp.cpu
+            row["peak"]   = max(row["peak"], sp.peak_growth)
+            for key, value in sp.attrs.items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    row["attrs"][key] = row["attrs"].get(key, 0) + value
+                else:
+                    row["attrs"].setdefault(key, value)
+        lines = [f"{'Stage':<40} {'Calls':>5} {'Wall s':>9} {'CPU s':>9} {'+Peak MiB':>9} "
+                 f"{'Rows in':>11} {'Rows out':>11}  Details"]
+        for name, row in stages.items():
+            attrs = dict(row["attrs"])
+            rows_in, rows_out = (f"{attrs.pop(k):,}" if k in attrs else "" for k in ("rows_in", "rows_out"))
+            details = " ".join(f"{k}={v:,}" if isinstance(v, int) and not isinstance(v, bool)
+                               else f"{k}={v}" for k, v in attrs.items())
+            label = ("  " * row["depth"] + name)[:40]
+            lines.append(f"{label:<40} {row['calls']:>5} {row['wall']:>9.3f} {row['cpu']:>9.3f} "
+                         f"{row['peak'] / 2**20:>9.1f} {rows_in:>11} {rows_out:>11}  {details}")
+        return "\n".join(lines)
+
+    def chrome_trace(self) -> dict:
+        """The spans as complete ("X") events of the Chrome trace event format."""
+        events = [{"name": sp.name, "ph": "X", "pid": os.getpid(), "tid": sp.thread,
+                   "ts": round((sp.start - self.origin) * 1e6, 1), "dur": round(sp.wall * 1e6, 1),
+                   "args": {"cpu_ms": round(sp.cpu * 1e3, 3),
+                            "peak_growth_mib": round(sp.peak_growth / 2**20, 2), **sp.attrs}}
+                  for sp in self.spans]
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+
+_profiler = None
+
+
+def span(name: str, **attrs):
+    """
+    Context manager recording `name` as a stage of the run while profiling is on; a
+    shared no-op otherwise, so instrumented hot paths cost one global lookup.
+    """
+    if _profiler is None:
+        return _NULL_SPAN
+    return Span(_profiler, name, attrs)
+
+
+def traced(name: str):
+    """Decorator: run the function inside span(name)."""
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+@contextlib.contextmanager
+def profiling(summary: bool = False, trace_path: str = None, cprofile_path: str = None):
+    """
+    Profile the enclosed block: print the per-stage summary, write a Chrome trace to
+    `trace_path` and/or a cProfile dump of the calling thread to `cprofile_path`.
+    Does nothing when no output is requested.
+    """
+    global _profiler
+    if not (summary or trace_path or cprofile_path):
+        yield None
+        return
+    _profiler = profiler = Profiler()
+    tracer = cProfile.Profile() if cprofile_path else None
+    if tracer:
+        tracer.enable()
+    try:
+        with span("run"):
+            yield profiler
+    finally:
+        if tracer:
+            tracer.disable()
+            tracer.dump_stats(cprofile_path)
+        _profiler = None
+        if summary:
+            print("\n" + profiler.summary())
+        if trace_path:
+            with open(trace_path, "w", encoding="utf-8") as f:
+                json.dump(profiler.chrome_trace(), f, default=str)
+        for path, what in ((trace_path, "Chrome trace"), (cprofile_path, "cProfile dump")):
+            if path:
+                print(f"{what} written to {path}")
+
+
 # ---------------------------------------------------------------------------
 # Data Loading & Merging
 # ---------------------------------------------------------------------------
 
-def load_data():
-    """Load all CSV datasets from the data directory."""
+# Unified-table columns contributed by each side table: {table: {unified: source}}.
+# Every side table is joined on the single key in JOIN_KEYS; tables listed in
+# LATEST_BY are reduced to their latest record per order before the merge.
+JOINED_COLUMNS = {
+    "clients":        {'client_name': 'client_name', 'client_city': 'city', 'client_state': 'state'},
+    "fleet_logs":     {'driver_id': 'driver_id', 'gps_delay_notes': 'gps_delay_notes',
+                       'route_code': 'route_code'},
+    "drivers":        {'driver_name': 'driver_name', 'partner_company': 'partner_company',
+                       'driver_city': 'city'},
+    "warehouse_logs": {'warehouse_id': 'warehouse_id', 'warehouse_notes': 'notes'},
+    "warehouses":     {'warehouse_name': 'warehouse_name', 'warehouse_city': 'city'},
+    "weather":        {'weather_condition': 'weather_condition',
+                       'traffic_condition': 'traffic_condition', 'event_type': 'event_type'},
+    "feedback":       {'feedback_text': 'feedback_text', 'rating': 'rating',
+                       'sentiment': 'sentiment'},
+}
+JOIN_KEYS = {
+    "clients": 'client_id', "fleet_logs": 'order_id', "drivers": 'driver_id',
+    "warehouse_logs": 'order_id', "warehouses": 'warehouse_id',
+    "weather": 'order_id', "feedback": 'order_id',
+}
+# Timestamp that orders each log's records; see latest_per_order() for the tie-break.
+LATEST_BY = {"fleet_logs": 'created_at', "warehouse_logs": 'picking_end',
+             "weather": 'recorded_at', "feedback": 'created_at'}
+
+ORDER_DATE_COLUMNS = ['order_date', 'promised_delivery_date', 'actual_delivery_date']
+
+
+def _merged_columns(columns=None) -> dict:
+    """
+    Unified columns to merge from each side table for a projection. enrich_data() inputs
+    are always included, and a dimension table pulls in the key it is joined through.
+    """
+    if columns is not None:
+        columns = set(columns) | set(ENRICH_COLUMNS)
+        if any(c in columns for c in JOINED_COLUMNS["drivers"]):
+            columns.add('driver_id')
+        if any(c in columns for c in JOINED_COLUMNS["warehouses"]):
+            columns.add('warehouse_id')
+    return {table: [c for c in mapping if columns is None or c in columns]
+            for table, mapping in JOINED_COLUMNS.items()}
+
+
+def plan_sources(columns=None, entities: bool = False):
+    """
+    Return {table: source columns} needed to build the unified columns in `columns`
+    (plus extract_entities() inputs when `entities` is set), or None for everything.
+    Tables absent from the plan are not read up-front.
+    """
+    if columns is None:
+        return None
+    merged = _merged_columns(columns)
+    plan = {"orders": {'order_id'} | set(columns) | set(ENRICH_COLUMNS)}
+    if merged["clients"]:
+        plan["orders"].add('client_id')
+    for table, unified in merged.items():
+        if unified:
+            plan[table] = ({JOIN_KEYS[table]} | {JOINED_COLUMNS[table][c] for c in unified})
+            if table in LATEST_BY:
+                plan[table].add(LATEST_BY[table])
+    if entities:
+        plan["orders"].add('city')
+        plan.setdefault("clients", set()).add('client_name')
+        plan.setdefault("warehouses", set()).add('warehouse_name')
+        plan.setdefault("drivers", set()).update({'driver_id', 'partner_company'})
+    return {table: sorted(cols) for table, cols in plan.items()}
+
+
+def read_table(name: str, columns=None, source=None) -> pd.DataFrame:
+    """
+    Read one source CSV with SCHEMA dtypes, optionally projected to `columns`.
+    `source` overrides the file (e.g. a buffer of records fetched through the index).
+    """
+    usecols = None if columns is None else (lambda c: c in columns)
+    if source is None:
+        source = os.path.join(DATA_DIR, SOURCE_FILES[name])
+    with span(f"read_csv:{name}") as sp:
+        df = _parse_dates(name, pd.read_csv(source, usecols=usecols, dtype=SCHEMA[name]))
+        sp.set(rows_out=len(df))
+    return df
+
+
+def iter_table_chunks(name: str, columns=None, chunk_rows: int = 250_000):
+    """Yield one source CSV as consecutive DataFrames of at most `chunk_rows` rows."""
+    usecols = None if columns is None else (lambda c: c in columns)
+    with pd.read_csv(os.path.join(DATA_DIR, SOURCE_FILES[name]), usecols=usecols,
+                     dtype=SCHEMA[name], chunksize=chunk_rows) as reader:
+        for chunk in reader:
+            yield _parse_dates(name, chunk)
+
+
+def _parse_dates(name: str, df: pd.DataFrame) -> pd.DataFrame:
+    columns = ORDER_DATE_COLUMNS if name == "orders" else [LATEST_BY.get(name)]
+    for col in columns:
+        if col in df.columns:
+            df[col] = pd.to_datetime(df[col], errors='coerce')
+    return df
+
+
+class LazyTables(dict):
+    """Table name → DataFrame mapping that reads a table on first access, projected to `plan`."""
+
+    def __init__(self, plan=None):
+        super().__init__()
+        self.plan = plan or {}
+
+    def __missing__(self, name):
+        table = read_table(name, self.plan.get(name))
+        self[name] = table
+        return table
+
+
+def load_data(plan=None):
+    """
+    Load the CSV datasets from the data directory, applying SCHEMA dtypes.
+    With a `plan` from plan_sources() only the planned tables and columns are read now;
+    any other table is read in full the first time it is accessed.
+    """
     print("Loading datasets...")
     try:
-        orders        = pd.read_csv(os.path.join(DATA_DIR, "orders.csv"))
-        clients       = pd.read_csv(os.path.join(DATA_DIR, "clients.csv"))
-        drivers       = pd.read_csv(os.path.join(DATA_DIR, "drivers.csv"))
-        warehouses    = pd.read_csv(os.path.join(DATA_DIR, "warehouses.csv"))
-        fleet_logs    = pd.read_csv(os.path.join(DATA_DIR, "fleet_logs.csv"))
-        warehouse_logs = pd.read_csv(os.path.join(DATA_DIR, "warehouse_logs.csv"))
-        weather       = pd.read_csv(os.path.join(DATA_DIR, "weather.csv"))
-        feedback      = pd.read_csv(os.path.join(DATA_DIR, "feedback.csv"))
-
-        for col in ['order_date', 'promised_delivery_date', 'actual_delivery_date']:
-            if col in orders.columns:
-                orders[col] = pd.to_datetime(orders[col], errors='coerce')
-
-        return {
-            "orders": orders, "clients": clients, "drivers": drivers,
-            "warehouses": warehouses, "fleet_logs": fleet_logs,
-            "warehouse_logs": warehouse_logs, "weather": weather,
-            "feedback": feedback,
-        }
+        data = LazyTables(plan)
+        with span("load_data"):
+            for name in (SOURCE_FILES if plan is None else plan):
+                data[name]
+        return data
     except Exception as e:
         print(f"Error loading data: {e}")
         return None
 
 
-def combine_data(data):
-    """Merge all datasets into one unified order-centric DataFrame."""
-    print("Combining data...")
+def _sources(name: str, unified: list) -> list:
+    """Source columns of side table `name` behind the unified columns `unified`."""
+    return [JOINED_COLUMNS[name][c] for c in unified]
+
+
+def _project(table: pd.DataFrame, name: str, unified: list) -> pd.DataFrame:
+    """Select a side table's join key and the source columns behind `unified`, renamed."""
+    mapping = {JOINED_COLUMNS[name][c]: c for c in unified}
+    return table[[JOIN_KEYS[name]] + list(mapping)].rename(columns=mapping)
+
+
+def latest_per_order(table: pd.DataFrame, ts_col: str, columns=None) -> pd.DataFrame:
+    """
+    Reduce an order-keyed log to its latest record per order, carrying only order_id,
+    `ts_col` and `columns` (every column when None).
+
+    The latest record is the one with the greatest `ts_col`. Among records with the same
+    timestamp the one further down the log wins, and records with a missing timestamp
+    rank below every dated one. Runs in linear time — a hashed per-order max followed by
+    a de-duplication — instead of sorting the log.
+    """
+    rest = table.columns if columns is None else columns
+    keep = ['order_id', ts_col] + [c for c in dict.fromkeys(rest) if c not in ('order_id', ts_col)]
+    with span("latest_per_order", rows_in=len(table)) as sp:
+        table = table.loc[table['order_id'].notna(), keep]
+        # NaT views as the smallest int64, so undated records lose to any dated one.
+        ts = pd.to_datetime(table[ts_col], errors='coerce').to_numpy().view(np.int64)
+        newest = pd.Series(ts).groupby(table['order_id'].to_numpy(dtype=np.int64)).transform('max')
+        latest = (table[ts == newest.to_numpy()]
+                  .drop_duplicates('order_id', keep='last')
+                  .reset_index(drop=True))
+        sp.set(rows_out=len(latest))
+    return latest
+
+
+def _concat_frames(frames: list) -> pd.DataFrame:
+    """Concatenate frames with the same columns, keeping categorical columns categorical."""
+    frames = [f for f in frames if len(f)] or frames[:1]
+    for col in frames[0].columns:
+        if isinstance(frames[0][col].dtype, pd.CategoricalDtype):
+            # An all-missing chunk has untyped (empty) categories that cannot be unioned.
+            parts = [f[col] for f in frames if len(f[col].cat.categories)] or [frames[0][col]]
+            categories = pd.api.types.union_categoricals(parts, ignore_order=True).categories
+            for f in frames:
+                f[col] = f[col].cat.set_categories(categories)
+    return pd.concat(frames, ignore_index=True)
+
+
+class LatestRecordReducer:
+    """
+    Incremental latest_per_order(): feeding a log through update() in consecutive chunks
+    and calling result() gives the same frame as reducing the whole log at once, while
+    holding no more than one record per order plus the current chunk.
+    """
+
+    def __init__(self, ts_col: str, columns=None):
+        self.ts_col  = ts_col
+        self.columns = columns
+        self.latest  = None
+
+    def update(self, chunk: pd.DataFrame):
+        reduced = latest_per_order(chunk, self.ts_col, self.columns)
+        if self.latest is not None:
+            # Earlier records first, so the later chunk wins timestamp ties as in the log.
+            reduced = latest_per_order(_concat_frames([self.latest, reduced]), self.ts_col)
+        self.latest = reduced
+
+    def result(self) -> pd.DataFrame:
+        if self.latest is None:
+            return pd.DataFrame(columns=['order_id', self.ts_col] + list(self.columns or []))
+        return self.latest
+
+
+def combine_data(data, columns=None, verbose: bool = True):
+    """
+    Merge all datasets into one unified order-centric DataFrame.
+    `columns` restricts the merges to the side tables (and columns) needed for those
+    unified columns; None merges everything.
+    """
+    if verbose:
+        print("Combining data...")
+    merged = _merged_columns(columns)
     df = data["orders"].copy()
+    with span("combine_data", rows_in=len(df)) as combined:
+        df = _merge_side_tables(df, data, merged)
+        combined.set(rows_out=len(df))
+    return df
 
+
+def _merge_side_tables(df: pd.DataFrame, data, merged: dict) -> pd.DataFrame:
+    """Left-join the side-table columns in `merged` (see _merged_columns()) onto orders."""
     # Clients
-    clients = data["clients"][['client_id', 'client_name', 'city', 'state']].rename(
-        columns={'city': 'client_city', 'state': 'client_state'})
-    df = df.merge(clients, on='client_id', how='left')
+    if merged["clients"]:
+        with span("merge:clients", rows_in=len(df)) as sp:
+            df = df.merge(_project(data["clients"], "clients", merged["clients"]),
+                          on='client_id', how='left')
+            sp.set(rows_out=len(df))
 
     # Fleet logs – keep latest log per order
-    fleet_agg = (data["fleet_logs"]
-                 .sort_values('created_at')
-                 .groupby('order_id').last()
-                 .reset_index())
-    df = df.merge(
-        fleet_agg[['order_id', 'driver_id', 'gps_delay_notes', 'route_code']],
-        on='order_id', how='left')
+    if merged["fleet_logs"]:
+        with span("merge:fleet_logs", rows_in=len(df)) as sp:
+            fleet_agg = latest_per_order(data["fleet_logs"], LATEST_BY["fleet_logs"],
+                                         _sources("fleet_logs", merged["fleet_logs"]))
+            df = df.merge(_project(fleet_agg, "fleet_logs", merged["fleet_logs"]),
+                          on='order_id', how='left')
+            sp.set(rows_out=len(df))
 
     # Drivers
-    drivers = data["drivers"][['driver_id', 'driver_name', 'partner_company', 'city']].rename(
-        columns={'city': 'driver_city'})
-    df = df.merge(drivers, on='driver_id', how='left')
+    if merged["drivers"]:
+        with span("merge:drivers", rows_in=len(df)) as sp:
+            df = df.merge(_project(data["drivers"], "drivers", merged["drivers"]),
+                          on='driver_id', how='left')
+            sp.set(rows_out=len(df))
 
     # Warehouse logs – keep latest log per order
-    wh_agg = (data["warehouse_logs"]
-              .sort_values('picking_end')
-              .groupby('order_id').last()
-              .reset_index())
-    df = df.merge(
-        wh_agg[['order_id', 'warehouse_id', 'notes']].rename(columns={'notes': 'warehouse_notes'}),
-        on='order_id', how='left')
+    if merged["warehouse_logs"]:
+        with span("merge:warehouse_logs", rows_in=len(df)) as sp:
+            wh_agg = latest_per_order(data["warehouse_logs"], LATEST_BY["warehouse_logs"],
+                                      _sources("warehouse_logs", merged["warehouse_logs"]))
+            df = df.merge(_project(wh_agg, "warehouse_logs", merged["warehouse_logs"]),
+                          on='order_id', how='left')
+            sp.set(rows_out=len(df))
 
     # Warehouses
-    warehouses = data["warehouses"][['warehouse_id', 'warehouse_name', 'city']].rename(
-        columns={'city': 'warehouse_city'})
-    df = df.merge(warehouses, on='warehouse_id', how='left')
+    if merged["warehouses"]:
+        with span("merge:warehouses", rows_in=len(df)) as sp:
+            df = df.merge(_project(data["warehouses"], "warehouses", merged["warehouses"]),
+                          on='warehouse_id', how='left')
+            sp.set(rows_out=len(df))
 
     # Weather / external factors – keep latest per order
-    weather_agg = data["weather"].groupby('order_id').last().reset_index()
-    df = df.merge(
-        weather_agg[['order_id', 'weather_condition', 'traffic_condition', 'event_type']],
-        on='order_id', how='left')
+    if merged["weather"]:
+        with span("merge:weather", rows_in=len(df)) as sp:
+            weather_agg = latest_per_order(data["weather"], LATEST_BY["weather"],
+                                           _sources("weather", merged["weather"]))
+            df = df.merge(_project(weather_agg, "weather", merged["weather"]),
+                          on='order_id', how='left')
+            sp.set(rows_out=len(df))
 
     # Customer feedback – keep latest per order
-    fb_agg = data["feedback"].groupby('order_id').last().reset_index()
-    df = df.merge(
-        fb_agg[['order_id', 'feedback_text', 'rating', 'sentiment']],
-        on='order_id', how='left')
+    if merged["feedback"]:
+        with span("merge:feedback", rows_in=len(df)) as sp:
+            fb_agg = latest_per_order(data["feedback"], LATEST_BY["feedback"],
+                                      _sources("feedback", merged["feedback"]))
+            df = df.merge(_project(fb_agg, "feedback", merged["feedback"]),
+                          on='order_id', how='left')
+            sp.set(rows_out=len(df))
 
     return df
 
@@ -127,8 +633,30 @@ def assess_performance(df):
     return df
 
 
+# Root-cause rules, evaluated in order. Each contributes "<label>: <value>" when the
+# column is non-null and its condition holds:
+#   failed_only – only for failed orders;  include/exclude – allowed/ignored values.
+REASON_RULES = [
+    # column              label        condition
+    ("failure_reason",    "Status",    {"failed_only": True}),
+    ("gps_delay_notes",   "Fleet",     {}),
+    ("warehouse_notes",   "Warehouse", {}),
+    ("weather_condition", "Weather",   {"exclude": ['Clear', 'Sunny']}),
+    ("traffic_condition", "Traffic",   {"include": ['Heavy', 'Jam']}),
+    ("event_type",        "Event",     {}),
+]
+UNKNOWN_REASON = "Unknown Operational Delay"
+
+# Unified columns enrich_data() reads; always part of a projected load.
+ENRICH_COLUMNS = (['status', 'promised_delivery_date', 'actual_delivery_date'] +
+                  [column for column, _, _ in REASON_RULES])
+
+
 def generate_reason(row):
-    """Build a consolidated reason string from all available signals."""
+    """
+    Build a consolidated reason string from all available signals.
+    Row-wise reference for build_reasons(); kept for single-row use and benchmarking.
+    """
     reasons = []
 
     if row['is_failed'] and pd.notna(row.get('failure_reason')):
@@ -150,272 +678,3482 @@ def generate_reason(row):
         reasons.append(f"Event: {row['event_type']}")
 
     if not reasons and (row['is_late'] or row['is_failed']):
-        return "Unknown Operational Delay"
+        return UNKNOWN_REASON
 
     return "; ".join(reasons)
 
 
+def build_reasons(df: pd.DataFrame) -> pd.Series:
+    """
+    Column-wise equivalent of df.apply(generate_reason, axis=1), driven by REASON_RULES,
+    returned as a categorical.
+
+    Each rule is factorized into per-row codes (-1 when it does not fire) and the codes are
+    folded into one combination key. The reason string is then formatted once per distinct
+    combination and broadcast back, so the Python work scales with the number of distinct
+    reason combinations rather than with the number of orders.
+    """
+    n = len(df)
+    key = (df['is_late'] | df['is_failed']).to_numpy(dtype=np.int64)
+    rule_codes = []
+    for column, label, cond in REASON_RULES:
+        if column not in df.columns:
+            rule_codes.append((label, np.full(n, -1, dtype=np.int64), []))
+            continue
+        values = df[column]
+        mask = values.notna()
+        if cond.get("failed_only"):
+            mask &= df['is_failed']
+        if "exclude" in cond:
+            mask &= ~values.isin(cond["exclude"])
+        if "include" in cond:
+            mask &= values.isin(cond["include"])
+        codes, uniques = pd.factorize(values.where(mask))
+        rule_codes.append((label, codes, uniques))
+        # Re-factorize after every fold so the combined key stays dense and never overflows.
+        key, _ = pd.factorize(key * (len(uniques) + 1) + (codes + 1))
+
+    first_rows = pd.Series(key).drop_duplicates().index.to_numpy()
+    combos = []
+    for r in first_rows:
+        reasons = [f"{label}: {uniques[codes[r]]}"
+                   for label, codes, uniques in rule_codes if codes[r] >= 0]
+        if not reasons and (df['is_late'].iat[r] or df['is_failed'].iat[r]):
+            combos.append(UNKNOWN_REASON)
+        else:
+            combos.append("; ".join(reasons))
+    # Different combinations can format to the same text (e.g. late vs on-time with reasons).
+    combo_codes, categories = pd.factorize(np.array(combos, dtype=object))
+    return pd.Series(pd.Categorical.from_codes(combo_codes[key], categories=categories),
+                     index=df.index)
+
+
 def enrich_data(df):
-    df = assess_performance(df)
-    df['consolidated_reason'] = df.apply(generate_reason, axis=1)
+    with span("assess_performance", rows_in=len(df)):
+        df = assess_performance(df)
+    with span("build_reasons", rows_in=len(df)):
+        df['consolidated_reason'] = build_reasons(df)
     return df
 
 
-# ---------------------------------------------------------------------------
-# LLM-Powered Intent Parsing
-# ---------------------------------------------------------------------------
+# Order-keyed tables that are split across workers; the dimension tables are broadcast.
+PARTITIONED_TABLES = ["orders", "fleet_logs", "warehouse_logs", "weather", "feedback"]
 
-def llm_parse_intent(question: str, data: dict) -> dict:
-    """
-    Ask Gemini to extract structured intent from a free-form user question.
-    Returns a dict with keys: action, order_id, cities, filters, time_range.
-    """
-    cities     = sorted(data['orders']['city'].dropna().unique().tolist())
-    clients    = sorted(data['clients']['client_name'].dropna().unique().tolist())
-    warehouses = sorted(data['warehouses']['warehouse_name'].dropna().unique().tolist())
 
-    prompt = f"""You are an intent-extraction assistant for a logistics delivery analytics system.
+def _partition_of(order_ids: pd.Series, workers: int) -> np.ndarray:
+    """Hash partition number of each order id (missing ids go to partition 0)."""
+    ids = order_ids.to_numpy(dtype=np.int64, na_value=0)
+    return (pd.util.hash_array(ids) % np.uint64(workers)).astype(np.int64)
 
-Available entities in the dataset:
-- Cities (delivery): {', '.join(cities[:30])}
-- Client names: {', '.join(clients[:30])}
-- Warehouse names: {', '.join(warehouses)}
 
-Parse the user's question and return a JSON object with EXACTLY these fields:
-{{
-  "action": "<one of: query_order | compare_cities | filter_analysis | show_insights>",
-  "order_id": <integer order ID if a specific order is mentioned, else null>,
-  "cities": [<city1>, <city2>] if comparing two cities, else null,
-  "filters": {{
-    "city": "<city name if a single city is mentioned, else null>",
-    "client": "<client name if a client is mentioned, else null>",
-    "warehouse": "<warehouse name if a warehouse is mentioned, else null>"
-  }},
-  "time_range": "<description of any time period mentioned, e.g. 'last week', 'August', else null>"
-}}
+def _combine_partition(part: dict, columns) -> pd.DataFrame:
+    return enrich_data(combine_data(part, columns, verbose=False))
 
-Rules:
-- Use action=query_order when a specific order number is asked about.
-- Use action=compare_cities when the question asks to compare exactly two cities.
-- Use action=filter_analysis when the question is about a specific city, client, or warehouse.
-- Use action=show_insights for general/aggregate questions.
-- Match city/client/warehouse names case-insensitively to the lists above; use the canonical name.
-- Return ONLY valid JSON, no markdown fences or extra text.
 
-User question: {question}"""
+def combine_partitioned(data, columns=None, workers: int = 2) -> pd.DataFrame:
+    """
+    enrich_data(combine_data(data, columns)) split over a process pool: orders and the
+    order-keyed logs are hash-partitioned on order_id so every order meets all of its
+    records in one partition, while clients, drivers and warehouses go to every worker.
+    Rows come back in the original order, so the result matches the serial path.
+    """
+    print(f"Combining data on {workers} workers...")
+    merged = _merged_columns(columns)
+    needed = ["orders"] + [t for t in PARTITIONED_TABLES[1:] if merged[t]]
+    broadcast = {t: data[t] for t in ("clients", "drivers", "warehouses") if merged[t]}
+    orders = data["orders"].assign(_row=np.arange(len(data["orders"])))
 
-    client = get_llm_client()
-    response = client.models.generate_content(
-        model=GEMINI_MODEL,
-        contents=prompt,
-        config=types.GenerateContentConfig(
-            response_mime_type="application/json",
-            temperature=0,
-        ),
-    )
-    return json.loads(response.text)
+    parts = [dict(broadcast) for _ in range(workers)]
+    for name in needed:
+        table = orders if name == "orders" else data[name]
+        assignment = _partition_of(table['order_id'], workers)
+        for w in range(workers):
+            parts[w][name] = table[assignment == w]
+
+    with span("combine_partitioned", rows_in=len(orders), workers=workers), \
+            concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(_combine_partition, parts, [columns] * workers))
+    df = _concat_frames(results).sort_values('_row', kind='stable')
+    return df.drop(columns='_row').reset_index(drop=True)
+
+
+def extract_entities(data: dict) -> dict:
+    """Collect the canonical city, client, warehouse and partner names offered to the intent parser."""
+    return {
+        "cities":     sorted(data['orders']['city'].dropna().unique().tolist()),
+        "clients":    sorted(data['clients']['client_name'].dropna().unique().tolist()),
+        "warehouses": sorted(data['warehouses']['warehouse_name'].dropna().unique().tolist()),
+        "partners":   sorted(data['drivers']['partner_company'].dropna().unique().tolist()),
+    }
 
 
 # ---------------------------------------------------------------------------
-# LLM-Powered Narrative Generation
+# Enriched Table Cache
 # ---------------------------------------------------------------------------
 
-def llm_generate_narrative(question: str, data_summary: str, context: str) -> str:
+def _file_digest(path: str, prefix: int = None):
     """
-    Ask Gemini to turn a data summary into a clear, human-readable analysis.
+    SHA-256 of a file's contents, read in 1 MiB blocks. With `prefix`, returns
+    (digest of the first `prefix` bytes, digest of the whole file) from the same pass.
     """
-    prompt = f"""You are an expert logistics analyst providing human-readable insights to operations managers.
-
-Your response must:
-1. Directly answer the question in plain English.
-2. Highlight the key root causes and patterns with specific numbers.
-3. Call out the most critical issues in order of severity.
-4. End with 2-3 concise, actionable recommendations.
-5. Use short paragraphs and bullet points - NO raw tables, NO SQL, NO markdown code blocks.
-6. Keep the tone professional but conversational.
-
-Question: {question}
+    digest, head = hashlib.sha256(), None
+    with open(path, "rb") as f:
+        if prefix is not None:
+            for block in iter(lambda: f.read(min(1 << 20, prefix - f.tell())), b""):
+                digest.update(block)
+            head = digest.copy().hexdigest()
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest() if prefix is None else (head, digest.hexdigest())
 
-Context: {context}
 
-Data Summary:
-{data_summary}
+def source_changes(previous: dict = None):
+    """
+    Fingerprint every source CSV as {name: {size, mtime_ns, sha256}} and compare it with
+    `previous`. Returns (fingerprint, appended): `appended` maps each file that only grew
+    — its first previous-size bytes still hash to the previous digest, ending on a line
+    break — to the byte offset where its new rows start; it is None if any file was
+    rewritten instead. Hashes are reused when a file's size and mtime are unchanged, so
+    a warm run only stats the files.
+    """
+    previous = previous or {}
+    fingerprint, appended = {}, {}
+    for name, filename in SOURCE_FILES.items():
+        path = os.path.join(DATA_DIR, filename)
+        st   = os.stat(path)
+        old  = previous.get(name) or {}
+        if old.get("size") == st.st_size and old.get("mtime_ns") == st.st_mtime_ns:
+            fingerprint[name] = old
+            continue
+        if old and 0 < old["size"] < st.st_size:
+            head, sha = _file_digest(path, old["size"])
+            with open(path, "rb") as f:
+                f.seek(old["size"] - 1)
+                on_boundary = f.read(1) == b"\n"
+        else:
+            head, sha, on_boundary = None, _file_digest(path), False
+        fingerprint[name] = {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "sha256": sha}
+        if old and sha != old["sha256"]:
+            if head == old["sha256"] and on_boundary and appended is not None:
+                appended[name] = old["size"]
+            else:
+                appended = None
+    return fingerprint, appended if previous else None
 
-Please provide a thorough, human-readable analysis."""
 
-    client = get_llm_client()
-    response = client.models.generate_content(
-        model=GEMINI_MODEL,
-        contents=prompt,
-        config=types.GenerateContentConfig(temperature=0.3),
-    )
-    return response.text
+def source_fingerprint(previous: dict = None) -> dict:
+    """Return {name: {size, mtime_ns, sha256}} for every source CSV (see source_changes())."""
+    return source_changes(previous)[0]
 
 
-# ---------------------------------------------------------------------------
-# Data Summary Helpers (feed to LLM)
-# ---------------------------------------------------------------------------
+def _same_sources(a: dict, b: dict) -> bool:
+    """Two fingerprints describe the same inputs when sizes and content hashes agree."""
+    return a.keys() == b.keys() and all(
+        a[k]["size"] == b[k]["size"] and a[k]["sha256"] == b[k]["sha256"] for k in a)
 
-def prepare_data_summary(df: pd.DataFrame) -> str:
-    """Produce a compact textual summary of an (optionally filtered) DataFrame."""
-    if df.empty:
-        return "No orders found matching the given criteria."
 
-    total    = len(df)
-    failures = df[df['is_failed'] | df['is_late']]
-    rate     = len(failures) / total * 100 if total > 0 else 0.0
+def _read_manifest():
+    try:
+        with open(os.path.join(CACHE_DIR, "manifest.json"), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
 
-    lines = [
-        f"Total orders: {total}",
-        f"Failed or late: {len(failures)} ({rate:.1f}%)",
-        f"Successfully on-time: {total - len(failures)} ({100 - rate:.1f}%)",
-    ]
 
-    if not failures.empty:
-        lines.append("\nTop 5 consolidated failure reasons:")
-        for reason, cnt in failures['consolidated_reason'].value_counts().head(5).items():
-            lines.append(f"  • {reason}: {cnt} orders ({cnt / len(failures) * 100:.1f}%)")
+def _write_manifest(manifest: dict):
+    tmp = os.path.join(CACHE_DIR, "manifest.json.tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(tmp, os.path.join(CACHE_DIR, "manifest.json"))
 
-        if 'weather_condition' in df.columns:
-            wc = failures['weather_condition'].value_counts().head(4)
-            lines.append("\nWeather conditions during failures:")
-            for cond, cnt in wc.items():
-                if pd.notna(cond):
-                    lines.append(f"  • {cond}: {cnt}")
 
-        if 'traffic_condition' in df.columns:
-            tc = failures['traffic_condition'].value_counts().head(3)
-            lines.append("\nTraffic conditions during failures:")
-            for cond, cnt in tc.items():
-                if pd.notna(cond):
-                    lines.append(f"  • {cond}: {cnt}")
+def _frame_key(columns=None, entities: bool = False) -> str:
+    """Cache key for one projection of the enriched table."""
+    if columns is None:
+        name = "all"
+    else:
+        name = hashlib.sha1(",".join(sorted(set(columns))).encode()).hexdigest()[:12]
+    return name + ("-entities" if entities else "")
 
-        if 'city' in df.columns:
-            lines.append("\nTop 5 cities by failure count:")
-            for city, cnt in failures['city'].value_counts().head(5).items():
-                if pd.notna(city):
-                    city_total = len(df[df['city'] == city])
-                    lines.append(f"  • {city}: {cnt} failures out of {city_total} orders")
 
-        if 'client_name' in df.columns:
-            lines.append("\nTop 5 clients by failure count:")
-            for client, cnt in failures['client_name'].value_counts().head(5).items():
-                if pd.notna(client):
-                    lines.append(f"  • {client}: {cnt}")
+def _cached_entry(key: str, stale: bool = False):
+    """
+    Return (manifest, entry) for projection `key` if its recorded sources match the
+    current CSVs (or regardless, with `stale`), otherwise None. A file that was touched
+    but not modified refreshes the entry.
+    """
+    manifest = _read_manifest()
+    if not manifest or manifest.get("version") != CACHE_VERSION:
+        return None
+    entry = manifest.get("frames", {}).get(key)
+    if entry is None:
+        return None
+    if stale:
+        return manifest, entry
+    cached = entry["sources"]
+    try:
+        current = source_fingerprint(cached)
+    except OSError:
+        return None
+    if not _same_sources(cached, current):
+        return None
+    if current != cached:
+        entry["sources"] = current
+        _write_manifest(manifest)
+    return manifest, entry
 
-        if 'warehouse_name' in df.columns:
-            lines.append("\nTop 5 warehouses by failure count:")
-            for wh, cnt in failures['warehouse_name'].value_counts().head(5).items():
-                if pd.notna(wh):
-                    lines.append(f"  • {wh}: {cnt}")
 
-        if 'event_type' in df.columns:
-            events = failures['event_type'].dropna().value_counts().head(3)
-            if not events.empty:
-                lines.append("\nExternal events linked to failures:")
-                for ev, cnt in events.items():
-                    lines.append(f"  • {ev}: {cnt}")
+def _read_cached(name: str) -> pd.DataFrame:
+    return pd.read_feather(os.path.join(CACHE_DIR, name))
 
-        if 'feedback_text' in df.columns:
-            samples = failures['feedback_text'].dropna().head(5).tolist()
-            if samples:
-                lines.append("\nSample customer feedback from failed/late orders:")
-                for fb in samples:
-                    lines.append(f"  - \"{fb}\"")
 
-    return "\n".join(lines)
+def _write_cached(name: str, df: pd.DataFrame):
+    tmp = os.path.join(CACHE_DIR, name + ".tmp")
+    df.reset_index(drop=True).to_feather(tmp)
+    os.replace(tmp, os.path.join(CACHE_DIR, name))
 
 
-def prepare_single_order_summary(row) -> str:
-    """Build a detailed text block for a single order row."""
-    fields = {
-        "Order ID":          row.get('order_id'),
-        "Customer":          row.get('customer_name'),
-        "Status":            row.get('status'),
-        "Performance":       ("LATE" if row.get('is_late') else
-                              "FAILED" if row.get('is_failed') else "ON TIME"),
-        "Promised delivery": row.get('promised_delivery_date'),
-        "Actual delivery":   row.get('actual_delivery_date'),
-        "City":              row.get('city'),
-        "Client":            row.get('client_name'),
-        "Warehouse":         row.get('warehouse_name'),
-        "Fleet note":        row.get('gps_delay_notes'),
-        "Warehouse note":    row.get('warehouse_notes'),
-        "Weather":           row.get('weather_condition'),
-        "Traffic":           row.get('traffic_condition'),
-        "External event":    row.get('event_type'),
-        "Customer feedback": row.get('feedback_text'),
-        "Feedback rating":   row.get('rating'),
-        "Failure reason":    row.get('failure_reason'),
-    }
-    lines = []
-    for k, v in fields.items():
-        if v is not None and pd.notna(v):
-            lines.append(f"  {k}: {v}")
-    return "\n".join(lines)
+def _read_frame(entry: dict) -> pd.DataFrame:
+    """The cached enriched table of a manifest entry, reassembled from its parts."""
+    return _concat_frames([_read_cached(name) for name in entry["parts"]])
 
 
-def prepare_city_comparison_summary(df: pd.DataFrame, city1: str, city2: str) -> str:
-    """Build a side-by-side comparison summary for two cities."""
-    lines = []
-    for city in [city1, city2]:
-        city_df = df[df['city'].str.lower() == city.lower()]
-        if city_df.empty:
-            lines.append(f"\n{city}: No data available.")
+def _write_frame_parts(key: str, rich_df: pd.DataFrame, previous=None, changed=None) -> list:
+    """
+    Store rich_df as Feather parts of CACHE_PART_ROWS rows and return their file names.
+    Given the `previous` parts of this frame and the sorted positions of the rows that
+    `changed` since (appended rows included), parts holding none of them are kept and
+    only the others are written, under new names, so the manifest keeps pointing at
+    complete files until it is replaced.
+    """
+    count = max(-(-len(rich_df) // CACHE_PART_ROWS), 1)
+    if previous is None or changed is None:
+        previous, dirty = [], set()
+    else:
+        dirty = set((np.asarray(changed) // CACHE_PART_ROWS).tolist())
+    tag = hashlib.sha1(os.urandom(8)).hexdigest()[:8]
+    parts = []
+    for i in range(count):
+        if i < len(previous) and i not in dirty:
+            parts.append(previous[i])
             continue
-        failures = city_df[city_df['is_failed'] | city_df['is_late']]
-        rate = len(failures) / len(city_df) * 100
-        lines.append(f"\n{city}:")
-        lines.append(f"  Total orders: {len(city_df)}, Failed/Late: {len(failures)} ({rate:.1f}%)")
-        if not failures.empty:
-            lines.append("  Top reasons:")
-            for reason, cnt in failures['consolidated_reason'].value_counts().head(4).items():
-                lines.append(f"    • {reason}: {cnt}")
-            wc = failures['weather_condition'].value_counts().head(2)
-            if not wc.empty:
-                lines.append(f"  Dominant weather: {', '.join(f'{c} ({n})' for c, n in wc.items() if pd.notna(c))}")
-            tc = failures['traffic_condition'].value_counts().head(2)
-            if not tc.empty:
-                lines.append(f"  Dominant traffic: {', '.join(f'{c} ({n})' for c, n in tc.items() if pd.notna(c))}")
-    return "\n".join(lines)
+        parts.append(f"rich_df-{key}-{i:04d}-{tag}.feather")
+        _write_cached(parts[-1], rich_df.iloc[i * CACHE_PART_ROWS:(i + 1) * CACHE_PART_ROWS])
+    return parts
 
 
-# ---------------------------------------------------------------------------
-# Analysis Entry Points
-# ---------------------------------------------------------------------------
+def load_cached_frame(key: str = "all"):
+    """
+    Return (rich_df, entities) for projection `key` from the cache if it matches the
+    current source CSVs, otherwise None.
+    """
+    cached = _cached_entry(key)
+    if cached is None:
+        return None
+    frame = cached[1]
+    try:
+        with span("cache:read_frame") as sp:
+            rich_df = _read_frame(frame)
+            sp.set(rows_out=len(rich_df))
+    except (OSError, ImportError, ValueError):
+        return None
+    return rich_df, frame["entities"]
 
-def analyze_order(rich_df: pd.DataFrame, order_id: int, question: str):
-    order = rich_df[rich_df['order_id'] == order_id]
-    if order.empty:
-        print(f"Order {order_id} not found in the dataset.")
-        return
-    summary  = prepare_single_order_summary(order.iloc[0])
-    narrative = llm_generate_narrative(
-        question, summary,
-        f"Detailed analysis for Order {order_id}"
-    )
-    print(f"\n{narrative}")
 
+def save_cached_frame(key: str, rich_df: pd.DataFrame, entities, fingerprint: dict,
+                      columns=None, state: dict = None, changed=None, cube=None):
+    """
+    Persist one projection of the enriched table (Arrow/Feather parts) and record it in
+    the manifest with the source fingerprint it was built from. `state` (join_state())
+    is stored alongside so later appends to the CSVs can be applied incrementally. With
+    `changed`, the positions of the rows that differ from the stored frame, only the
+    parts holding them are rewritten. A `cube` of the frame is stored with it.
+    """
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        manifest = _read_manifest() or {}
+        if manifest.get("version") != CACHE_VERSION:
+            manifest = {"version": CACHE_VERSION, "frames": {}}
+        previous = manifest["frames"].get(key) or {}
+        state_files = {}
+        with span("cache:write_frame", rows_in=len(rich_df) if changed is None else len(changed)):
+            parts = _write_frame_parts(key, rich_df, previous.get("parts"), changed)
+            for name, table in (state or {}).items():
+                state_files[name] = f"state-{key}-{name}.feather"
+                _write_cached(state_files[name], table)
+        entry = {"parts": parts, "entities": entities, "sources": fingerprint,
+                 "columns": None if columns is None else sorted(set(columns)), "state": state_files}
+        if cube is not None:
+            entry["cube"] = _write_failure_cube(key, cube)
+        manifest["frames"][key] = entry
+        _write_manifest(manifest)
+        for name in set(previous.get("parts", [])) - set(parts):
+            os.remove(os.path.join(CACHE_DIR, name))
+    except (OSError, ImportError) as e:
+        print(f"Warning: could not write data cache ({e}).")
 
-def analyze_filtered(rich_df: pd.DataFrame, question: str, context: str):
-    summary  = prepare_data_summary(rich_df)
-    narrative = llm_generate_narrative(question, summary, context)
-    print(f"\n{narrative}")
 
+def _read_failure_cube(files: dict) -> "FailureCube":
+    """The FailureCube stored under the manifest entry's cube `files`."""
+    cells   = _read_cached(files["cells"])
+    members = _read_cached(files["members"])
+    feedback = _read_cached(files["feedback"]) if files["feedback"] else None
+    on_time  = _read_cached(files["on_time"]) if files["on_time"] else None
+    feedback_index = (FeedbackIndex.load(os.path.join(CACHE_DIR, files["feedback_index"]))
+                      if files["feedback_index"] else None)
+    return FailureCube(cells, members, feedback, on_time, files["columns"], feedback_index)
 
-def analyze_comparison(rich_df: pd.DataFrame, city1: str, city2: str, question: str):
-    summary  = prepare_city_comparison_summary(rich_df, city1, city2)
-    narrative = llm_generate_narrative(
-        question, summary,
-        f"Side-by-side comparison: {city1} vs {city2}"
-    )
-    print(f"\n{narrative}")
 
+def _write_failure_cube(key: str, cube: "FailureCube") -> dict:
+    """Store `cube` as the cube of projection `key`; returns the files for its manifest entry."""
+    files = {"cells": f"cube-{key}.feather", "members": f"cube-{key}-members.feather",
+             "columns": cube.columns,
+             "feedback": f"cube-{key}-feedback.feather" if cube.feedback is not None else None,
+             "on_time": f"cube-{key}-on-time.feather" if cube.on_time is not None else None,
+             "feedback_index": f"feedback-{key}.npz" if cube.feedback_index is not None else None}
+    for name, table in ((files["cells"], cube.cells), (files["members"], cube.members),
+                        (files["feedback"], cube.feedback), (files["on_time"], cube.on_time)):
+        if name:
+            _write_cached(name, table)
+    if files["feedback_index"]:
+        cube.feedback_index.save(os.path.join(CACHE_DIR, files["feedback_index"]))
+    return files
 
-# ---------------------------------------------------------------------------
+
+def load_failure_cube(rich_df: pd.DataFrame, columns=None, entities: bool = False,
+                      read_cache: bool = True, write_cache: bool = True):
+    """
+    Return the FailureCube of `rich_df`, the projection load_rich_data(columns, entities)
+    returned, with its FeedbackIndex: read from the cache next to that frame (unless
+    `read_cache` is off), or built and stored there (unless `write_cache` is off).
+    """
+    key = _frame_key(columns, entities)
+    cached = _cached_entry(key) if read_cache or write_cache else None
+    files = (cached[1].get("cube") if cached and read_cache else None) or {}
+    if files:
+        try:
+            return _read_failure_cube(files)
+        except (OSError, ImportError, ValueError, KeyError):
+            pass
+
+    with span("failure_cube", rows_in=len(rich_df)) as sp:
+        cube = FailureCube.from_frame(rich_df)
+        sp.set(rows_out=len(cube.cells))
+    if cached and write_cache:
+        manifest, entry = cached
+        try:
+            entry["cube"] = _write_failure_cube(key, cube)
+            _write_manifest(manifest)
+        except (OSError, ImportError) as e:
+            print(f"Warning: could not write data cache ({e}).")
+    return cube
+
+
+# ---------------------------------------------------------------------------
+# Incremental Ingestion (rows appended to the CSVs)
+# ---------------------------------------------------------------------------
+
+# Dimension tables and the (table, column) that references them.
+DIMENSION_REFERENCES = {"clients": ("orders", 'client_id'),
+                        "drivers": ("fleet_logs", 'driver_id'),
+                        "warehouses": ("warehouse_logs", 'warehouse_id')}
+
+
+def join_state(data: dict, plan=None) -> dict:
+    """
+    The inputs combine_data() needs to rebuild any order of a projection: orders and
+    dimension tables as read, order-keyed logs reduced to their latest record per order.
+    Reduced logs can absorb appended records exactly (latest_per_order() is associative).
+    """
+    names = SOURCE_FILES if plan is None else plan
+    with span("cache:join_state"):
+        return {name: latest_per_order(data[name], LATEST_BY[name]) if name in LATEST_BY
+                else data[name] for name in names}
+
+
+def read_appended(name: str, offset: int, columns=None) -> pd.DataFrame:
+    """Parse the rows of table `name` that start at byte `offset` (the previous end of file)."""
+    with open(os.path.join(DATA_DIR, SOURCE_FILES[name]), "rb") as f:
+        header = f.readline()
+        f.seek(offset)
+        return read_table(name, columns, source=io.BytesIO(header + f.read()))
+
+
+def apply_appends(rich_df: pd.DataFrame, state: dict, appended: dict, columns=None, plan=None):
+    """
+    Fold the rows appended to the source CSVs (`appended`: table → start offset, as from
+    source_changes()) into a materialized projection. Only orders that gained a row —
+    new orders, orders with a new log record, orders referencing a new dimension row —
+    are recombined and re-enriched; the rest of rich_df is kept, and the result has the
+    rows in source order exactly as a full rebuild would. Returns (rich_df, state,
+    affected order count, positions of the recomputed rows in rich_df), or None when the change cannot be applied incrementally (a
+    dimension id that already existed, or a store that does not line up with its state).
+    """
+    state    = dict(state)
+    old_rows = len(state["orders"])
+    if len(rich_df) != old_rows:
+        return None
+    affected, new_ids = [], {}
+    for name in [n for n in SOURCE_FILES if n in state and n in appended]:
+        delta = read_appended(name, appended[name], None if plan is None else plan[name])
+        if name in DIMENSION_REFERENCES:
+            key = JOIN_KEYS[name]
+            if delta[key].isin(state[name][key]).any() or delta[key].duplicated().any():
+                return None
+            new_ids[name] = delta[key]
+            state[name] = _concat_frames([state[name], delta])
+            continue
+        affected.append(delta['order_id'])
+        if name in LATEST_BY:
+            reduced = latest_per_order(delta, LATEST_BY[name])
+            state[name] = latest_per_order(_concat_frames([state[name], reduced]), LATEST_BY[name])
+        else:
+            state[name] = _concat_frames([state[name], delta])
+    for name, ids in new_ids.items():
+        table, column = DIMENSION_REFERENCES[name]
+        if column in state.get(table, ()):
+            referencing = state[table][column].isin(ids)
+            affected.append(state[table].loc[referencing, 'order_id'])
+
+    orders    = state["orders"]
+    affected  = pd.unique(pd.concat(affected).dropna()) if affected else []
+    positions = np.flatnonzero(orders['order_id'].isin(affected).to_numpy())
+    part_data = {name: (table[table['order_id'].isin(affected)] if 'order_id' in table else table)
+                 for name, table in state.items()}
+    part = enrich_data(combine_data(part_data, columns, verbose=False))
+    if len(part) != len(positions):
+        return None
+    kept = np.setdiff1d(np.arange(old_rows), positions, assume_unique=True)
+    merged = _concat_frames([rich_df.iloc[kept].reset_index(drop=True), part.reset_index(drop=True)])
+    merged = merged.iloc[np.argsort(np.concatenate([kept, positions]), kind='stable')]
+    return merged.reset_index(drop=True), state, len(affected), positions
+
+
+def refresh_cached_frame(key: str, columns=None, entities: bool = False):
+    """
+    Bring cached projection `key` up to date with rows appended to the source CSVs since
+    it was materialized, through apply_appends(), and store the result: only the frame
+    parts holding recomputed rows are rewritten, and a stored failure cube has just the
+    days those rows fall on recounted (FailureCube.refresh()). Returns (rich_df,
+    entities), or None when the projection has no stored state or the sources changed
+    in a way that needs a full rebuild.
+    """
+    cached = _cached_entry(key, stale=True)
+    if cached is None or not cached[1].get("state"):
+        return None
+    entry = cached[1]
+    try:
+        fingerprint, appended = source_changes(entry["sources"])
+    except OSError:
+        return None
+    if not appended:
+        return None
+    try:
+        rich_df = _read_frame(entry)
+        state   = {name: _read_cached(filename) for name, filename in entry["state"].items()}
+        cube    = _read_failure_cube(entry["cube"]) if entry.get("cube") else None
+    except (OSError, ImportError, ValueError, KeyError):
+        return None
+
+    print(f"Applying rows appended to {', '.join(sorted(appended))}...")
+    plan = plan_sources(columns, entities)
+    with span("cache:apply_appends", rows_in=len(rich_df)):
+        refreshed = apply_appends(rich_df, state, appended, columns, plan)
+    if refreshed is None:
+        print("Appended rows change existing dimension records; rebuilding instead.")
+        return None
+    old_df = rich_df
+    rich_df, state, n_affected, positions = refreshed
+    print(f"Recomputed {n_affected} affected orders.")
+    if cube is not None:
+        with span("cache:refresh_cube", rows_in=len(positions)) as sp:
+            cube = cube.refresh(old_df, rich_df, positions)
+            sp.set(rows_out=len(cube.cells))
+    names = extract_entities(state) if entities else None
+    save_cached_frame(key, rich_df, names, fingerprint, columns, state, positions, cube)
+    return rich_df, names
+
+
+def refresh_cache(workers: int = 1):
+    """
+    --refresh: bring every cached projection (and its failure cube, if it had one) up
+    to date with the source CSVs — incrementally where rows were only appended.
+    """
+    manifest = _read_manifest() or {}
+    if manifest.get("version") != CACHE_VERSION or not manifest.get("frames"):
+        print("No cached datasets to refresh.")
+        return
+    for key, entry in manifest["frames"].items():
+        entities = entry["entities"] is not None
+        loaded = load_rich_data(entry.get("columns"), entities, workers=workers)
+        if loaded is None:
+            return
+        if entry.get("cube"):
+            load_failure_cube(loaded[0], entry.get("columns"), entities)
+        print(f"Dataset {key}: {len(loaded[0])} orders.")
+
+
+def load_rich_data(columns=None, entities: bool = False, read_cache: bool = True,
+                   write_cache: bool = True, workers: int = 1):
+    """
+    Return (rich_df, entities) for the unified columns in `columns` (None = all), served
+    from the columnar cache when the source CSVs are unchanged, brought up to date
+    incrementally when rows were only appended to them, and rebuilt through
+    load_data() → combine_data() → enrich_data() otherwise (on `workers` processes when
+    more than one). `read_cache` off forces the rebuild; `write_cache` off keeps it out
+    of the cache. `entities` is the extract_entities() dict when requested, else None.
+    Returns None if the source data cannot be loaded.
+    """
+    key = _frame_key(columns, entities)
+    if read_cache:
+        cached = load_cached_frame(key)
+        if cached is not None:
+            print("Loading cached dataset...")
+            return cached
+        refreshed = refresh_cached_frame(key, columns, entities)
+        if refreshed is not None:
+            return refreshed
+
+    previous = ((_read_manifest() or {}).get("frames", {}).get(key) or {}).get("sources")
+    fingerprint = source_fingerprint(previous) if write_cache else None
+    plan = plan_sources(columns, entities)
+    data = load_data(plan)
+    if not data:
+        return None
+    if workers > 1:
+        rich_df = combine_partitioned(data, columns, workers)
+    else:
+        rich_df = enrich_data(combine_data(data, columns))
+    names   = extract_entities(data) if entities else None
+    if write_cache:
+        save_cached_frame(key, rich_df, names, fingerprint, columns, join_state(data, plan))
+    return rich_df, names
+
+
+# ---------------------------------------------------------------------------
+# Record Index (single-order lookups)
+# ---------------------------------------------------------------------------
+
+# Key column each source CSV is indexed on.
+INDEX_KEYS = {"orders": 'order_id', **JOIN_KEYS}
+INDEX_DIR = os.path.join(CACHE_DIR, "index")
+
+
+def _record_bounds(path: str):
+    """
+    Return (starts, ends) byte offsets of every data record in a CSV (header excluded).
+    Newlines inside quoted fields are skipped by tracking quote parity; blank lines are
+    dropped, as pandas does.
+    """
+    raw = np.memmap(path, dtype=np.uint8, mode='r') if os.path.getsize(path) else np.zeros(0, np.uint8)
+    breaks, parity, block = [], 0, 1 << 24
+    for pos in range(0, len(raw), block):
+        buf = raw[pos:pos + block]
+        inside = np.bitwise_xor.accumulate((buf == ord('"')).astype(np.uint8)) ^ parity
+        breaks.append(np.flatnonzero((buf == ord('\n')) & (inside == 0)) + pos + 1)
+        parity = int(inside[-1])
+    bounds = np.concatenate(breaks + [np.zeros(0, np.int64)]).astype(np.int64)
+    if len(raw) and (not len(bounds) or bounds[-1] != len(raw)):
+        bounds = np.append(bounds, len(raw))
+    starts, ends = bounds[:-1], bounds[1:]
+    lengths = ends - starts
+    blank = (lengths == 1) | ((lengths == 2) & (raw[np.minimum(starts, len(raw) - 1)] == ord('\r')))
+    return starts[~blank], ends[~blank]
+
+
+def build_record_index(name: str) -> str:
+    """
+    Index one source CSV by its INDEX_KEYS column: sorted keys plus the byte offset and
+    length of each record, saved as .npy files that lookups memory-map.
+    Returns the CSV header line.
+    """
+    path = os.path.join(DATA_DIR, SOURCE_FILES[name])
+    key = INDEX_KEYS[name]
+    starts, ends = _record_bounds(path)
+    keys = pd.read_csv(path, usecols=[key], dtype={key: 'Int64'})[key]
+    if len(keys) != len(starts):
+        raise ValueError(f"could not align {len(keys)} rows with {len(starts)} records in {path}")
+    valid = keys.notna().to_numpy()
+    keys = keys.to_numpy(dtype=np.int64, na_value=0)[valid]
+    order = np.argsort(keys, kind='stable')     # stable: file order within a key
+    os.makedirs(INDEX_DIR, exist_ok=True)
+    for part, values in (("keys", keys[order]), ("offsets", starts[valid][order]),
+                         ("lengths", (ends - starts)[valid][order])):
+        np.save(os.path.join(INDEX_DIR, f"{name}.{part}.npy"), values)
+    with open(path, "rb") as f:
+        return f.readline().decode("utf-8")
+
+
+def ensure_record_index(rebuild: bool = False) -> dict:
+    """
+    Bring the record index up to date with the source CSVs and return its manifest.
+    Only tables whose fingerprint changed are re-indexed.
+    """
+    manifest_path = os.path.join(INDEX_DIR, "manifest.json")
+    try:
+        with open(manifest_path, encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        manifest = {}
+    if rebuild or manifest.get("version") != CACHE_VERSION:
+        manifest = {"version": CACHE_VERSION, "sources": {}, "headers": {}}
+    current = source_fingerprint(manifest["sources"])
+    stale = [name for name in INDEX_KEYS
+             if name not in manifest["headers"] or
+             not _same_sources({name: current[name]}, {name: manifest["sources"][name]})]
+    for name in stale:
+        manifest["headers"][name] = build_record_index(name)
+    if stale or current != manifest["sources"]:
+        manifest["sources"] = current
+        os.makedirs(INDEX_DIR, exist_ok=True)
+        tmp = manifest_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=1)
+        os.replace(tmp, manifest_path)
+    return manifest
+
+
+def fetch_records(name: str, keys, header: str, columns=None) -> pd.DataFrame:
+    """Read only the records of table `name` whose key is in `keys`, in file order."""
+    index = {part: np.load(os.path.join(INDEX_DIR, f"{name}.{part}.npy"), mmap_mode='r')
+             for part in ("keys", "offsets", "lengths")}
+    hits = []
+    for key in {int(k) for k in keys if pd.notna(k)}:
+        lo, hi = np.searchsorted(index["keys"], [key, key + 1])
+        hits.extend(zip(index["offsets"][lo:hi], index["lengths"][lo:hi]))
+    chunks = [header.encode("utf-8")]
+    with open(os.path.join(DATA_DIR, SOURCE_FILES[name]), "rb") as f:
+        for offset, length in sorted(hits):
+            f.seek(int(offset))
+            chunks.append(f.read(int(length)))
+    return read_table(name, columns, source=io.BytesIO(b"".join(chunks)))
+
+
+def lookup_order(order_id: int, columns=None, rebuild_index: bool = False) -> pd.DataFrame:
+    """
+    Build the enriched row for a single order straight from the record index: fetch the
+    order, its fleet/warehouse/weather/feedback records and the matching client, driver
+    and warehouse rows, then combine and enrich just those. Returns an empty frame if
+    the order does not exist.
+    """
+    manifest = ensure_record_index(rebuild_index)
+    headers  = manifest["headers"]
+    plan     = plan_sources(columns) or {}
+
+    def fetch(name, keys):
+        return fetch_records(name, keys, headers[name], plan.get(name))
+
+    data = {"orders": fetch("orders", [order_id])}
+    if data["orders"].empty:
+        return data["orders"]
+    for name in ("fleet_logs", "warehouse_logs", "weather", "feedback"):
+        data[name] = fetch(name, [order_id])
+    data["clients"] = fetch("clients", data["orders"]['client_id'].tolist()
+                            if 'client_id' in data["orders"] else [])
+    data["drivers"] = fetch("drivers", data["fleet_logs"]['driver_id'].tolist()
+                            if 'driver_id' in data["fleet_logs"] else [])
+    data["warehouses"] = fetch("warehouses", data["warehouse_logs"]['warehouse_id'].tolist()
+                               if 'warehouse_id' in data["warehouse_logs"] else [])
+    return enrich_data(combine_data(data, columns))
+
+
+# ---------------------------------------------------------------------------
+# Streaming Summaries (datasets larger than memory)
+# ---------------------------------------------------------------------------
+
+def _rows_within(name: str, columns, budget_bytes: int, overhead: int = 8) -> int:
+    """Rows of table `name` that fit in `budget_bytes`, from the parsed size of a sample."""
+    usecols = None if columns is None else (lambda c: c in columns)
+    sample = pd.read_csv(os.path.join(DATA_DIR, SOURCE_FILES[name]), usecols=usecols,
+                         dtype=SCHEMA[name], nrows=1000)
+    per_row = max(1, sample.memory_usage(deep=True).sum() // max(1, len(sample)))
+    return max(1000, int(budget_bytes // (per_row * overhead)))
+
+
+def _current_rss_bytes() -> int:
+    """Resident set size of this process (Linux /proc), or 0 when unavailable."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return 0
+
+
+def _rows_for_orders(reduced: pd.DataFrame, index: pd.Index, order_ids: pd.Series) -> pd.DataFrame:
+    """The rows of a latest-per-order table whose order_id is in `order_ids`."""
+    positions = index.get_indexer(order_ids.dropna().unique())
+    return reduced.iloc[np.sort(positions[positions >= 0])]
+
+
+def iter_enriched_chunks(columns=None, chunk_rows: int = 250_000, max_memory_mb: int = None):
+    """
+    Yield the enriched order table (the unified `columns`, default those of
+    analyze_filtered) in source order, one chunk at a time, without holding it in memory.
+    Order-keyed logs are reduced to their latest record per order chunk by chunk, then
+    orders are combined and enriched one chunk at a time.
+
+    With `max_memory_mb`, each table's chunk size is shrunk to fit the memory left under
+    the cap at the time it is read; the reduced side tables themselves (one row per
+    order) are the floor below which the cap cannot be honoured.
+    """
+    columns = ENTRY_POINT_COLUMNS["analyze_filtered"] if columns is None else columns
+    plan    = plan_sources(columns)
+    budget  = max_memory_mb * 2**20 if max_memory_mb else None
+
+    def rows(name):
+        if budget is None:
+            return chunk_rows
+        headroom = budget - _current_rss_bytes()
+        if headroom <= 0:
+            print(f"Warning: memory already above --max_memory_mb={max_memory_mb} before reading {name}.")
+        return min(chunk_rows, _rows_within(name, plan[name], max(headroom, 2**20)))
+
+    print("Streaming datasets...")
+    data = {}
+    for name in ("clients", "drivers", "warehouses"):
+        if name in plan:
+            data[name] = read_table(name, plan[name])
+    reduced = {}
+    for name, ts_col in LATEST_BY.items():
+        if name in plan:
+            reducer = LatestRecordReducer(ts_col)
+            for chunk in iter_table_chunks(name, plan[name], rows(name)):
+                reducer.update(chunk)
+            table = reducer.result()
+            reduced[name] = (table, pd.Index(table['order_id']))
+
+    for orders in iter_table_chunks("orders", plan["orders"], rows("orders")):
+        chunk_data = dict(data, orders=orders)
+        for name, (table, index) in reduced.items():
+            chunk_data[name] = _rows_for_orders(table, index, orders['order_id'])
+        yield enrich_data(combine_data(chunk_data, columns, verbose=False))
+
+
+def stream_summaries(views, chunk_rows: int = 250_000, max_memory_mb: int = None,
+                     columns=None):
+    """
+    Compute SummaryStats for each filter view (kwargs for apply_cli_filters(); {} for the
+    full dataset) over iter_enriched_chunks(), so the unified table is never held in
+    memory. The resulting summaries are identical to the in-memory path. Returns None if
+    the source data cannot be loaded.
+    """
+    stats = [SummaryStats() for _ in views]
+    try:
+        for chunk in iter_enriched_chunks(columns, chunk_rows, max_memory_mb):
+            for view, view_stats in zip(views, stats):
+                view_stats.merge(SummaryStats.from_frame(apply_cli_filters(chunk, **view)))
+        return stats
+    except Exception as e:
+        print(f"Error loading data: {e}")
+        return None
+
+
+def stream_failure_cube(chunk_rows: int = 250_000, max_memory_mb: int = None, columns=None):
+    """
+    The FailureCube of the enriched order table, merged chunk by chunk over
+    iter_enriched_chunks(): equal to the in-memory cube, while only one chunk of orders
+    is held at a time. Returns None if the source data cannot be loaded.
+    """
+    cube = None
+    try:
+        for chunk in iter_enriched_chunks(columns, chunk_rows, max_memory_mb):
+            part = FailureCube.from_frame(chunk)
+            cube = part if cube is None else cube.merge(part)
+        return cube
+    except Exception as e:
+        print(f"Error loading data: {e}")
+        return None
+
+
+# ---------------------------------------------------------------------------
+# Order Timelines (as-of correlation of the event feeds)
+# ---------------------------------------------------------------------------
+
+# Each stage joins one event feed onto the orders by the first of `keys` the feed has.
+# A feed keyed by order_id already names each record's order, so an order takes its own
+# latest record (LATEST_BY, as in the analysis table) with no window. A feed without an
+# order key (a city-level weather feed) is as-of joined: an order takes the event sharing
+# its key nearest its anchor time in `direction`, within `window`. The anchor is the
+# first non-missing of `anchor`, so each stage starts from the one before it. `taken`
+# columns are copied from the matched event.
+TIMELINE_STAGES = [
+    # feed              keys                   event time        taken                               anchor                                             direction   window
+    ("warehouse_logs", ('order_id',),         'picking_start',  ['picking_end', 'dispatch_time'],   ['order_date'],                                    'forward',  pd.Timedelta(days=7)),
+    ("fleet_logs",     ('order_id',),         'departure_time', ['arrival_time', 'route_code'],     ['dispatch_time', 'order_date'],                   'forward',  pd.Timedelta(days=2)),
+    ("weather",        ('city', 'order_id'),  'recorded_at',    ['weather_condition', 'traffic_condition', 'event_type'],
+                                                                                                      ['departure_time', 'dispatch_time', 'order_date'], 'backward', pd.Timedelta(hours=3)),
+]
+# Timestamp columns of the feeds, parsed while streaming them.
+EVENT_TIMES = {'picking_start', 'picking_end', 'dispatch_time', 'departure_time', 'arrival_time',
+               'recorded_at'}
+# Per-stage durations in minutes: {column: (start, end)}.
+STAGE_DURATIONS = {
+    'picking_minutes':      ('picking_start', 'picking_end'),
+    'dispatch_lag_minutes': ('picking_end', 'dispatch_time'),
+    'handover_minutes':     ('dispatch_time', 'departure_time'),
+    'transit_minutes':      ('departure_time', 'arrival_time'),
+}
+TIMELINE_ORDER_COLUMNS = ['order_id', 'city', 'order_date', 'status', 'promised_delivery_date',
+                          'actual_delivery_date']
+
+
+def _key_codes(values: pd.Series, vocabulary=None) -> np.ndarray:
+    """Integer join key of each row, -1 when missing: the value itself, or its position in `vocabulary`."""
+    if vocabulary is None:
+        return values.to_numpy(dtype=np.int64, na_value=-1)
+    return pd.Categorical(values, categories=vocabulary).codes.astype(np.int64)
+
+
+def _timestamps(values: pd.Series) -> np.ndarray:
+    return pd.to_datetime(values, errors='coerce').to_numpy(dtype='datetime64[ns]')
+
+
+class AsOfReducer:
+    """
+    Streaming as-of join. Left rows have a key code and an anchor time; feeding an event
+    log through update() in consecutive chunks leaves, for every left row, the event with
+    the same key nearest its anchor in `direction` within `window` — the match
+    pd.merge_asof() over the whole log would pick, ties included. Each chunk is merged
+    only with the left rows whose key it contains (found by binary search over the rows
+    grouped by key), and only the current winner per row is kept, so memory stays at one
+    event per left row plus the chunk and no key's events are ever cross-joined.
+    """
+
+    def __init__(self, keys: np.ndarray, anchors: np.ndarray, direction: str, window: pd.Timedelta):
+        self.size      = len(keys)
+        self.anchors   = anchors
+        self.direction = direction
+        self.window    = window
+        self.row_keys = np.where(np.isnat(anchors), -1, keys)
+        self.order    = np.argsort(self.row_keys, kind='stable')
+        self.keys     = self.row_keys[self.order]     # key codes, sorted
+        # Winner per row: its event time, and where its record is kept in `parts`.
+        worst = np.iinfo(np.int64).min if direction == 'backward' else np.iinfo(np.int64).max
+        self.best_time = np.full(self.size, worst, dtype=np.int64)
+        self.best_part = np.full(self.size, -1, dtype=np.int64)
+        self.best_at   = np.zeros(self.size, dtype=np.int64)
+        self.parts     = []
+        self.kept      = 0      # records held in parts
+        self.matched   = 0      # rows with a winner
+        self.template  = None
+
+    def _rows_with(self, keys: np.ndarray) -> np.ndarray:
+        """Left rows whose key is one of `keys`."""
+        keys = pd.unique(keys[keys >= 0])
+        lo = np.searchsorted(self.keys, keys, side='left')
+        counts = np.searchsorted(self.keys, keys, side='right') - lo
+        within = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        return self.order[np.repeat(lo, counts) + within]
+
+    def update(self, keys: np.ndarray, times: np.ndarray, records: pd.DataFrame):
+        """Fold in a chunk of events: their key codes, event times and the records to keep."""
+        if self.template is None:
+            self.template = records.iloc[:0]
+        valid = (keys >= 0) & ~np.isnat(times)
+        rows = self._rows_with(keys[valid])
+        if not len(rows):
+            return
+        left = pd.DataFrame({'_key': self.row_keys[rows], '_t': self.anchors[rows], '_row': rows})
+        events = pd.DataFrame({'_key': keys[valid], '_t': times[valid],
+                               '_at': np.flatnonzero(valid)})
+        matched = pd.merge_asof(left.sort_values('_t', kind='stable'),
+                                events.sort_values('_t', kind='stable'), on='_t', by='_key',
+                                direction=self.direction, tolerance=self.window)
+        matched = matched[matched['_at'].notna()]
+        rows, at = matched['_row'].to_numpy(), matched['_at'].to_numpy(dtype=np.int64)
+        event_time = times[at].view(np.int64)
+        # A later chunk wins backward ties and loses forward ones, as in one sorted log.
+        if self.direction == 'backward':
+            better = event_time >= self.best_time[rows]
+        else:
+            better = event_time < self.best_time[rows]
+        rows, at = rows[better], at[better]
+        self.matched += int(np.count_nonzero(self.best_part[rows] < 0))
+        self.best_time[rows] = event_time[better]
+        self.best_part[rows] = len(self.parts)
+        self.best_at[rows]   = np.arange(len(rows))
+        self.parts.append(records.iloc[at].reset_index(drop=True))
+        self.kept += len(rows)
+        if self.kept > 2 * max(self.matched, len(records)):
+            self._compact()
+
+    def _winners(self):
+        """Rows with a match and their records, in row order."""
+        rows = np.flatnonzero(self.best_part >= 0)
+        pieces = []
+        for k, part in enumerate(self.parts):
+            mine = rows[self.best_part[rows] == k]
+            pieces.append(part.iloc[self.best_at[mine]].assign(_row=mine))
+        if not pieces:
+            return rows, self.template
+        winners = _concat_frames(pieces).sort_values('_row', kind='stable', ignore_index=True)
+        return winners.pop('_row').to_numpy(), winners
+
+    def _compact(self):
+        """Drop the kept records that no longer win for any row."""
+        rows, winners = self._winners()
+        self.parts, self.kept = [winners], len(winners)
+        self.best_part[rows] = 0
+        self.best_at[rows]   = np.arange(len(rows))
+
+    def result(self) -> pd.DataFrame:
+        """The matched record for every left row (all missing where nothing matched)."""
+        if self.template is None:
+            return pd.DataFrame(index=range(self.size))
+        rows, winners = self._winners()
+        return winners.set_axis(rows).reindex(range(self.size))
+
+
+def _feed_key(name: str, keys: tuple) -> str:
+    """The first of `keys` that the feed's CSV has."""
+    header = pd.read_csv(os.path.join(DATA_DIR, SOURCE_FILES[name]), nrows=0).columns
+    return next((key for key in keys if key in header), keys[-1])
+
+
+def _latest_records(name: str, columns: list, order_ids: pd.Series, chunk_rows: int) -> pd.DataFrame:
+    """Each order's latest record in feed `name` (LATEST_BY), row-aligned with `order_ids`."""
+    ts_col  = LATEST_BY[name]
+    wanted  = pd.unique(order_ids.dropna())
+    reducer = LatestRecordReducer(ts_col, columns)
+    for chunk in iter_table_chunks(name, ['order_id', ts_col] + columns, chunk_rows):
+        for col in EVENT_TIMES.intersection(chunk.columns):
+            chunk[col] = _timestamps(chunk[col])
+        reducer.update(chunk[chunk['order_id'].isin(wanted)])
+    latest = reducer.result()
+    return pd.DataFrame({'order_id': order_ids}).merge(latest, on='order_id', how='left')
+
+
+@traced("build_timeline")
+def build_timeline(orders: pd.DataFrame = None, chunk_rows: int = 250_000) -> pd.DataFrame:
+    """
+    Per-order timeline: the warehouse pick, fleet trip and weather reading of each order
+    (its own latest record, or the as-of match for a feed without an order key; see
+    TIMELINE_STAGES), with STAGE_DURATIONS and the is_late/is_failed flags.
+    `orders` (default: all, read with TIMELINE_ORDER_COLUMNS) may be pre-filtered. The
+    feeds are streamed in chunks of `chunk_rows`, so only the orders table is held whole.
+    """
+    if orders is None:
+        orders = read_table("orders", TIMELINE_ORDER_COLUMNS)
+    timeline = orders.reset_index(drop=True)
+    for col in ORDER_DATE_COLUMNS:
+        if col in timeline.columns:
+            timeline[col] = timeline[col].astype('datetime64[ns]')
+
+    for name, keys, on, taken, anchor, direction, window in TIMELINE_STAGES:
+        key = _feed_key(name, keys)
+        with span(f"timeline:{name}", rows_in=len(timeline)) as sp:
+            if key == 'order_id':
+                matched = _latest_records(name, [on] + taken, timeline['order_id'], chunk_rows)
+            else:
+                vocabulary = timeline[key].cat.categories
+                anchors = timeline[anchor[0]]
+                for col in anchor[1:]:
+                    anchors = anchors.fillna(timeline[col])
+                reducer = AsOfReducer(_key_codes(timeline[key], vocabulary),
+                                      anchors.to_numpy(dtype='datetime64[ns]'), direction, window)
+                for chunk in iter_table_chunks(name, [key, on] + taken, chunk_rows):
+                    for col in EVENT_TIMES.intersection(chunk.columns):
+                        chunk[col] = _timestamps(chunk[col])
+                    reducer.update(_key_codes(chunk[key], vocabulary), chunk[on].to_numpy(),
+                                   chunk[[on] + taken])
+                matched = reducer.result()
+            sp.set(rows_out=int(matched[on].notna().sum()) if on in matched else 0)
+        for col in [on] + taken:
+            timeline[col] = matched[col] if col in matched else pd.Series(pd.NA, index=timeline.index)
+
+    for col, (start, end) in STAGE_DURATIONS.items():
+        timeline[col] = (timeline[end] - timeline[start]).dt.total_seconds() / 60
+    return assess_performance(timeline)
+
+
+def format_stage_report(timeline: pd.DataFrame) -> str:
+    """Match rates of the timeline stages, stage durations and late/failed share by weather."""
+    total = len(timeline)
+    if total == 0:
+        return "No orders found matching the given criteria."
+    problem = timeline['is_late'] | timeline['is_failed']
+    lines = [f"Order timelines for {total} orders:"]
+    for name, keys, on, _, anchor, direction, window in TIMELINE_STAGES:
+        matched = int(timeline[on].notna().sum())
+        if _feed_key(name, keys) == 'order_id':
+            rule = f"the order's latest record by {LATEST_BY[name]}"
+        else:
+            side = "after" if direction == 'forward' else "before"
+            rule = f"{on} within {window / pd.Timedelta(hours=1):g}h {side} {anchor[0]}"
+        lines.append(f"  • {name}: {matched} matched ({matched / total * 100:.1f}%), "
+                     f"{total - matched} orders with no record — {rule}")
+
+    lines.append(f"\n{'Stage (minutes)':<22}{'orders':>8}{'median':>10}{'p90':>10}"
+                 f"{'late/failed':>13}{'on time':>10}")
+    for col in STAGE_DURATIONS:
+        minutes = timeline[col]
+        known = minutes.notna()
+        if not known.any():
+            lines.append(f"{col[:-8]:<22}{0:>8}")
+            continue
+        cells = [*minutes[known].quantile([0.5, 0.9]), minutes[known & problem].median(),
+                 minutes[known & ~problem].median()]
+        cells = ["-" if pd.isna(v) else f"{v:.1f}" for v in cells]
+        lines.append(f"{col[:-8]:<22}{int(known.sum()):>8}{cells[0]:>10}{cells[1]:>10}"
+                     f"{cells[2]:>13}{cells[3]:>10}")
+
+    weather = timeline['weather_condition']
+    if weather.notna().any():
+        lines.append("\nLate or failed share by weather at departure:")
+        shares = problem.groupby(weather, observed=True).agg(['mean', 'size'])
+        for cond, row in shares.sort_values('mean', ascending=False).iterrows():
+            lines.append(f"  • {cond}: {row['mean'] * 100:.1f}% of {int(row['size'])} orders")
+    return "\n".join(lines)
+
+
+# ---------------------------------------------------------------------------
+# LLM Response Cache
+# ---------------------------------------------------------------------------
+
+# Bump the version of a prompt whenever its template changes, so stale answers are not served.
+PROMPT_VERSIONS = {"intent": 2, "narrative": 1}
+# Seconds an answer stays valid. Intent parsing runs at temperature 0 and only depends on
+# its inputs; narratives are sampled, so they are refreshed more often.
+LLM_CACHE_TTL = {"intent": 30 * 86400, "narrative": 86400}
+LLM_CACHE_MAX_ENTRIES = int(os.environ.get("DELIVERY_LLM_CACHE_ENTRIES", 2000))
+LLM_CACHE_PATH = os.path.join(CACHE_DIR, "llm_cache.sqlite")
+
+
+class LLMResponseCache:
+    """
+    SQLite-backed store of LLM responses keyed by a hash of the model, prompt kind and
+    version, temperature and rendered prompt. Entries expire after their TTL and the
+    least recently used ones are evicted beyond `max_entries`. Lookups and stores are
+    best-effort: a cache that cannot be read or written behaves as a miss.
+    """
+
+    def __init__(self, path: str = LLM_CACHE_PATH, max_entries: int = LLM_CACHE_MAX_ENTRIES):
+        self.path        = path
+        self.max_entries = max_entries
+        self.hits        = 0
+        self.misses      = 0
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._connect() as db:
+            db.execute("CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, "
+                       "response TEXT NOT NULL, expires REAL NOT NULL, last_used REAL NOT NULL)")
+            db.execute("CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+
+    def _connect(self):
+        # One short-lived connection per operation keeps the cache usable from any thread.
+        return sqlite3.connect(self.path, timeout=5)
+
+    def _count(self, db, name: str):
+        db.execute("INSERT INTO counters VALUES (?, 1) "
+                   "ON CONFLICT(name) DO UPDATE SET value = value + 1", (name,))
+
+    def get(self, key: str):
+        """Return the cached response for `key`, or None on a miss."""
+        now = time.time()
+        try:
+            with self._connect() as db:
+                row = db.execute("SELECT response, expires FROM responses WHERE key = ?",
+                                 (key,)).fetchone()
+                if row and row[1] > now:
+                    db.execute("UPDATE responses SET last_used = ? WHERE key = ?", (now, key))
+                    self._count(db, "hits")
+                    self.hits += 1
+                    return row[0]
+                if row:
+                    db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._count(db, "misses")
+        except sqlite3.Error as e:
+            print(f"Warning: LLM cache unavailable ({e}).")
+        self.misses += 1
+        return None
+
+    def put(self, key: str, response: str, ttl: float):
+        """Store `response` under `key` for `ttl` seconds, then evict expired and LRU entries."""
+        now = time.time()
+        try:
+            with self._connect() as db:
+                db.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?)",
+                           (key, response, now + ttl, now))
+                db.execute("DELETE FROM responses WHERE expires <= ?", (now,))
+                db.execute("DELETE FROM responses WHERE key IN (SELECT key FROM responses "
+                           "ORDER BY last_used DESC LIMIT -1 OFFSET ?)", (self.max_entries,))
+        except sqlite3.Error as e:
+            print(f"Warning: LLM cache unavailable ({e}).")
+
+    def stats(self) -> dict:
+        """Hit/miss counts for this process and across all runs, plus the entry count."""
+        stats = {"hits": self.hits, "misses": self.misses}
+        try:
+            with self._connect() as db:
+                totals = dict(db.execute("SELECT name, value FROM counters").fetchall())
+                stats["entries"] = db.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        except sqlite3.Error:
+            totals = {}
+        stats["total_hits"]   = totals.get("hits", 0)
+        stats["total_misses"] = totals.get("misses", 0)
+        return stats
+
+
+_llm_cache = None
+_llm_cache_enabled = True
+
+
+def set_llm_cache_enabled(enabled: bool):
+    """Turn the LLM response cache on or off for this process (--no_cache)."""
+    global _llm_cache_enabled
+    _llm_cache_enabled = enabled
+
+
+def get_llm_cache():
+    """Return the shared LLMResponseCache, or None when caching is disabled or unavailable."""
+    global _llm_cache
+    if not _llm_cache_enabled:
+        return None
+    if _llm_cache is None:
+        try:
+            _llm_cache = LLMResponseCache()
+        except (OSError, sqlite3.Error) as e:
+            print(f"Warning: LLM cache disabled ({e}).")
+            set_llm_cache_enabled(False)
+    return _llm_cache
+
+
+def llm_cache_key(kind: str, prompt: str, temperature: float, config: dict) -> str:
+    """Cache key of one request; the rendered prompt carries every input the answer depends on."""
+    model = GEMINI_MODEL if FAKE_LLM_LATENCY is None else "offline"
+    payload = {"model": model, "kind": kind, "version": PROMPT_VERSIONS[kind],
+               "temperature": temperature, "config": config, "prompt": prompt}
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def llm_generate(kind: str, prompt: str, temperature: float, **config) -> str:
+    """
+    Send `prompt` to Gemini and return the response text, answering repeated requests
+    from the response cache. `kind` selects the prompt version and TTL.
+    """
+    with span(f"llm:{kind}", prompt_chars=len(prompt)) as sp:
+        cache = get_llm_cache()
+        key = llm_cache_key(kind, prompt, temperature, config)
+        if cache is not None:
+            cached = cache.get(key)
+            if cached is not None:
+                sp.set(response_chars=len(cached), cache_hits=1)
+                return cached
+
+        client = get_llm_client()
+        response = client.models.generate_content(
+            model=GEMINI_MODEL,
+            contents=prompt,
+            config=types.GenerateContentConfig(temperature=temperature, **config),
+        )
+        sp.set(response_chars=len(response.text or ""), cache_hits=0)
+        if cache is not None and response.text:
+            cache.put(key, response.text, LLM_CACHE_TTL[kind])
+        return response.text
+
+
+# ---------------------------------------------------------------------------
+# LLM-Powered Intent Parsing
+# ---------------------------------------------------------------------------
+
+def llm_parse_intent(question: str, entities: dict) -> dict:
+    """
+    Ask Gemini to extract structured intent from a free-form user question.
+    `entities` is the dict produced by extract_entities().
+    Returns a dict with keys: action, order_id, cities, group_by, groups, filters, time_range.
+    """
+    cities     = entities['cities']
+    clients    = entities['clients']
+    warehouses = entities['warehouses']
+    partners   = entities.get('partners', [])
+
+    prompt = f"""You are an intent-extraction assistant for a logistics delivery analytics system.
+
+Available entities in the dataset:
+- Cities (delivery): {', '.join(cities[:30])}
+- Client names: {', '.join(clients[:30])}
+- Warehouse names: {', '.join(warehouses)}
+- Delivery partner companies: {', '.join(partners)}
+
+Parse the user's question and return a JSON object with EXACTLY these fields:
+{{
+  "action": "<one of: query_order | compare_cities | compare_groups | filter_analysis | show_insights>",
+  "order_id": <integer order ID if a specific order is mentioned, else null>,
+  "cities": [<city1>, <city2>, ...] if comparing cities, else null,
+  "group_by": "<city | client | warehouse | partner> if comparing groups, else null",
+  "groups": [<name1>, <name2>, ...] naming the groups compared, or null to compare all of them,
+  "filters": {{
+    "city": "<city name if a single city is mentioned, else null>",
+    "client": "<client name if a client is mentioned, else null>",
+    "warehouse": "<warehouse name if a warehouse is mentioned, else null>"
+  }},
+  "time_range": "<description of any time period mentioned, e.g. 'last week', 'August', else null>"
+}}
+
+Rules:
+- Use action=query_order when a specific order number is asked about.
+- Use action=compare_cities when the question asks to compare two or more named cities.
+- Use action=compare_groups when it compares clients, warehouses or delivery partners, or
+  asks to compare/rank all cities, clients, warehouses or partners (groups=null).
+- Use action=filter_analysis when the question is about a specific city, client, or warehouse.
+- Use action=show_insights for general/aggregate questions.
+- Match city/client/warehouse/partner names case-insensitively to the lists above; use the canonical name.
+- Return ONLY valid JSON, no markdown fences or extra text.
+
+User question: {question}"""
+
+    return json.loads(llm_generate("intent", prompt, temperature=0,
+                                   response_mime_type="application/json"))
+
+
+# ---------------------------------------------------------------------------
+# Local Intent Matching (LLM fast-path)
+# ---------------------------------------------------------------------------
+
+# Intents scoring below this confidence are handed to llm_parse_intent().
+LOCAL_INTENT_THRESHOLD = 0.8
+
+# "#N" is an order id only right after "order"; "Warehouse #1" is a name, not order 1.
+ORDER_ID_PATTERN = re.compile(r"\border(?:s)?\s*(?:id|no\.?|number)?\s*#?\s*(\d+)\b", re.I)
+COMPARE_PATTERN = re.compile(
+    r"\b(?:compared?|comparison|comparing|versus|vs\.?|difference between|rank|ranking)\b", re.I)
+# Words naming a whole dimension, for "compare all warehouses"-style questions.
+DIMENSION_WORDS = {"city": "city", "cities": "city", "client": "client", "clients": "client",
+                   "warehouse": "warehouse", "warehouses": "warehouse",
+                   "partner": "partner", "partners": "partner"}
+AGGREGATE_PATTERN = re.compile(
+    r"\b(?:overall|top|main|most|common|all|general|summary|insights?|patterns?|biggest|overview)\b", re.I)
+# ISO dates and month names (with their year) come before the bare year, so "2025-08-01"
+# and "August 2025" are not read as the whole of 2025.
+TIME_RANGE_PATTERN = re.compile(
+    r"\b(?:(?:last|past|this|previous)\s+(?:\d+\s+)?(?:days?|weeks?|months?|quarters?|years?)|"
+    r"yesterday|today|(?:19|20)\d{2}-\d{2}(?:-\d{2})?|"
+    r"(?:(?:in|during)\s+may|january|february|march|april|june|july|august|september|october|"
+    r"november|december)(?:\s+(?:19|20)\d{2})?|(?:19|20)\d{2})\b", re.I)
+# Words right before or after a period that make it open-ended ("after August"), partial
+# ("first week of August") or one side of a comparison over time ("compared to last month").
+# A single TIME_RANGE_PATTERN match cannot express these, nor dates in other formats
+# (OTHER_DATE_PATTERN); such questions go to the LLM.
+TIME_QUALIFIER_PATTERN = re.compile(
+    r"\b(?:after|since|before|until|till|between|through|from|by|"
+    r"(?:compared|comparing)\s+(?:to|with)|vs\.?|versus|against|than|"
+    r"(?:first|second|third|fourth|last|beginning|start|end|middle|half)"
+    r"(?:\s+(?:week|weeks|half|fortnight|days?))?\s+of)\s+(?:the\s+)?$|\b(?:early|mid)[\s-]+$", re.I)
+TIME_OPEN_END_PATTERN = re.compile(r"^\s*(?:onwards?|and (?:after|later|before|earlier)|or (?:later|earlier))\b", re.I)
+OTHER_DATE_PATTERN = re.compile(
+    r"\b\d{1,4}[/.-]\d{1,2}(?:[/.-]\d{1,4})?\b|\b\d{1,2}(?:st|nd|rd|th)\b|\b(?:19|20)\d{2}\b", re.I)
+# Concepts the local rules cannot map onto the data; such questions go to the LLM.
+UNRESOLVED_PATTERN = re.compile(r"\b(?:festivals?|holidays?|diwali|seasons?|weekends?|periods?|events?|new client)\b", re.I)
+# Question words never taken as (fuzzy or partial) entity names.
+INTENT_STOP_WORDS = {
+    "what", "which", "when", "where", "were", "was", "did", "does", "why", "how", "the", "and",
+    "for", "with", "from", "order", "orders", "delivery", "deliveries", "delivered", "delayed",
+    "delay", "delays", "late", "fail", "failed", "failing", "failure", "failures", "reason",
+    "reasons", "cause", "causes", "between", "compare", "compared", "client", "clients", "city", "cities",
+    "warehouse", "warehouses", "last", "week", "month", "show", "many", "most", "top", "main",
+    "state", "states", "region", "partner", "partners", "rank", "ranking",
+}
+
+
+def _intent_tokens(text: str) -> list:
+    return re.findall(r"[a-z0-9]+", text.casefold())
+
+
+class IntentMatcher:
+    """
+    Resolve common questions to the llm_parse_intent() schema without a network call.
+
+    City, client, warehouse and partner names are indexed in a word trie so every
+    occurrence in a question is found in one left-to-right pass (longest name wins). A single word that
+    belongs to exactly one name also matches it, and misspelt words are matched against
+    the name vocabulary with difflib. match() returns (intent, confidence): 1.0 for
+    exact names, less for partial or fuzzy ones, and low when the question needs
+    something the rules do not understand, such as several orders or an open-ended period.
+    """
+
+    KINDS = {"cities": "city", "clients": "client", "warehouses": "warehouse", "partners": "partner"}
+
+    def __init__(self, entities: dict):
+        self.trie     = {}
+        self.partial  = {}   # token -> [(kind, name)] for every name containing it
+        for key, kind in self.KINDS.items():
+            for name in entities.get(key, []):
+                tokens = _intent_tokens(name)
+                if not tokens:
+                    continue
+                node = self.trie
+                for token in tokens:
+                    node = node.setdefault(token, {})
+                node.setdefault(None, []).append((kind, name))
+                for token in set(tokens):
+                    self.partial.setdefault(token, []).append((kind, name))
+        self.vocabulary = [t for t in self.partial if len(t) >= 4 and t not in INTENT_STOP_WORDS]
+
+    def _scan(self, tokens: list) -> list:
+        """Return [(position, kind, name, score)] for the entity names found in `tokens`."""
+        found, i = [], 0
+        while i < len(tokens):
+            node, end, hits = self.trie, i, None
+            for j in range(i, len(tokens)):
+                node = node.get(tokens[j])
+                if node is None:
+                    break
+                if None in node:
+                    end, hits = j + 1, node[None]
+            if hits and (end - i > 1 or tokens[i] not in INTENT_STOP_WORDS):
+                found.extend((i, kind, name, 1.0) for kind, name in hits)
+                i = end
+                continue
+            found.extend(self._loose(tokens, i))
+            i += 1
+        return found
+
+    def _loose(self, tokens: list, i: int) -> list:
+        """Partial or fuzzy matches of the single word tokens[i]."""
+        token = tokens[i]
+        if len(token) < 4 or token in INTENT_STOP_WORDS or token.isdigit():
+            return []
+        score = 0.9
+        if token not in self.partial:
+            close = difflib.get_close_matches(token, self.vocabulary, n=1, cutoff=0.82)
+            if not close:
+                return []
+            score = difflib.SequenceMatcher(None, token, close[0]).ratio()
+            token = close[0]
+        names = self.partial[token]
+        if len(names) == 1:
+            kind, name = names[0]
+            return [(i, kind, name, score)]
+        kinds = {kind for kind, _ in names}
+        if kinds == {"client"} and i and tokens[i - 1] in ("client", "clients"):
+            # "Client Saini" names several clients; the client filter is a substring match,
+            # so the word itself selects all of them.
+            word = next(w for w in re.findall(r"[A-Za-z0-9]+", names[0][1]) if w.casefold() == token)
+            return [(i, "client", word, score)]
+        return []
+
+    def match(self, question: str):
+        """Return (intent, confidence) for `question`."""
+        intent = {"action": "show_insights", "order_id": None, "cities": None, "group_by": None,
+                  "groups": None, "filters": {"city": None, "client": None, "warehouse": None},
+                  "time_range": None}
+        spans = list(TIME_RANGE_PATTERN.finditer(question))
+        if spans:
+            intent["time_range"] = spans[0].group(0)
+        if UNRESOLVED_PATTERN.search(question):
+            return intent, 0.3
+
+        orders = {int(n) for n in ORDER_ID_PATTERN.findall(question)}
+        if len(orders) > 1:
+            return intent, 0.3
+        if orders:
+            intent.update(action="query_order", order_id=orders.pop())
+            return intent, 1.0
+        if spans and (len(spans) > 1 or OTHER_DATE_PATTERN.search(TIME_RANGE_PATTERN.sub(" ", question))
+                      or any(TIME_QUALIFIER_PATTERN.search(question[:m.start()])
+                             or TIME_OPEN_END_PATTERN.match(question[m.end():]) for m in spans)):
+            return intent, 0.3
+
+        tokens  = _intent_tokens(question)
+        matches = {}
+        for _, kind, name, score in sorted(self._scan(tokens)):
+            matches.setdefault(kind, {}).setdefault(name, score)
+        scores = [score for names in matches.values() for score in names.values()]
+        confidence = min(scores, default=1.0)
+        cities = list(matches.get("city", {}))
+
+        if COMPARE_PATTERN.search(question):
+            if len(matches) > 1:
+                return intent, 0.3
+            if len(cities) >= 2:
+                intent.update(action="compare_cities", cities=cities)
+                return intent, confidence
+            if matches:
+                kind, names = next(iter(matches.items()))
+                if len(names) < 2:
+                    return intent, 0.3
+                intent.update(action="compare_groups", group_by=kind, groups=list(names))
+                return intent, confidence
+            dimensions = {DIMENSION_WORDS[t] for t in tokens if t in DIMENSION_WORDS}
+            if len(dimensions) != 1:
+                return intent, 0.3
+            intent.update(action="compare_groups", group_by=dimensions.pop())
+            return intent, 0.9
+
+        if not matches:
+            return intent, 0.9 if AGGREGATE_PATTERN.search(question) else 0.5
+
+        if any(len(names) > 1 for names in matches.values()) or "partner" in matches:
+            return intent, 0.3
+        if cities and "warehouse" not in matches and {"warehouse", "warehouses"} & set(tokens):
+            # "warehouses in Mumbai" could mean the warehouse city rather than the delivery city.
+            return intent, 0.6
+        for kind, names in matches.items():
+            intent["filters"][kind] = next(iter(names))
+        intent["action"] = "filter_analysis"
+        return intent, confidence
+
+
+_intent_matcher = (None, None)
+
+
+def local_intent(question: str, entities: dict, threshold: float = LOCAL_INTENT_THRESHOLD):
+    """IntentMatcher's intent for `question` if it is confident enough, else None."""
+    global _intent_matcher
+    if _intent_matcher[0] is not entities:
+        _intent_matcher = (entities, IntentMatcher(entities))
+    with span("intent_match") as sp:
+        intent, confidence = _intent_matcher[1].match(question)
+        sp.set(local=int(confidence >= threshold))
+    return intent if confidence >= threshold else None
+
+
+@traced("parse_intent")
+def parse_intent(question: str, entities: dict, threshold: float = LOCAL_INTENT_THRESHOLD) -> dict:
+    """
+    Intent for `question`: resolved locally by IntentMatcher when it is confident enough,
+    otherwise by llm_parse_intent(). Same schema either way.
+    """
+    return local_intent(question, entities, threshold) or llm_parse_intent(question, entities)
+
+
+# ---------------------------------------------------------------------------
+# LLM-Powered Narrative Generation
+# ---------------------------------------------------------------------------
+
+def llm_generate_narrative(question: str, data_summary: str, context: str) -> str:
+    """
+    Ask Gemini to turn a data summary into a clear, human-readable analysis.
+    """
+    prompt = f"""You are an expert logistics analyst providing human-readable insights to operations managers.
+
+Your response must:
+1. Directly answer the question in plain English.
+2. Highlight the key root causes and patterns with specific numbers.
+3. Call out the most critical issues in order of severity.
+4. End with 2-3 concise, actionable recommendations.
+5. Use short paragraphs and bullet points - NO raw tables, NO SQL, NO markdown code blocks.
+6. Keep the tone professional but conversational.
+
+Question: {question}
+
+Context: {context}
+
+Data Summary:
+{data_summary}
+
+Please provide a thorough, human-readable analysis."""
+
+    return llm_generate("narrative", prompt, temperature=0.3)
+
+
+# ---------------------------------------------------------------------------
+# Entity Indexes
+# ---------------------------------------------------------------------------
+
+# Columns the city / client / warehouse filters look up.
+INDEXED_COLUMNS = ['city', 'client_name', 'warehouse_name', 'warehouse_city']
+REGEX_SYNTAX = set(".^$*+?{}[]\\|()")
+
+
+def _trigrams(text: str) -> set:
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class EntityIndex:
+    """
+    Inverted indexes over the entity columns of a table (a FailureCube's members). For each
+    column, the row positions of every distinct value are stored grouped by value (`rows`,
+    with `bounds` delimiting each value's run; `codes` holds each row's value), and the
+    exact and lower-cased values map to those value codes. Client names also get a trigram index, so a substring search
+    only checks the names that share all of the needle's trigrams. Lookups return sorted
+    row positions, so combining filters is an intersection of position arrays.
+    """
+
+    def __init__(self, df: pd.DataFrame):
+        self.size    = len(df)
+        self.columns = {}
+        for col in INDEXED_COLUMNS:
+            if col not in df.columns:
+                continue
+            codes, values = pd.factorize(df[col])
+            rows  = np.argsort(codes, kind='stable')
+            names = [str(v) for v in values]
+            lower = collections.defaultdict(list)
+            for code, name in enumerate(names):
+                lower[name.lower()].append(code)
+            self.columns[col] = {
+                "names": names, "exact": {name: code for code, name in enumerate(names)},
+                "lower": dict(lower), "codes": codes, "rows": rows,
+                "bounds": np.searchsorted(codes[rows], np.arange(len(names) + 1))}
+        self.trigrams = collections.defaultdict(set)
+        for code, name in enumerate(self.columns.get('client_name', {}).get("names", [])):
+            for gram in _trigrams(name.lower()):
+                self.trigrams[gram].add(code)
+
+    def _rows(self, col: str, codes) -> np.ndarray:
+        """Sorted row positions holding any of the value `codes` of `col`."""
+        index = self.columns[col]
+        if len(codes) == 1:
+            return index["rows"][index["bounds"][codes[0]]:index["bounds"][codes[0] + 1]]
+        wanted = np.zeros(len(index["names"]) + 1, dtype=bool)     # last slot: missing (-1)
+        wanted[codes] = True
+        return np.flatnonzero(wanted[index["codes"]])
+
+    def equal(self, col: str, value: str, ignore_case: bool = False) -> np.ndarray:
+        """Rows whose `col` equals `value` (`col == value`, or compared lower-cased)."""
+        index = self.columns[col]
+        if ignore_case:
+            return self._rows(col, index["lower"].get(value.lower(), []))
+        code = index["exact"].get(value)
+        return self._rows(col, [] if code is None else [code])
+
+    def contains(self, col: str, pattern: str) -> np.ndarray:
+        """
+        Rows whose `col` matches `pattern` like str.contains(pattern, case=False): a
+        regular expression when it uses regex syntax, a substring otherwise.
+        """
+        names = self.columns[col]["names"]
+        if REGEX_SYNTAX & set(pattern):
+            regex = re.compile(pattern, re.IGNORECASE)
+            return self._rows(col, [c for c, name in enumerate(names) if regex.search(name)])
+        needle = pattern.lower()
+        grams = _trigrams(needle)
+        candidates = range(len(names))
+        if col == 'client_name' and grams:
+            candidates = sorted(set.intersection(*(self.trigrams.get(g, set()) for g in grams)))
+        return self._rows(col, [c for c in candidates if needle in names[c].lower()])
+
+
+def _equals(series: pd.Series, value: str, ignore_case: bool) -> pd.Series:
+    """series == value, or compared lower-cased; a categorical only lower-cases its categories."""
+    if not ignore_case:
+        return series == value
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        categories = series.cat.categories
+        return series.isin(categories[categories.str.lower() == value.lower()])
+    return series.str.lower() == value.lower()
+
+
+def _intersect_sorted(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """Intersection of two sorted position arrays, searching the smaller in the larger."""
+    if len(a) > len(b):
+        a, b = b, a
+    if not len(a):
+        return a
+    return a[b[np.searchsorted(b, a).clip(max=len(b) - 1)] == a]
+
+
+def filter_entities(view, city=None, client=None, warehouse=None, ignore_case: bool = False):
+    """
+    Rows of `view` (an enriched frame or FailureCube) in `city`, for a client whose name
+    contains `client` (case-insensitive, regex allowed) and shipped from `warehouse` (name
+    or city). City and warehouse compare exactly, or case-insensitively with ignore_case.
+    A cube with an EntityIndex answers from the index; anything else is scanned (a
+    cube's members, as clients and warehouses are member columns).
+    """
+    index = getattr(view, "entity_index", None)
+    if index is None:
+        if city:
+            view = view[_equals(view['city'], city, ignore_case)]
+        if not (client or warehouse):
+            return view
+        cube  = isinstance(view, FailureCube)
+        table = view.member_frame(['client_name', 'warehouse_city', 'warehouse_name']) if cube else view
+        keep  = pd.Series(True, index=table.index)
+        if client:
+            keep &= table['client_name'].str.contains(client, case=False, na=False)
+        if warehouse:
+            keep &= (_equals(table['warehouse_city'], warehouse, ignore_case) |
+                     _equals(table['warehouse_name'], warehouse, ignore_case))
+        return view.select(table.index.to_numpy()[keep.to_numpy()]) if cube else view[keep]
+
+    with span("filter_entities", rows_in=len(view.cells)) as sp:
+        matches = []
+        if city:
+            matches.append(index.equal('city', city, ignore_case))
+        if client:
+            matches.append(index.contains('client_name', client))
+        if warehouse:
+            matches.append(np.union1d(index.equal('warehouse_city', warehouse, ignore_case),
+                                      index.equal('warehouse_name', warehouse, ignore_case)))
+        if not matches:
+            return view
+        view = view.select(functools.reduce(_intersect_sorted, matches))
+        sp.set(rows_out=len(view.cells))
+        return view
+
+
+# ---------------------------------------------------------------------------
+# Feedback Analytics (term index and complaint themes)
+# ---------------------------------------------------------------------------
+
+# Words left out of feedback terms. PHRASE_ONLY_WORDS are not terms on their own but
+# still start or end a phrase ("no update", "on time").
+FEEDBACK_STOP_WORDS = {
+    "a", "an", "the", "and", "but", "or", "so", "was", "were", "is", "are", "be", "been", "to",
+    "of", "for", "from", "at", "by", "in", "with", "my", "our", "your", "it", "its", "this",
+    "that", "i", "we", "you", "they", "he", "she", "me", "us", "had", "has", "have", "due",
+    "very", "too", "just", "again", "still", "also", "as",
+}
+PHRASE_ONLY_WORDS = {"no", "not", "on", "off"}
+# Feedback themes: {theme: normalized terms and phrases}. Feedback counts towards every
+# complaint theme one of its terms belongs to, and towards POSITIVE_THEME only when it is
+# unmixed (no complaint theme, no MIXED_FEEDBACK_PATTERN); feedback matching no theme is
+# OTHER_THEME.
+POSITIVE_THEME = "Positive experience"
+FEEDBACK_THEMES = {
+    "Late or delayed delivery":        {"late", "delay", "delayed", "slow", "wait", "waiting"},
+    "No updates or communication":     {"no update", "update", "tracking", "call", "contact",
+                                        "unreachable", "informed", "response"},
+    "Missed delivery / wrong address": {"never", "never came", "wrong address", "address", "missed",
+                                        "missing", "lost", "not delivered"},
+    "Cancelled / out of stock":        {"cancelled", "canceled", "cancel", "stock", "refund"},
+    "Damaged package":                 {"damaged", "broken", "torn", "leaking", "spilled"},
+    "Driver behaviour":                {"rude", "unprofessional", "behaviour", "behavior", "misbehaved"},
+    POSITIVE_THEME:                    {"good", "great", "excellent", "on time", "polite", "fast",
+                                        "friendly", "happy"},
+}
+# A contrast ("polite but late") or a negated praise word ("not on time") makes feedback mixed.
+MIXED_FEEDBACK_PATTERN = re.compile(
+    r"\b(?:but|however|although|though|yet)\b|"
+    r"\b(?:not|never|hardly|wasn't|isn't|weren't)\s+(?:very\s+|so\s+|really\s+)?"
+    r"(?:good|great|excellent|on time|polite|fast|friendly|happy)\b", re.I)
+OTHER_THEME = "Other feedback"
+FEEDBACK_TOP_THEMES  = 5
+FEEDBACK_TOP_PHRASES = 5
+
+
+def _feedback_word(word: str) -> str:
+    """Light normalization: possessives and plural -s dropped ("updates" → "update")."""
+    word = word.strip("'").removesuffix("'s")
+    if len(word) > 3 and word.endswith("s") and not word.endswith(("ss", "us", "is")):
+        return word[:-1]
+    return word
+
+
+def feedback_terms(text: str) -> list:
+    """Normalized words and two-word phrases of one feedback text; phrases stay within a clause."""
+    terms = []
+    for clause in re.split(r"[.,;:!?()]+", text.lower()):
+        words = [w if w in FEEDBACK_STOP_WORDS else _feedback_word(w)
+                 for w in re.findall(r"[a-z0-9']+", clause)]
+        terms += [w for w in words if len(w) > 2 and w not in FEEDBACK_STOP_WORDS
+                  and w not in PHRASE_ONLY_WORDS]
+        terms += [f"{a} {b}" for a, b in zip(words, words[1:])
+                  if a not in FEEDBACK_STOP_WORDS and b not in FEEDBACK_STOP_WORDS]
+    return terms
+
+
+class FeedbackIndex:
+    """
+    Term index over the distinct feedback texts. Each text is tokenized once
+    (feedback_terms()) into a sparse text × term count matrix — CSR `indptr`/`indices`/
+    `counts` over `terms` — and mapped onto the FEEDBACK_THEMES its terms touch
+    (`text_themes`), complaints taking precedence over praise. `codes` keys the index by order: the text code of each row of the
+    frame it was built from (-1 without feedback). A summary reduces its per-text order
+    counts through the matrix (themes(), phrases()) instead of re-reading any text.
+    """
+
+    def __init__(self, texts, terms, indptr, indices, counts, codes=None):
+        self.texts   = list(texts)
+        self.terms   = list(terms)
+        self.indptr  = indptr
+        self.indices = indices
+        self.counts  = counts
+        self.codes   = codes
+        self.lookup  = {text: code for code, text in enumerate(self.texts)}
+        self.theme_names = list(FEEDBACK_THEMES) + [OTHER_THEME]
+        theme_of = {term: k for k, terms in enumerate(FEEDBACK_THEMES.values()) for term in terms}
+        term_theme = np.array([theme_of.get(term, -1) for term in self.terms], dtype=np.int64)
+        rows = np.repeat(np.arange(len(self.texts)), np.diff(indptr))
+        hit  = term_theme[indices] >= 0 if len(indices) else np.zeros(0, dtype=bool)
+        self.text_themes = np.zeros((len(self.texts), len(self.theme_names)), dtype=bool)
+        self.text_themes[rows[hit], term_theme[indices[hit]]] = True
+        positive = self.theme_names.index(POSITIVE_THEME)
+        complaint = np.delete(self.text_themes[:, :-1], positive, axis=1).any(axis=1)
+        mixed = np.array([bool(MIXED_FEEDBACK_PATTERN.search(text)) for text in self.texts], dtype=bool)
+        self.text_themes[complaint | mixed, positive] = False
+        self.text_themes[~self.text_themes.any(axis=1), -1] = True
+
+    @classmethod
+    def from_texts(cls, texts, codes=None) -> "FeedbackIndex":
+        vocabulary, indptr, indices, counts = {}, [0], [], []
+        for text in texts:
+            for term, n in collections.Counter(feedback_terms(str(text))).items():
+                indices.append(vocabulary.setdefault(term, len(vocabulary)))
+                counts.append(n)
+            indptr.append(len(indices))
+        return cls(texts, list(vocabulary), np.array(indptr, dtype=np.int64),
+                   np.array(indices, dtype=np.int32), np.array(counts, dtype=np.int32), codes)
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame) -> "FeedbackIndex":
+        """Index the feedback_text column of an enriched frame, keyed by its rows."""
+        with span("feedback_index", rows_in=len(df)) as sp:
+            codes, texts = pd.factorize(df['feedback_text'])
+            index = cls.from_texts(texts.tolist(), codes.astype(np.int32))
+            sp.set(rows_out=len(index.texts))
+        return index
+
+    def extend(self, other: "FeedbackIndex") -> "FeedbackIndex":
+        """
+        This index followed by `other`, an index of the rows after it: only texts new to
+        this index are tokenized. Equals from_frame() of both frames' rows.
+        """
+        new   = [text for text in other.texts if text not in self.lookup]
+        added = FeedbackIndex.from_texts(new)
+        vocabulary = {term: k for k, term in enumerate(self.terms)}
+        term_code  = np.array([vocabulary.setdefault(term, len(vocabulary)) for term in added.terms],
+                              dtype=np.int32)
+        codes = None
+        if self.codes is not None and other.codes is not None:
+            lookup = self.lookup | {text: len(self.texts) + k for k, text in enumerate(new)}
+            text_code = np.array([lookup[text] for text in other.texts] + [-1], dtype=np.int32)
+            codes = np.concatenate([self.codes, text_code[other.codes]])    # -1 (no text) stays -1
+        return FeedbackIndex(self.texts + new, list(vocabulary),
+                             np.concatenate([self.indptr, self.indptr[-1] + added.indptr[1:]]),
+                             np.concatenate([self.indices, term_code[added.indices]]),
+                             np.concatenate([self.counts, added.counts]), codes)
+
+    def save(self, path: str):
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            arrays = {} if self.codes is None else {"codes": self.codes}
+            np.savez(f, texts=np.array(self.texts, dtype=str), terms=np.array(self.terms, dtype=str),
+                     indptr=self.indptr, indices=self.indices, counts=self.counts, **arrays)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str) -> "FeedbackIndex":
+        with np.load(path) as arrays:
+            return cls(arrays['texts'].tolist(), arrays['terms'].tolist(), arrays['indptr'],
+                       arrays['indices'], arrays['counts'],
+                       arrays['codes'] if 'codes' in arrays.files else None)
+
+    def covers(self, texts) -> bool:
+        return all(text in self.lookup for text in texts)
+
+    def themes(self, text_counts: dict) -> list:
+        """
+        [(theme, orders, sample)] for {text: orders} (texts in first-seen order), most
+        orders first; the sample is the theme's most frequent text, first seen on ties.
+        """
+        if not text_counts:
+            return []
+        member = self.text_themes[[self.lookup[text] for text in text_counts]]
+        orders = np.array(list(text_counts.values()), dtype=np.int64)
+        totals = orders @ member
+        best   = (orders[:, None] * member).argmax(axis=0)
+        texts  = list(text_counts)
+        ranked = np.argsort(-totals, kind='stable')
+        return [(self.theme_names[k], int(totals[k]), texts[best[k]]) for k in ranked if totals[k]]
+
+    def phrases(self, text_counts: dict, n: int) -> list:
+        """The n most frequent two-word phrases over {text: orders} (ties alphabetical), with their order counts."""
+        if not text_counts:
+            return []
+        weights = np.zeros(len(self.texts))
+        weights[[self.lookup[text] for text in text_counts]] = list(text_counts.values())
+        rows   = np.repeat(np.arange(len(self.texts)), np.diff(self.indptr))
+        totals = np.bincount(self.indices, weights=weights[rows], minlength=len(self.terms))
+        found  = [(-int(totals[k]), self.terms[k]) for k in np.flatnonzero(totals)
+                  if " " in self.terms[k]]
+        return [(term, -n) for n, term in sorted(found)[:n]]
+
+
+def format_feedback(stats) -> list:
+    """Text lines on the feedback of a SummaryStats' failed/late orders (empty without any)."""
+    texts = stats.feedback_counts
+    if not texts and not stats.ratings and not stats.sentiments:
+        return []
+    index = stats.feedback_index
+    if index is None or not index.covers(texts):
+        index = FeedbackIndex.from_texts(list(texts))
+    with_text = sum(texts.values())
+    lines = [f"Customer feedback on failed/late orders: {with_text} of {stats.failed} orders left a comment"]
+    rated = sum(stats.ratings.values())
+    if rated:
+        mean = sum(rating * n for rating, n in stats.ratings.items()) / rated
+        lines[0] += f", average rating {mean:.2f}/5 ({rated} ratings)"
+    if stats.sentiments:
+        total = sum(stats.sentiments.values())
+        lines.append("Sentiment: " + ", ".join(f"{s} {n / total * 100:.0f}%"
+                                               for s, n in _top(stats.sentiments, len(stats.sentiments))))
+    themes = index.themes(texts)[:FEEDBACK_TOP_THEMES]
+    if themes:
+        lines.append("Feedback themes (share of commented orders):")
+        lines += [f"  • {theme}: {n} ({n / with_text * 100:.1f}%), e.g. \"{sample}\""
+                  for theme, n, sample in themes]
+    phrases = index.phrases(texts, FEEDBACK_TOP_PHRASES)
+    if phrases:
+        lines.append("Frequent phrases: " + ", ".join(f"\"{p}\" ({n})" for p, n in phrases))
+    return lines
+
+
+# ---------------------------------------------------------------------------
+# Data Summary Helpers (feed to LLM)
+# ---------------------------------------------------------------------------
+
+def memory_report(df: pd.DataFrame) -> str:
+    """Per-column deep memory usage of a DataFrame, largest first."""
+    usage = df.memory_usage(deep=True, index=False).sort_values(ascending=False)
+    lines = [f"Memory usage for {len(df)} rows x {len(df.columns)} columns "
+             f"(deep): {usage.sum() / 2**20:.1f} MiB"]
+    for col, nbytes in usage.items():
+        lines.append(f"  {col:<24} {str(df[col].dtype):<16} {nbytes / 2**20:8.2f} MiB")
+    return "\n".join(lines)
+
+
+def _ordered_counts(values: pd.Series) -> dict:
+    """Non-null value → count, keyed in first-seen order (the order value_counts() breaks ties in)."""
+    codes, uniques = pd.factorize(values)
+    counts = np.bincount(codes[codes >= 0], minlength=len(uniques))
+    return dict(zip(uniques.tolist(), counts.tolist()))
+
+
+def _top(counts: dict, n: int):
+    """The n largest counts; stable, so ties stay in first-seen order like value_counts()."""
+    return sorted(counts.items(), key=lambda kv: kv[1], reverse=True)[:n]
+
+
+class SummaryStats:
+    """
+    The aggregates behind prepare_data_summary(). Stats from consecutive row ranges can be
+    merged, so a summary can be built incrementally from chunks and still match the
+    summary of the whole frame exactly.
+    """
+
+    # Columns broken down over the failed/late orders.
+    BREAKDOWNS = ['consolidated_reason', 'weather_condition', 'traffic_condition', 'city',
+                  'client_name', 'warehouse_name', 'event_type']
+    # Feedback columns counted over the failed/late orders: {column: attribute}.
+    FEEDBACK = {'feedback_text': 'feedback_counts', 'rating': 'ratings', 'sentiment': 'sentiments'}
+
+    def __init__(self, columns=()):
+        self.columns  = set(columns)
+        self.total    = 0
+        self.failed   = 0
+        self.failure_counts = {col: {} for col in self.BREAKDOWNS if col in self.columns}
+        self.city_totals    = {}
+        self.feedback_counts = {}       # feedback text -> failed/late orders
+        self.ratings         = {}
+        self.sentiments      = {}
+        self.on_time_ratings = {}       # rating -> orders that were neither failed nor late
+        self.feedback_index  = None     # FeedbackIndex covering feedback_counts, if known
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame) -> "SummaryStats":
+        stats = cls(df.columns)
+        problem  = df['is_failed'] | df['is_late']
+        failures = df[problem]
+        stats.total  = len(df)
+        stats.failed = len(failures)
+        for col in stats.failure_counts:
+            stats.failure_counts[col] = _ordered_counts(failures[col])
+        if 'city' in df.columns:
+            stats.city_totals = _ordered_counts(df['city'])
+        for col, attr in cls.FEEDBACK.items():
+            if col in df.columns:
+                setattr(stats, attr, _ordered_counts(failures[col]))
+        if 'rating' in df.columns:
+            stats.on_time_ratings = _ordered_counts(df.loc[~problem, 'rating'])
+        return stats
+
+    def merge(self, other: "SummaryStats") -> "SummaryStats":
+        """Fold in the stats of the rows that follow this range; returns self."""
+        if not self.columns:
+            self.columns = set(other.columns)
+            self.failure_counts = {col: {} for col in other.failure_counts}
+        self.total  += other.total
+        self.failed += other.failed
+        for col, counts in other.failure_counts.items():
+            merged = self.failure_counts.setdefault(col, {})
+            for value, cnt in counts.items():
+                merged[value] = merged.get(value, 0) + cnt
+        for city, cnt in other.city_totals.items():
+            self.city_totals[city] = self.city_totals.get(city, 0) + cnt
+        for attr in list(self.FEEDBACK.values()) + ['on_time_ratings']:
+            merged = getattr(self, attr)
+            for value, cnt in getattr(other, attr).items():
+                merged[value] = merged.get(value, 0) + cnt
+        self.feedback_index = self.feedback_index or other.feedback_index
+        return self
+
+
+# Columns the failure cube rolls up over. Its cells are keyed by CUBE_DIMENSIONS and the
+# order day; the high-cardinality CUBE_MEMBER_DIMENSIONS stay out of that key and split
+# each cell into members instead, so clients and warehouses do not multiply the cells.
+CUBE_DIMENSIONS = ['city', 'warehouse_city', 'partner_company', 'weather_condition',
+                   'traffic_condition', 'event_type', 'consolidated_reason']
+CUBE_MEMBER_DIMENSIONS = ['client_name', 'warehouse_name']
+# Additive counts of a cell or member, and the row positions of its first (failed/late) order.
+CUBE_COUNTS = ['orders', 'late', 'failed', 'failures']
+CUBE_FIRSTS = ['first_row', 'first_failure_row']
+CUBE_TOTALS = {col: (col, 'sum') for col in CUBE_COUNTS} | {col: (col, 'min') for col in CUBE_FIRSTS}
+# The other order columns a cube counts.
+CUBE_INPUTS = ['order_date', 'is_failed', 'is_late', 'rating'] + list(SummaryStats.FEEDBACK)
+
+
+class FailureCube:
+    """
+    Pre-aggregated rollup of the enriched order table, in two levels. `cells` has one
+    row per observed combination of CUBE_DIMENSIONS (those present in the frame) and
+    order day, with order, late, failed and failed-or-late counts; `members` splits each
+    cell by CUBE_MEMBER_DIMENSIONS (client and warehouse) with the same counts. Both
+    record the row position of their first order and first failed/late order;
+    `feedback` counts each member's failed/late orders per feedback text, rating and
+    sentiment (with a FeedbackIndex of the texts for themes) and `on_time` its other
+    orders per rating. That is enough to rebuild SummaryStats for any slice exactly,
+    ties included, without touching the orders. Cells are kept sorted by day and members
+    by cell, so a date window is a binary-search slice (between()). Cubes of consecutive
+    row ranges merge() like SummaryStats.
+
+    A slice holds its cells (indexed by their position in the full cube) and the
+    positions of its members. cube['city'] and cube[mask] filter on cell columns like a
+    DataFrame; filters on a member column (filter_entities(), equal()) select members,
+    and the slice's cells are re-aggregated from them. Resident modes call build_index()
+    once, after which filter_entities() answers entity filters from an EntityIndex over
+    the members instead of scanning them.
+    """
+
+    def __init__(self, cells: pd.DataFrame, members: pd.DataFrame, feedback, on_time, columns,
+                 feedback_index=None, entity_index=None, member_rows=None):
+        self.cells    = cells
+        self.members  = members     # the full cube's [cell, member columns..., counts, firsts]
+        self.feedback = feedback    # [member, feedback columns..., orders, first_row], or None
+        self.on_time  = on_time     # [member, rating, orders, first_row] of on-time orders, or None
+        self.columns  = list(columns)
+        self.feedback_index = feedback_index
+        self.entity_index = entity_index    # EntityIndex of the full cube's members, shared by its slices
+        # Positions in `members` of this slice's members, ascending.
+        self.member_rows  = np.arange(len(members)) if member_rows is None else member_rows
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame, rows: np.ndarray = None) -> "FailureCube":
+        """The cube of an enriched frame; ascending `rows` place its rows in a larger table (default 0, 1, ...)."""
+        dims = [col for col in CUBE_DIMENSIONS if col in df.columns]
+        member_dims = [col for col in CUBE_MEMBER_DIMENSIONS if col in df.columns]
+        keys = df[dims + member_dims].reset_index(drop=True)
+        if 'order_date' in df.columns:
+            keys.insert(len(dims), 'day', df['order_date'].dt.floor('D').to_numpy())
+        failures = (df['is_failed'] | df['is_late']).to_numpy()
+        rows = np.arange(len(df)) if rows is None else np.asarray(rows, dtype=np.int64)
+        end  = int(rows[-1]) + 1 if len(rows) else 0
+        # ngroup() numbers groups in order of first appearance, so a group's first row locates its keys.
+        member = keys.groupby(list(keys.columns), sort=False, dropna=False, observed=True).ngroup().to_numpy()
+        measures = pd.DataFrame({
+            'member': member, 'orders': 1, 'late': df['is_late'].to_numpy(dtype=np.int64),
+            'failed': df['is_failed'].to_numpy(dtype=np.int64), 'failures': failures.astype(np.int64),
+            'first_row': rows, 'first_failure_row': np.where(failures, rows, end)})
+        members = measures.groupby('member').agg(**CUBE_TOTALS).reset_index(drop=True)
+        first   = np.searchsorted(rows, members['first_row'].to_numpy())
+        members = pd.concat([keys.iloc[first].reset_index(drop=True), members], axis=1)
+
+        columns  = dims + member_dims
+        feedback, on_time, feedback_index = None, None, None
+        fb_cols  = [col for col in SummaryStats.FEEDBACK if col in df.columns]
+        if fb_cols:
+            columns += fb_cols
+            keep = np.flatnonzero(failures & df[fb_cols].notna().any(axis=1).to_numpy())
+            feedback = _member_counts(df[fb_cols].iloc[keep], member[keep], rows[keep])
+        if 'rating' in df.columns:
+            keep = np.flatnonzero(~failures & df['rating'].notna().to_numpy())
+            on_time = _member_counts(df[['rating']].iloc[keep], member[keep], rows[keep])
+        if 'feedback_text' in df.columns:
+            feedback_index = FeedbackIndex.from_frame(df)
+        return cls._assemble(members, feedback, on_time, columns, feedback_index)
+
+    @classmethod
+    def _assemble(cls, members: pd.DataFrame, feedback, on_time, columns, feedback_index) -> "FailureCube":
+        """
+        The cube of `members` — one row per distinct cell and member key, with counts and
+        first rows — and its `feedback` and `on_time` counts keyed by row of `members`.
+        Cells are numbered by day, then first order, and members by cell, then first
+        order, so both are binary-searchable and the numbering depends only on the orders.
+        """
+        dims = [col for col in CUBE_DIMENSIONS + ['day'] if col in members.columns]
+        member_dims = [col for col in CUBE_MEMBER_DIMENSIONS if col in members.columns]
+        cell  = members.groupby(dims, sort=False, dropna=False, observed=True).ngroup().to_numpy()
+        cells = members[CUBE_COUNTS + CUBE_FIRSTS].groupby(cell).agg(**CUBE_TOTALS).reset_index(drop=True)
+        cells = pd.concat([members[dims].iloc[np.unique(cell, return_index=True)[1]].reset_index(drop=True),
+                           cells], axis=1)
+        order = cells.sort_values(['day', 'first_row'] if 'day' in dims else ['first_row'],
+                                  na_position='last').index.to_numpy()
+        cell_id = np.empty(len(cells), dtype=np.int64)
+        cell_id[order] = np.arange(len(cells))
+        cells = cells.iloc[order].reset_index(drop=True)
+
+        members = members[member_dims + CUBE_COUNTS + CUBE_FIRSTS]
+        members.insert(0, 'cell', cell_id[cell])
+        order = np.lexsort((members['first_row'].to_numpy(), members['cell'].to_numpy()))
+        member_id = np.empty(len(members), dtype=np.int64)
+        member_id[order] = np.arange(len(members))
+        members = members.iloc[order].reset_index(drop=True)
+        tables = []
+        for table in (feedback, on_time):
+            if table is not None:
+                table = table.assign(member=member_id[table['member'].to_numpy()])
+                table = table.sort_values('first_row', ignore_index=True)
+            tables.append(table)
+        return cls(cells, members, *tables, columns, feedback_index)
+
+    def merge(self, other: "FailureCube") -> "FailureCube":
+        """
+        The cube of this (full) cube's orders followed by `other`'s, a cube of the rows after
+        them: counts add up and first rows are shifted past this cube's orders, as
+        SummaryStats.merge() folds consecutive row ranges. The result equals from_frame()
+        of all the rows, so a cube can be built chunk by chunk or extended with new orders.
+        """
+        feedback_index = None
+        if self.feedback_index is not None and other.feedback_index is not None:
+            feedback_index = self.feedback_index.extend(other.feedback_index)
+        return FailureCube._combine([(self, 0), (other, len(self))], len(self) + len(other),
+                                    self.columns, feedback_index)
+
+    def refresh(self, old: pd.DataFrame, df: pd.DataFrame, changed: np.ndarray) -> "FailureCube":
+        """
+        This (full) cube of `old` brought up to date with `df`, the same table with the
+        rows at the sorted positions `changed` recomputed or appended (apply_appends()).
+        Appended rows are folded in as merge() would; recomputed rows whose cube inputs
+        did not change are skipped, and for the others only the days they were or are
+        on are recounted from `df`, as cells are keyed by day. The result equals
+        from_frame(df).
+        """
+        inputs = [col for col in CUBE_DIMENSIONS + CUBE_MEMBER_DIMENSIONS + CUBE_INPUTS
+                  if col in df.columns]
+        before = changed[changed < len(old)]
+        was, now = old[inputs].iloc[before].astype(str), df[inputs].iloc[before].astype(str)
+        moved = before[~(was.to_numpy() == now.to_numpy()).all(axis=1)]
+        if len(moved) and 'day' not in self.cells.columns:
+            return FailureCube.from_frame(df)
+
+        parts = [(self, 0)]
+        if len(moved):
+            days = pd.concat([old['order_date'].iloc[moved], df['order_date'].iloc[moved]]).dt.floor('D')
+            days = days.unique()
+            rows = np.flatnonzero(df['order_date'].iloc[:len(old)].dt.floor('D').isin(days).to_numpy())
+            parts = [(self[~self.cells['day'].isin(days).to_numpy()], 0),
+                     (FailureCube.from_frame(df.iloc[rows], rows), 0)]
+        appended = np.arange(len(old), len(df))
+        if len(appended):
+            parts.append((FailureCube.from_frame(df.iloc[appended], appended), 0))
+
+        feedback_index = self.feedback_index
+        if feedback_index is not None and len(changed):
+            feedback_index = feedback_index.extend(FeedbackIndex.from_frame(df.iloc[changed]))
+            codes = np.full(len(df), -1, dtype=np.int32)
+            codes[:len(old)] = feedback_index.codes[:len(old)]
+            codes[changed] = feedback_index.codes[len(old):]
+            feedback_index.codes = codes
+        return FailureCube._combine(parts, len(df), self.columns, feedback_index)
+
+    @staticmethod
+    def _combine(parts: list, total: int, columns, feedback_index) -> "FailureCube":
+        """
+        One cube of the orders of the (cube or slice, shift) `parts` of a table of `total`
+        orders, where shift moves a part's first rows to their position in that table.
+        Members sharing a key are added up.
+        """
+        cube  = parts[0][0]
+        keys  = [col for col in CUBE_DIMENSIONS + ['day'] if col in cube.cells.columns] + \
+                [col for col in CUBE_MEMBER_DIMENSIONS if col in cube.members.columns]
+        tables = {"members": [], "feedback": [], "on_time": []}
+        renumber = 0
+        for cube, shift in parts:
+            members = cube.member_frame(keys).reset_index(drop=True)
+            members[CUBE_FIRSTS] += shift
+            members.loc[members['failures'] == 0, 'first_failure_row'] = total
+            tables["members"].append(members)
+            for name in ("feedback", "on_time"):
+                table = getattr(cube, name)
+                if table is not None:
+                    table = table[table['member'].isin(cube.member_rows)]
+                    tables[name].append(table.assign(
+                        member=np.searchsorted(cube.member_rows, table['member'].to_numpy()) + renumber,
+                        first_row=table['first_row'] + shift))
+            renumber += len(members)
+        members = _concat_frames(tables["members"])
+        group = members.groupby(keys, sort=False, dropna=False, observed=True).ngroup().to_numpy()
+        counts = members[CUBE_COUNTS + CUBE_FIRSTS].groupby(group).agg(**CUBE_TOTALS).reset_index(drop=True)
+        members = pd.concat([members[keys].iloc[np.unique(group, return_index=True)[1]]
+                             .reset_index(drop=True), counts], axis=1)
+        counted = []
+        for name in ("feedback", "on_time"):
+            table = None
+            if tables[name]:
+                table = _concat_frames(tables[name])
+                table = _member_counts(table.drop(columns=['member', 'orders', 'first_row']),
+                                       group[table['member'].to_numpy()], table['first_row'].to_numpy(),
+                                       table['orders'].to_numpy())
+            counted.append(table)
+        return FailureCube._assemble(members, *counted, columns, feedback_index)
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            if key in CUBE_MEMBER_DIMENSIONS:
+                raise KeyError(f"{key} is a member column of the cube; select it with equal()")
+            return self.cells[key]
+        return self._with_cells(self.cells[key])
+
+    def __len__(self) -> int:
+        return int(self.cells['orders'].sum())
+
+    @property
+    def empty(self) -> bool:
+        return self.cells.empty
+
+    def _slice(self, cells: pd.DataFrame, member_rows: np.ndarray) -> "FailureCube":
+        return FailureCube(cells, self.members, self.feedback, self.on_time, self.columns,
+                           self.feedback_index, self.entity_index, member_rows)
+
+    def _with_cells(self, cells: pd.DataFrame) -> "FailureCube":
+        """This slice narrowed to `cells`, a subset of its cells, with their members."""
+        rows = self.member_rows
+        if len(cells) < len(self.cells):
+            rows = rows[np.isin(self.members['cell'].to_numpy()[rows], cells.index.to_numpy())]
+        return self._slice(cells, rows)
+
+    def between(self, start=None, end=None) -> "FailureCube":
+        """
+        Cells of orders placed in [start, end) (midnight bounds; None leaves a side open).
+        Undated cells sort last and, as in select_period(), fall outside any period.
+        """
+        days = self.cells['day'].to_numpy()
+        lo = 0 if start is None else np.searchsorted(days, np.datetime64(start))
+        if end is not None:
+            hi = np.searchsorted(days, np.datetime64(end))
+        else:
+            hi = len(days) if start is None else np.searchsorted(days, np.datetime64('NaT'))
+        cells = self.cells.iloc[lo:hi]
+        # The slice's members are sorted by cell, so the window's members are a range too.
+        member_cells = self.members['cell'].to_numpy()[self.member_rows]
+        ids = cells.index.to_numpy()
+        first, last = (ids[0], ids[-1]) if len(ids) else (0, -1)
+        rows = self.member_rows[np.searchsorted(member_cells, first):
+                                np.searchsorted(member_cells, last, side='right')]
+        return self._slice(cells, rows)
+
+    def select(self, rows: np.ndarray) -> "FailureCube":
+        """
+        The orders of the members at the sorted full-cube positions `rows` that are in
+        this slice, with its cells re-aggregated from just those members.
+        """
+        if len(self.member_rows) < len(self.members):
+            rows = _intersect_sorted(self.member_rows, rows)
+        members = self.members.iloc[rows]
+        cell = members['cell'].to_numpy()
+        starts = np.flatnonzero(np.r_[True, cell[1:] != cell[:-1]]) if len(cell) else cell
+        cells = self.cells.iloc[np.searchsorted(self.cells.index.to_numpy(), cell[starts])].copy()
+        if len(cell):
+            cells[CUBE_COUNTS] = np.add.reduceat(members[CUBE_COUNTS].to_numpy(), starts, axis=0)
+            cells[CUBE_FIRSTS] = np.minimum.reduceat(members[CUBE_FIRSTS].to_numpy(), starts, axis=0)
+        return self._slice(cells, rows)
+
+    def equal(self, column: str, value) -> "FailureCube":
+        """The orders whose `column`, a cell or member column, equals `value`."""
+        if column not in CUBE_MEMBER_DIMENSIONS:
+            return self[self.cells[column] == value]
+        frame = self.member_frame([column])
+        return self.select(frame.index.to_numpy()[(frame[column] == value).to_numpy()])
+
+    def member_frame(self, columns: list) -> pd.DataFrame:
+        """
+        `columns` (cell or member columns) of this slice's members with their counts and
+        first rows, indexed by member position: the finest rows the cube can group by.
+        """
+        members = self.members
+        if len(self.member_rows) < len(members):
+            members = members.iloc[self.member_rows]
+        at = np.searchsorted(self.cells.index.to_numpy(), members['cell'].to_numpy())
+        frame = pd.DataFrame({col: (members[col] if col in members.columns else self.cells[col].iloc[at])
+                              .reset_index(drop=True) for col in columns})
+        for col in CUBE_COUNTS + CUBE_FIRSTS:
+            frame[col] = members[col].to_numpy()
+        frame.index = self.member_rows
+        return frame
+
+    def build_index(self) -> "FailureCube":
+        """Index the entity columns of the (full) cube's members for filter_entities(); returns self."""
+        with span("entity_index", rows_in=len(self.members)):
+            self.entity_index = EntityIndex(
+                self.member_frame([col for col in INDEXED_COLUMNS if col in self.columns]))
+        return self
+
+    def stats(self) -> SummaryStats:
+        """SummaryStats of the orders in this (slice of the) cube; equals SummaryStats.from_frame()."""
+        cells = self.cells
+        stats = SummaryStats(self.columns)
+        stats.total  = len(self)
+        stats.failed = int(cells['failures'].sum())
+        failing = cells[cells['failures'] > 0]
+        member_cols = [col for col in stats.failure_counts if col in CUBE_MEMBER_DIMENSIONS]
+        if member_cols:
+            failing_members = self.member_frame(member_cols)
+            failing_members = failing_members[failing_members['failures'] > 0]
+        for col in stats.failure_counts:
+            rows = failing_members if col in member_cols else failing
+            stats.failure_counts[col] = _first_seen_counts(
+                rows[col], rows['failures'], rows['first_failure_row'])
+        if 'city' in self.columns:
+            stats.city_totals = _first_seen_counts(cells['city'], cells['orders'], cells['first_row'])
+        sliced = len(self.member_rows) < len(self.members)
+        if self.feedback is not None:
+            feedback = self.feedback[self.feedback['member'].isin(self.member_rows)] if sliced else self.feedback
+            for col, attr in SummaryStats.FEEDBACK.items():
+                if col in feedback.columns:
+                    setattr(stats, attr, _first_seen_counts(feedback[col], feedback['orders'],
+                                                            feedback['first_row']))
+            stats.feedback_index = self.feedback_index
+        if self.on_time is not None:
+            on_time = self.on_time[self.on_time['member'].isin(self.member_rows)] if sliced else self.on_time
+            stats.on_time_ratings = _first_seen_counts(on_time['rating'], on_time['orders'],
+                                                       on_time['first_row'])
+        return stats
+
+
+def _member_counts(values: pd.DataFrame, member: np.ndarray, rows: np.ndarray, orders=None) -> pd.DataFrame:
+    """
+    [member, value columns..., orders, first_row]: the orders and first row per member and
+    combination of `values`, whose rows are single orders at positions `rows` (or, with
+    `orders`, earlier counts of that many orders first seen at `rows`).
+    """
+    table = values.reset_index(drop=True)
+    table.insert(0, 'member', member)
+    table['orders'] = 1 if orders is None else orders
+    table['first_row'] = rows
+    return (table.groupby(['member'] + list(values.columns), sort=False, dropna=False, observed=True)
+            .agg(orders=('orders', 'sum'), first_row=('first_row', 'min')).reset_index())
+
+
+def _first_seen_counts(values: pd.Series, counts: pd.Series, first: pd.Series) -> dict:
+    """Sum `counts` per non-null value, keyed in order of each value's earliest `first` row."""
+    codes, uniques = pd.factorize(values)
+    valid  = codes >= 0
+    codes  = codes[valid]
+    totals = np.bincount(codes, weights=counts.to_numpy()[valid], minlength=len(uniques))
+    firsts = np.full(len(uniques), np.iinfo(np.int64).max)
+    np.minimum.at(firsts, codes, first.to_numpy()[valid])
+    names  = uniques.tolist()
+    return {names[i]: int(totals[i]) for i in np.argsort(firsts, kind='stable')}
+
+
+def summary_stats(view) -> SummaryStats:
+    """SummaryStats of an enriched order frame or FailureCube (slice)."""
+    with span("summary_stats", rows_in=len(view)):
+        if isinstance(view, FailureCube):
+            return view.stats()
+        return SummaryStats.from_frame(view)
+
+
+def format_data_summary(stats: SummaryStats) -> str:
+    """Render SummaryStats as the compact text block fed to the LLM."""
+    if stats.total == 0:
+        return "No orders found matching the given criteria."
+
+    total = stats.total
+    n_failures = stats.failed
+    rate  = n_failures / total * 100 if total > 0 else 0.0
+    counts = stats.failure_counts
+
+    lines = [
+        f"Total orders: {total}",
+        f"Failed or late: {n_failures} ({rate:.1f}%)",
+        f"Successfully on-time: {total - n_failures} ({100 - rate:.1f}%)",
+    ]
+
+    if n_failures:
+        lines.append("\nTop 5 consolidated failure reasons:")
+        for reason, cnt in _top(counts['consolidated_reason'], 5):
+            lines.append(f"  • {reason}: {cnt} orders ({cnt / n_failures * 100:.1f}%)")
+
+        if 'weather_condition' in counts:
+            lines.append("\nWeather conditions during failures:")
+            for cond, cnt in _top(counts['weather_condition'], 4):
+                lines.append(f"  • {cond}: {cnt}")
+
+        if 'traffic_condition' in counts:
+            lines.append("\nTraffic conditions during failures:")
+            for cond, cnt in _top(counts['traffic_condition'], 3):
+                lines.append(f"  • {cond}: {cnt}")
+
+        if 'city' in counts:
+            lines.append("\nTop 5 cities by failure count:")
+            for city, cnt in _top(counts['city'], 5):
+                lines.append(f"  • {city}: {cnt} failures out of {stats.city_totals[city]} orders")
+
+        if 'client_name' in counts:
+            lines.append("\nTop 5 clients by failure count:")
+            for client, cnt in _top(counts['client_name'], 5):
+                lines.append(f"  • {client}: {cnt}")
+
+        if 'warehouse_name' in counts:
+            lines.append("\nTop 5 warehouses by failure count:")
+            for wh, cnt in _top(counts['warehouse_name'], 5):
+                lines.append(f"  • {wh}: {cnt}")
+
+        if counts.get('event_type'):
+            lines.append("\nExternal events linked to failures:")
+            for ev, cnt in _top(counts['event_type'], 3):
+                lines.append(f"  • {ev}: {cnt}")
+
+        feedback = format_feedback(stats)
+        if feedback:
+            lines.append("")
+            lines += feedback
+
+    return "\n".join(lines)
+
+
+def prepare_data_summary(df) -> str:
+    """Produce a compact textual summary of an (optionally filtered) DataFrame or FailureCube."""
+    return format_data_summary(summary_stats(df))
+
+
+def prepare_single_order_summary(row) -> str:
+    """Build a detailed text block for a single order row."""
+    fields = {
+        "Order ID":          row.get('order_id'),
+        "Customer":          row.get('customer_name'),
+        "Status":            row.get('status'),
+        "Performance":       ("LATE" if row.get('is_late') else
+                              "FAILED" if row.get('is_failed') else "ON TIME"),
+        "Promised delivery": row.get('promised_delivery_date'),
+        "Actual delivery":   row.get('actual_delivery_date'),
+        "City":              row.get('city'),
+        "Client":            row.get('client_name'),
+        "Warehouse":         row.get('warehouse_name'),
+        "Fleet note":        row.get('gps_delay_notes'),
+        "Warehouse note":    row.get('warehouse_notes'),
+        "Weather":           row.get('weather_condition'),
+        "Traffic":           row.get('traffic_condition'),
+        "External event":    row.get('event_type'),
+        "Customer feedback": row.get('feedback_text'),
+        "Feedback rating":   row.get('rating'),
+        "Failure reason":    row.get('failure_reason'),
+    }
+    lines = []
+    for k, v in fields.items():
+        if v is not None and pd.notna(v):
+            lines.append(f"  {k}: {v}")
+    return "\n".join(lines)
+
+
+# ---------------------------------------------------------------------------
+# Group Comparison (N-way, one grouped pass)
+# ---------------------------------------------------------------------------
+
+# Dimensions groups can be compared over: {name: (column, plural)}.
+COMPARE_DIMENSIONS = {
+    "city":      ('city', "cities"),
+    "client":    ('client_name', "clients"),
+    "warehouse": ('warehouse_name', "warehouses"),
+    "partner":   ('partner_company', "partners"),
+}
+# Failed/late breakdowns shown per group: {column: (label, top n)}. Columns the view
+# does not carry are skipped (a FailureCube has no driver_name).
+COMPARISON_BREAKDOWNS = {
+    'consolidated_reason': ("Top reasons", 4),
+    'weather_condition':   ("Dominant weather", 2),
+    'traffic_condition':   ("Dominant traffic", 2),
+    'partner_company':     ("Delivery partners", 3),
+    'driver_name':         ("Drivers", 3),
+}
+SIGNIFICANCE_LEVEL = 0.05
+# The top-ranked groups get breakdowns, the next ones a line each; the rest are counted.
+COMPARISON_DETAIL_N = 10
+COMPARISON_LIST_N   = 30
+
+# compare_groups() result: view totals, `groups` (orders, failures, rate, z, p_value and
+# significant per group, most significant deviation first), `breakdowns`
+# ({column: {group: [(value, failures)]}}) and the requested names with no orders.
+Comparison = collections.namedtuple("Comparison", "column orders failures groups breakdowns missing")
+
+
+def _weighted_rows(view, columns: list) -> pd.DataFrame:
+    """
+    `columns` of a FailureCube's cells (its members, when a column is a member column) or
+    an enriched frame's rows, with the orders and failed/late orders each one stands for
+    and the position of its first (failed) order.
+    """
+    if isinstance(view, FailureCube):
+        if set(columns) & set(CUBE_MEMBER_DIMENSIONS):
+            return view.member_frame(columns).reset_index(drop=True)
+        return view.cells[columns + CUBE_COUNTS + CUBE_FIRSTS]
+    rows = np.arange(len(view))
+    weighted = view[columns].reset_index(drop=True)
+    weighted['orders'] = 1
+    weighted['failures'] = (view['is_failed'] | view['is_late']).to_numpy(dtype=np.int64)
+    weighted['first_row'] = rows
+    weighted['first_failure_row'] = rows
+    return weighted
+
+
+def _resolve_groups(names: list, values) -> tuple:
+    """Codes of `values` among `names` (case-insensitive, first spelling wins) and the unknown values."""
+    if values is None:
+        return np.arange(len(names)), []
+    lower = {}
+    for code, name in enumerate(names):
+        lower.setdefault(name.lower(), code)
+    selected, missing = {}, []
+    for value in values:
+        code = lower.get(str(value).lower())
+        if code is None:
+            missing.append(value)
+        else:
+            selected.setdefault(code)
+    return np.array(list(selected), dtype=np.int64), missing
+
+
+def _top_per_group(groups: np.ndarray, values: np.ndarray, weights: np.ndarray,
+                   first: np.ndarray, n: int) -> list:
+    """
+    [(group, value, total)] for the `n` largest weight totals of each (group, value)
+    pair within its group, by group; ties keep the order of each pair's smallest
+    `first`, like _top() over first-seen counts.
+    """
+    width  = int(values.max(initial=0)) + 1
+    codes, pairs = pd.factorize(groups.astype(np.int64) * width + values)
+    totals = np.bincount(codes, weights=weights, minlength=len(pairs)).astype(np.int64)
+    firsts = np.full(len(pairs), np.iinfo(np.int64).max)
+    np.minimum.at(firsts, codes, first)
+    order  = np.lexsort((firsts, -totals, pairs // width))
+    group  = pairs[order] // width
+    rank   = np.arange(len(order)) - np.searchsorted(group, group)
+    order  = order[rank < n]
+    return list(zip((pairs[order] // width).tolist(), (pairs[order] % width).tolist(),
+                    totals[order].tolist()))
+
+
+@traced("compare_groups")
+def compare_groups(view, column: str, values=None, breakdowns=None) -> Comparison:
+    """
+    Compare the failed/late rate of every value of `column` (or just `values`, matched
+    case-insensitively) in an enriched frame or FailureCube. Group totals and the
+    `breakdowns` (default COMPARISON_BREAKDOWNS) of all groups come from one grouped
+    pass over the view, not one filter per group. Each group is tested against the rest
+    of the view with a two-proportion z-test, Bonferroni-adjusted for the number of
+    groups, and the groups are ranked by |z|.
+    """
+    breakdowns = COMPARISON_BREAKDOWNS if breakdowns is None else breakdowns
+    available  = set(view.columns)
+    if column not in available:
+        raise ValueError(f"The data has no {column} column to compare")
+    shown = [col for col in breakdowns if col != column and col in available]
+    rows  = _weighted_rows(view, [column] + shown)
+    codes, names = pd.factorize(rows[column])
+    names = [str(name) for name in names]
+    selected, missing = _resolve_groups(names, values)
+
+    valid     = codes >= 0
+    weights   = rows['failures'].to_numpy()
+    orders    = np.bincount(codes[valid], weights=rows['orders'].to_numpy()[valid], minlength=len(names))
+    failures  = np.bincount(codes[valid], weights=weights[valid], minlength=len(names))
+    firsts    = np.full(len(names), np.iinfo(np.int64).max)
+    np.minimum.at(firsts, codes[valid], rows['first_row'].to_numpy()[valid])
+    total, failed = int(rows['orders'].sum()), int(weights.sum())
+
+    groups = pd.DataFrame({'orders': orders[selected].astype(np.int64),
+                           'failures': failures[selected].astype(np.int64),
+                           'first': firsts[selected]},
+                          index=pd.Index([names[c] for c in selected], name=column))
+    groups['rate'] = groups['failures'] / groups['orders']
+    rest   = (total - groups['orders']).where(lambda n: n > 0)
+    pooled = failed / total if total else 0.0
+    se     = np.sqrt(pooled * (1 - pooled) * (1 / groups['orders'] + 1 / rest))
+    groups['z'] = ((groups['rate'] - (failed - groups['failures']) / rest) / se.where(se > 0)).fillna(0.0)
+    groups['p_value'] = [math.erfc(abs(z) / math.sqrt(2)) for z in groups['z']]
+    groups['significant'] = groups['p_value'] < SIGNIFICANCE_LEVEL / max(len(groups), 1)
+    order  = np.lexsort((groups['first'].to_numpy(), -groups['z'].abs().to_numpy()))
+    groups = groups.iloc[order].drop(columns='first')
+
+    # Breakdowns over the failed/late orders of the selected groups, one bincount per column.
+    member = np.zeros(len(names) + 1, dtype=bool)     # code -1 (no value) reads the last slot
+    member[selected] = True
+    keep  = member[codes] & (weights > 0)
+    first = rows['first_failure_row'].to_numpy()[keep]
+    breakdown = {}
+    for col in shown:
+        value_codes, labels = pd.factorize(rows[col])
+        value_codes = value_codes[keep]
+        has = value_codes >= 0
+        per_group = breakdown[col] = {}
+        for group, value, n in _top_per_group(codes[keep][has], value_codes[has], weights[keep][has],
+                                              first[has], breakdowns[col][1]):
+            per_group.setdefault(names[group], []).append((labels[value], n))
+    return Comparison(column, total, failed, groups, breakdown, missing)
+
+
+def format_comparison(comparison: Comparison, plural: str, breakdowns=None) -> str:
+    """Render a Comparison as the text block fed to the LLM."""
+    breakdowns = COMPARISON_BREAKDOWNS if breakdowns is None else breakdowns
+    groups = comparison.groups
+    if comparison.orders == 0 or groups.empty:
+        lines = ["No orders found matching the given criteria."]
+    else:
+        base = comparison.failures / comparison.orders
+        alpha = SIGNIFICANCE_LEVEL / len(groups)
+        lines = [f"Baseline: {comparison.orders} orders, {comparison.failures} failed/late "
+                 f"({base * 100:.1f}%); {len(groups)} {plural} compared",
+                 f"Each rate is tested against the rest of the orders (two-proportion z-test, "
+                 f"significant at p < {alpha:.2g}); most significant deviation first."]
+        for rank, (name, g) in enumerate(groups.iterrows()):
+            verdict = (("significantly above" if g['z'] > 0 else "significantly below")
+                       if g['significant'] else "not significantly different from")
+            line = (f"{name}: {g['orders']} orders, Failed/Late: {g['failures']} "
+                    f"({g['rate'] * 100:.1f}%), z={g['z']:+.2f}, p={g['p_value']:.2g}, "
+                    f"{verdict} the rest")
+            if rank == COMPARISON_LIST_N:
+                lines.append(f"  ... and {len(groups) - rank} more {plural}")
+                break
+            if rank >= COMPARISON_DETAIL_N:
+                if rank == COMPARISON_DETAIL_N:
+                    lines.append(f"\nOther {plural}:")
+                lines.append(f"  • {line}")
+                continue
+            lines.append(f"\n{line}")
+            for col, per_group in comparison.breakdowns.items():
+                top = per_group.get(name)
+                if not top:
+                    continue
+                label = breakdowns[col][0]
+                if col == 'consolidated_reason':
+                    lines.append(f"  {label}:")
+                    lines.extend(f"    • {value}: {n}" for value, n in top)
+                else:
+                    lines.append(f"  {label}: {', '.join(f'{value} ({n})' for value, n in top)}")
+    if comparison.missing:
+        lines.append(f"\nNo data for: {', '.join(map(str, comparison.missing))}")
+    return "\n".join(lines)
+
+
+def prepare_comparison_summary(view, dimension: str, values=None, breakdowns=None) -> str:
+    """Comparison summary of the `dimension` (a COMPARE_DIMENSIONS key) groups `values` (None: all)."""
+    column, plural = COMPARE_DIMENSIONS[dimension]
+    return format_comparison(compare_groups(view, column, values, breakdowns), plural, breakdowns)
+
+
+# ---------------------------------------------------------------------------
+# Time-Range Filtering
+# ---------------------------------------------------------------------------
+
+TIME_UNITS = {"day": pd.DateOffset(days=1), "week": pd.DateOffset(weeks=1),
+              "month": pd.DateOffset(months=1), "quarter": pd.DateOffset(months=3),
+              "year": pd.DateOffset(years=1)}
+MONTHS = {name: number for number, name in enumerate(
+    ["january", "february", "march", "april", "may", "june", "july", "august",
+     "september", "october", "november", "december"], start=1)}
+
+
+def _period_start(day: pd.Timestamp, unit: str) -> pd.Timestamp:
+    """Midnight starting the calendar day/week (Monday)/month/quarter/year containing `day`."""
+    if unit == "week":
+        return day - pd.Timedelta(days=day.weekday())
+    if unit == "month":
+        return day.replace(day=1)
+    if unit == "quarter":
+        return day.replace(month=(day.month - 1) // 3 * 3 + 1, day=1)
+    if unit == "year":
+        return day.replace(month=1, day=1)
+    return day
+
+
+def parse_time_range(text: str, anchor):
+    """
+    Turn a time phrase into midnight bounds [start, end), or None if it is not understood.
+
+    Relative phrases count back from `anchor`, the latest order day in the data, because
+    the dataset is historical: "last week" is the last week of data, not of today.
+    Understands today/yesterday, "last|past N days|weeks|months|quarters|years" (a
+    trailing window ending with the anchor day), "this|last|previous|past week|month|
+    quarter|year" (calendar periods; "past" is trailing), month names with an optional
+    year (the latest such month otherwise), a bare year and ISO dates or months.
+    """
+    anchor   = pd.Timestamp(anchor).normalize()
+    tomorrow = anchor + pd.Timedelta(days=1)
+    text     = re.sub(r"^(?:in|during|over|for)\s+|^the\s+", "", text.strip().casefold())
+    text     = re.sub(r"^the\s+", "", text)
+
+    if text == "today":
+        return anchor, tomorrow
+    if text == "yesterday":
+        return anchor - pd.Timedelta(days=1), anchor
+    m = re.fullmatch(r"(?:last|past)\s+(\d+)\s+(day|week|month|quarter|year)s?", text)
+    if m:
+        return tomorrow - int(m[1]) * TIME_UNITS[m[2]], tomorrow
+    m = re.fullmatch(r"(this|last|previous|past)\s+(day|week|month|quarter|year)", text)
+    if m:
+        if m[1] == "past":
+            return tomorrow - TIME_UNITS[m[2]], tomorrow
+        start = _period_start(anchor, m[2])
+        if m[1] == "this":
+            return start, tomorrow
+        return _period_start(start - pd.Timedelta(days=1), m[2]), start
+    m = re.fullmatch(r"([a-z]+)(?:\s+(\d{4}))?", text)
+    if m and m[1] in MONTHS:
+        month = MONTHS[m[1]]
+        year  = int(m[2]) if m[2] else anchor.year - (month > anchor.month)
+        start = pd.Timestamp(year, month, 1)
+        return start, start + TIME_UNITS["month"]
+    if re.fullmatch(r"\d{4}", text):
+        start = pd.Timestamp(int(text), 1, 1)
+        return start, start + TIME_UNITS["year"]
+    if re.fullmatch(r"\d{4}-\d{2}", text):
+        start = pd.Timestamp(text + "-01")
+        return start, start + TIME_UNITS["month"]
+    if re.fullmatch(r"\d{4}-\d{2}-\d{2}", text):
+        start = pd.Timestamp(text)
+        return start, start + pd.Timedelta(days=1)
+    return None
+
+
+def cli_period(from_date=None, to_date=None):
+    """[start, end) for inclusive --from/--to dates (either may be omitted), or None."""
+    if from_date is None and to_date is None:
+        return None
+    start = pd.Timestamp(from_date).normalize() if from_date is not None else None
+    end   = pd.Timestamp(to_date).normalize() + pd.Timedelta(days=1) if to_date is not None else None
+    return start, end
+
+
+def describe_period(start=None, end=None) -> str:
+    last = (end - pd.Timedelta(days=1)).date() if end is not None else None
+    if start is None:
+        return f"until {last}"
+    if end is None:
+        return f"from {start.date()}"
+    return f"{start.date()} to {last}"
+
+
+def latest_order_day(view):
+    """Latest order day in an enriched frame or FailureCube, or None if there is none."""
+    days = view['day'] if isinstance(view, FailureCube) else view['order_date']
+    latest = days.max()
+    return None if pd.isna(latest) else pd.Timestamp(latest).normalize()
+
+
+def select_period(view, start=None, end=None):
+    """
+    Orders placed in [start, end). On a FailureCube (cells sorted by day) this is a
+    binary-search slice; a plain frame, such as a --stream chunk, is masked.
+    """
+    if isinstance(view, FailureCube):
+        return view.between(start, end)
+    dates = view['order_date']
+    mask  = dates.notna()
+    if start is not None:
+        mask &= dates >= start
+    if end is not None:
+        mask &= dates < end
+    return view[mask]
+
+
+# ---------------------------------------------------------------------------
+# Analysis Entry Points
+# ---------------------------------------------------------------------------
+
+# Unified-table columns each entry point reads. Loads are projected to these (plus the
+# join keys and enrich_data() inputs), so untouched tables and columns are never parsed.
+_SUMMARY_COLUMNS = ['city', 'client_name', 'warehouse_name', 'warehouse_city',
+                    'weather_condition', 'traffic_condition', 'event_type', 'feedback_text',
+                    'rating', 'sentiment', 'order_date']
+ENTRY_POINT_COLUMNS = {
+    "analyze_order":      ['order_id', 'customer_name', 'status', 'promised_delivery_date',
+                           'actual_delivery_date', 'city', 'client_name', 'warehouse_name',
+                           'gps_delay_notes', 'warehouse_notes', 'weather_condition',
+                           'traffic_condition', 'event_type', 'feedback_text', 'rating',
+                           'failure_reason'],
+    "analyze_comparison": ['city', 'client_name', 'warehouse_name', 'partner_company', 'driver_name',
+                           'weather_condition', 'traffic_condition', 'order_date'],
+    "analyze_filtered":   _SUMMARY_COLUMNS,
+    "report":             _SUMMARY_COLUMNS,
+}
+# --ask can dispatch to any entry point and also needs the entity lists.
+ASK_COLUMNS = sorted(set().union(*ENTRY_POINT_COLUMNS.values()))
+
+
+# The analyze_*() functions, answer_question() and handle_request() hand their
+# (question, summary, context) to `narrate`, llm_generate_narrative() by default;
+# batch mode passes Narrative to collect the prompts and call Gemini itself.
+Narrative = collections.namedtuple("Narrative", "question summary context")
+
+
+@traced("analyze_order")
+def analyze_order(rich_df: pd.DataFrame, order_id: int, question: str, narrate=None):
+    order = rich_df[rich_df['order_id'] == order_id]
+    if order.empty:
+        return f"Order {order_id} not found in the dataset."
+    summary  = prepare_single_order_summary(order.iloc[0])
+    return (narrate or llm_generate_narrative)(
+        question, summary,
+        f"Detailed analysis for Order {order_id}"
+    )
+
+
+@traced("analyze_filtered")
+def analyze_filtered(rich_df: pd.DataFrame, question: str, context: str, narrate=None):
+    summary  = prepare_data_summary(rich_df)
+    return (narrate or llm_generate_narrative)(question, summary, context)
+
+
+@traced("analyze_comparison")
+def analyze_comparison(rich_df, dimension: str, values, question: str, narrate=None):
+    """Compare the `dimension` groups `values` (None: every group) of a frame or FailureCube."""
+    summary  = prepare_comparison_summary(rich_df, dimension, values)
+    plural   = COMPARE_DIMENSIONS[dimension][1]
+    return (narrate or llm_generate_narrative)(
+        question, summary,
+        f"Side-by-side comparison: {' vs '.join(values)}" if values else f"Comparison of all {plural}"
+    )
+
+
+@traced("answer_question")
+def answer_question(rich_df: pd.DataFrame, entities: dict, question: str, cube=None,
+                    intent: dict = None, narrate=None):
+    """
+    --ask: parse the intent of a plain-English question (unless already given as
+    `intent`) and return the narrated answer. Summaries come from `cube` (the
+    FailureCube of rich_df) when given.
+    """
+    view   = rich_df if cube is None else cube
+    intent = intent or parse_intent(question, entities)
+    action = intent.get('action', 'show_insights')
+
+    time_range = intent.get('time_range')
+    period = None
+    anchor = latest_order_day(view) if time_range else None
+    if anchor is not None:
+        period = parse_time_range(time_range, anchor)
+    if period:
+        view = select_period(view, *period)
+        time_range = f"{time_range} ({describe_period(*period)})"
+
+    if action == 'query_order' and intent.get('order_id'):
+        return analyze_order(rich_df, int(intent['order_id']), question, narrate)
+
+    if action == 'compare_cities' and intent.get('cities') and len(intent['cities']) >= 2:
+        return analyze_comparison(view, "city", intent['cities'], question, narrate)
+
+    if action == 'compare_groups' and intent.get('group_by') in COMPARE_DIMENSIONS:
+        return analyze_comparison(view, intent['group_by'], intent.get('groups') or None,
+                                  question, narrate)
+
+    if action == 'filter_analysis':
+        filters   = intent.get('filters', {}) or {}
+        desc_parts = []
+
+        city, client, warehouse = (filters.get(k) for k in ('city', 'client', 'warehouse'))
+        subset = filter_entities(view, city, client, warehouse, ignore_case=True)
+        if city:
+            desc_parts.append(f"City={city}")
+        if client:
+            desc_parts.append(f"Client={client}")
+        if warehouse:
+            desc_parts.append(f"Warehouse={warehouse}")
+
+        if time_range:
+            desc_parts.append(f"Period={time_range}")
+
+        context = f"Filtered view ({', '.join(desc_parts)})" if desc_parts else "Aggregate view"
+        return analyze_filtered(subset, question, context, narrate)
+
+    if period:
+        return analyze_filtered(view, question, f"Aggregate view (Period={time_range})", narrate)
+    return analyze_filtered(view, question, "Full dataset – aggregate view", narrate)
+
+
+def cli_filters(args) -> dict:
+    return {"city": args.filter_city, "client": args.filter_client,
+            "warehouse": args.filter_warehouse, "period": cli_period(args.from_date, args.to_date)}
+
+
+def apply_cli_filters(df, city=None, client=None, warehouse=None, period=None):
+    """
+    Apply the --filter_* and --from/--to flags: order-date window, exact city, client
+    substring, warehouse name or city. Works on an enriched frame or a FailureCube.
+    """
+    if period:
+        df = select_period(df, *period)
+    return filter_entities(df, city, client, warehouse)
+
+
+def describe_cli_filters(city=None, client=None, warehouse=None, period=None) -> list:
+    parts = []
+    if city:
+        parts.append(f"City={city}")
+    if client:
+        parts.append(f"Client={client}")
+    if warehouse:
+        parts.append(f"Warehouse={warehouse}")
+    if period:
+        parts.append(f"Period={describe_period(*period)}")
+    return parts
+
+
+ORDER_QUESTION = "Give a detailed explanation for why order {} failed or was delayed."
+
+
+@traced("handle_request")
+def handle_request(rich_df: pd.DataFrame, entities, request: dict, cube=None, narrate=None):
+    """
+    Answer one request given with the CLI flag names (ask, query_order, compare_cities or
+    compare_by, filter_city/filter_client/filter_warehouse, show_insights), first match
+    wins in that order, and return the narrative. from_date/to_date narrow comparisons and filtered
+    insights to an order-date window. Summaries come from `cube` when given; an "intent"
+    already parsed for an ask request is used as is.
+    """
+    view = rich_df if cube is None else cube
+    if request.get("ask"):
+        return answer_question(rich_df, entities, request["ask"], cube, request.get("intent"),
+                               narrate)
+
+    if request.get("query_order"):
+        order_id = int(request["query_order"])
+        return analyze_order(rich_df, order_id, ORDER_QUESTION.format(order_id), narrate)
+
+    period = cli_period(request.get("from_date"), request.get("to_date"))
+    if request.get("compare_cities") or request.get("compare_by"):
+        if request.get("compare_cities"):
+            dimension, values = "city", list(request["compare_cities"])
+            if len(values) < 2:
+                raise ValueError("compare_cities takes at least two city names")
+        else:
+            dimension, *values = request["compare_by"]
+            if dimension not in COMPARE_DIMENSIONS:
+                raise ValueError(f"compare_by takes one of: {', '.join(COMPARE_DIMENSIONS)}")
+        plural = COMPARE_DIMENSIONS[dimension][1]
+        question = (f"Compare delivery failure causes between {', '.join(values[:-1])} and {values[-1]}."
+                    if values else f"Compare delivery failure causes across all {plural}.")
+        if period:
+            view = select_period(view, *period)
+            question = f"{question[:-1]} ({describe_period(*period)})."
+        return analyze_comparison(view, dimension, values or None, question, narrate)
+
+    filters    = {key: request.get(f"filter_{key}") for key in ("city", "client", "warehouse")}
+    filters["period"] = period
+    desc_parts = describe_cli_filters(**filters)
+    if request.get("show_insights") or desc_parts:
+        context = f"Filtered: {', '.join(desc_parts)}" if desc_parts else "Full dataset"
+        question = f"What are the main delivery failure patterns and root causes? ({context})"
+        return analyze_filtered(apply_cli_filters(view, **filters), question, context, narrate)
+
+    raise ValueError("Request needs one of: ask, query_order, compare_cities, compare_by, "
+                     "filter_city, filter_client, filter_warehouse, from_date, to_date, "
+                     "show_insights")
+
+
+def run_streaming(args):
+    """--stream: --show_insights/--filter_*/--report computed chunk by chunk."""
+    filters    = cli_filters(args)
+    desc_parts = describe_cli_filters(**filters)
+    views = []
+    if args.show_insights or desc_parts:
+        views.append(filters)
+    if args.report:
+        views.append({})
+    if args.report:
+        # The report ranks cities, warehouses, clients and conditions, so it streams the cube.
+        cube = stream_failure_cube(chunk_rows=args.chunk_size, max_memory_mb=args.max_memory_mb,
+                                   columns=ENTRY_POINT_COLUMNS["report"])
+        stats = None if cube is None else [summary_stats(apply_cli_filters(cube, **view)) for view in views]
+    else:
+        stats = stream_summaries(views, chunk_rows=args.chunk_size, max_memory_mb=args.max_memory_mb)
+    if stats is None:
+        return
+    if args.show_insights or desc_parts:
+        context = f"Filtered: {', '.join(desc_parts)}" if desc_parts else "Full dataset"
+        question = f"What are the main delivery failure patterns and root causes? ({context})"
+        narrative = llm_generate_narrative(question, format_data_summary(stats[0]), context)
+        print(f"\n{narrative}")
+    if args.report:
+        write_report(ReportData(stats[-1], cube), token_budget=args.report_budget)
+
+
+def run_stage_durations(args):
+    """--stage_durations: order timelines for the --filter_city/--from/--to orders."""
+    if args.filter_client or args.filter_warehouse:
+        print("--stage_durations supports --filter_city, --from and --to only.")
+        return
+    try:
+        orders = apply_cli_filters(read_table("orders", TIMELINE_ORDER_COLUMNS),
+                                   city=args.filter_city, period=cli_period(args.from_date, args.to_date))
+        timeline = build_timeline(orders, chunk_rows=args.chunk_size)
+    except Exception as e:
+        print(f"Error loading data: {e}")
+        return
+    print(f"\n{format_stage_report(timeline)}")
+
+
+# ---------------------------------------------------------------------------
+# Resident Mode (--serve / --repl)
+# ---------------------------------------------------------------------------
+
+SERVE_THREADS = 8
+REPL_HELP = ("Type a question, or :order ID, :compare CITY1 CITY2 [...], :compare_by "
+             "city|client|warehouse|partner [NAME ...], :city NAME, :client NAME, "
+             ":warehouse NAME, :insights, :quit (quote multi-word names)")
+
+
+class QueryEngine:
+    """
+    Keeps the enriched order table and entity lists in memory for resident mode and
+    answers handle_request() requests against them. reload_if_changed() swaps in a fresh
+    table when the source CSVs change; requests already running keep the table they
+    started with.
+    """
+
+    def __init__(self, workers: int = 1):
+        self.workers     = workers
+        self.loaded      = None     # (rich_df, entities, FailureCube)
+        self.fingerprint = None
+        self.reloads     = 0
+        self.loaded_at   = None
+        self._lock       = threading.Lock()
+
+    def load(self) -> bool:
+        """(Re)build the table; returns False and keeps the current one if loading fails."""
+        try:
+            fingerprint = source_fingerprint(self.fingerprint)
+        except OSError as e:
+            print(f"Error loading data: {e}")
+            return False
+        loaded = load_rich_data(ASK_COLUMNS, entities=True, workers=self.workers)
+        if not loaded:
+            return False
+        loaded = (*loaded, load_failure_cube(loaded[0], ASK_COLUMNS, entities=True).build_index())
+        if self.loaded is not None:
+            self.reloads += 1
+        self.loaded, self.fingerprint, self.loaded_at = loaded, fingerprint, time.time()
+        return True
+
+    def reload_if_changed(self) -> bool:
+        """Reload when any source CSV's size or content changed; True if it did."""
+        with self._lock:
+            try:
+                current = source_fingerprint(self.fingerprint)
+            except OSError:
+                return False    # a file is being replaced; try again on the next check
+            if self.loaded is not None and _same_sources(current, self.fingerprint):
+                self.fingerprint = current
+                return False
+            print("Source data changed, reloading...")
+            return self.load()
+
+    def answer(self, request: dict) -> str:
+        rich_df, entities, cube = self.loaded
+        return handle_request(rich_df, entities, request, cube)
+
+    def health(self) -> dict:
+        cache = get_llm_cache()
+        return {"status": "ok", "orders": len(self.loaded[0]), "loaded_at": self.loaded_at,
+                "reloads": self.reloads, "llm_cache": cache.stats() if cache else None}
+
+
+def _http_response(writer, status: int, payload: dict):
+    reason = {200: "OK", 400: "Bad Request", 404: "Not Found", 500: "Internal Server Error",
+              503: "Service Unavailable"}[status]
+    body = json.dumps(payload, default=str).encode("utf-8")
+    writer.write(f"HTTP/1.1 {status} {reason}\r\nContent-Type: application/json\r\n"
+                 f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode("latin-1") + body)
+
+
+async def _serve_connection(engine: QueryEngine, pool, reader, writer):
+    """One HTTP/1.1 exchange: GET /health or POST /query with a handle_request() JSON body."""
+    loop = asyncio.get_running_loop()
+    try:
+        method, path, _ = (await reader.readline()).decode("latin-1").split(" ", 2)
+        headers = {}
+        while (line := await reader.readline()) not in (b"\r\n", b"\n", b""):
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        body = await reader.readexactly(int(headers.get("content-length", 0)))
+
+        if method == "GET" and path == "/health":
+            _http_response(writer, 200, engine.health())
+        elif method == "POST" and path == "/query":
+            request = json.loads(body or b"{}")
+            if not isinstance(request, dict):
+                raise ValueError("Request body must be a JSON object")
+            answer = await loop.run_in_executor(pool, engine.answer, request)
+            _http_response(writer, 200, {"answer": answer})
+        else:
+            _http_response(writer, 404, {"error": f"No route for {method} {path}"})
+    except (ValueError, KeyError, asyncio.IncompleteReadError) as e:
+        _http_response(writer, 400, {"error": str(e)})
+    except EnvironmentError as e:
+        _http_response(writer, 503, {"error": str(e)})
+    except Exception as e:
+        _http_response(writer, 500, {"error": f"AI analysis failed: {e}"})
+    try:
+        await writer.drain()
+    finally:
+        writer.close()
+
+
+async def serve(engine: QueryEngine, host: str, port: int, reload_interval: float):
+    """--serve: answer JSON requests concurrently; pandas and Gemini calls run on a thread pool."""
+    loop = asyncio.get_running_loop()
+    pool = concurrent.futures.ThreadPoolExecutor(SERVE_THREADS)
+    server = await asyncio.start_server(
+        lambda r, w: _serve_connection(engine, pool, r, w), host, port)
+
+    async def watch_sources():
+        while True:
+            await asyncio.sleep(reload_interval)
+            await loop.run_in_executor(pool, engine.reload_if_changed)
+
+    watcher = asyncio.create_task(watch_sources())
+    print(f"Serving on http://{host}:{port} (POST /query, GET /health); Ctrl+C to stop.")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        watcher.cancel()
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _repl_request(line: str) -> dict:
+    if not line.startswith(":"):
+        return {"ask": line}
+    command, *rest = shlex.split(line[1:]) or [""]
+    if command == "order" and len(rest) == 1:
+        return {"query_order": int(rest[0])}
+    if command == "compare":
+        return {"compare_cities": rest}
+    if command == "compare_by" and rest:
+        return {"compare_by": rest}
+    if command in ("city", "client", "warehouse") and rest:
+        return {f"filter_{command}": " ".join(rest)}
+    if command == "insights":
+        return {"show_insights": True}
+    raise ValueError(f"Unknown command: {line}\n{REPL_HELP}")
+
+
+def run_repl(engine: QueryEngine):
+    """--repl: answer questions typed at a prompt against the resident table."""
+    print(REPL_HELP)
+    while True:
+        try:
+            line = input("\nask> ").strip()
+        except (EOFError, KeyboardInterrupt):
+            print()
+            return
+        if line in (":quit", ":q", ":exit"):
+            return
+        if not line:
+            continue
+        engine.reload_if_changed()
+        try:
+            print(f"\n{engine.answer(_repl_request(line))}")
+        except ValueError as e:
+            print(e)
+        except EnvironmentError as e:
+            print(f"\nConfiguration error:\n{e}")
+        except Exception as e:
+            print(f"\nAI analysis failed: {e}")
+
+
+# ---------------------------------------------------------------------------
+# Batch Mode (--batch)
+# ---------------------------------------------------------------------------
+
+# Error codes worth retrying: rate limiting and transient server failures.
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+
+def _retry_delay_hint(error: Exception):
+    """Seconds to wait suggested by a Gemini error (its retryDelay), or None."""
+    match = re.search(r"retryDelay['\"]?\s*:\s*['\"]?(\d+(?:\.\d+)?)s", str(error))
+    return float(match.group(1)) if match else None
+
+
+class LLMCallScheduler:
+    """
+    Runs blocking LLM calls from asyncio: at most `concurrency` in flight on a thread pool,
+    at most `rpm` started per minute, and rate-limit or transient errors retried up to
+    `retries` times with exponential backoff and jitter (or the server's retryDelay).
+    A 429 holds back every caller until the delay has passed, not only the one that got it.
+    """
+
+    def __init__(self, concurrency: int = 8, retries: int = 4, rpm: float = None,
+                 base_delay: float = 1.0):
+        self.semaphore  = asyncio.Semaphore(concurrency)
+        self.pool       = concurrent.futures.ThreadPoolExecutor(max_workers=concurrency)
+        self.interval   = 60.0 / rpm if rpm else 0.0
+        self.base_delay = base_delay
+        self.retries    = retries
+        self.not_before = 0.0       # loop time before which no call may start
+        self.stats      = collections.Counter()
+
+    async def _start_slot(self):
+        loop = asyncio.get_running_loop()
+        while self.not_before > loop.time():
+            await asyncio.sleep(self.not_before - loop.time())
+        self.not_before = loop.time() + self.interval
+
+    async def call(self, fn, *args):
+        """Return fn(*args) run on the pool, retried as described above."""
+        loop = asyncio.get_running_loop()
+        for attempt in range(self.retries + 1):
+            async with self.semaphore:
+                await self._start_slot()
+                self.stats["calls"] += 1
+                try:
+                    return await loop.run_in_executor(self.pool, fn, *args)
+                except Exception as e:
+                    code = getattr(e, "code", None)
+                    transient = code in RETRYABLE_STATUS or isinstance(e, (TimeoutError, ConnectionError))
+                    if attempt == self.retries or not transient:
+                        raise
+                    delay = _retry_delay_hint(e) or self.base_delay * 2 ** attempt
+                    delay *= 1 + random.random() / 4
+                    if code == 429:
+                        self.stats["rate_limited"] += 1
+                        self.not_before = max(self.not_before, loop.time() + delay)
+            self.stats["retries"] += 1
+            await asyncio.sleep(delay)
+
+    def close(self):
+        self.pool.shutdown(wait=False)
+
+
+def read_batch(path: str) -> list:
+    """
+    Requests of a --batch file: one JSON object per line with handle_request() keys
+    ("question" is accepted for "ask") and an optional "id" (default: the line number).
+    Lines that cannot be parsed become requests carrying an "error".
+    """
+    requests = []
+    with open(path, encoding="utf-8") as f:
+        for number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                request = json.loads(line)
+                if not isinstance(request, dict):
+                    raise ValueError("expected a JSON object")
+            except ValueError as e:
+                request = {"error": f"line {number}: {e}"}
+            if "question" in request and "ask" not in request:
+                request["ask"] = request.pop("question")
+            request.setdefault("id", number)
+            requests.append(request)
+    return requests
+
+
+async def _answer_batch(loaded, requests: list, out, scheduler: LLMCallScheduler) -> collections.Counter:
+    """
+    Answer `requests` against `loaded` (rich_df, entities, cube), writing one JSON line per
+    request to `out` as soon as its answer is known. Intents the local matcher cannot
+    resolve are parsed concurrently first; then every summary is built locally and each
+    distinct narrative prompt is sent to Gemini once, concurrently.
+    """
+    rich_df, entities, cube = loaded
+    counts = collections.Counter()
+
+    def emit(request, answer=None, error=None):
+        record = {"id": request["id"], "request": {k: v for k, v in request.items()
+                                                   if k not in ("id", "intent", "error")},
+                  "answer": answer, "error": error}
+        out.write(json.dumps(record, default=str) + "\n")
+        out.flush()
+        counts["errors" if error else "answered"] += 1
+
+    # 1. Intents: local matcher first, Gemini (once per distinct question) for the rest.
+    questions = {r["ask"] for r in requests if r.get("ask") and "error" not in r}
+    intents = {q: local_intent(q, entities) for q in questions}
+    unresolved = [q for q, intent in intents.items() if intent is None]
+    parsed = await asyncio.gather(*(scheduler.call(llm_parse_intent, q, entities)
+                                    for q in unresolved), return_exceptions=True)
+    intents.update(zip(unresolved, parsed))
+    counts["llm_intents"] = len(unresolved)
+
+    # 2. Summaries, built locally; identical prompts are grouped.
+    prompts = {}
+    for request in requests:
+        intent = intents.get(request.get("ask"))
+        if "error" in request:
+            emit(request, error=request["error"])
+            continue
+        if isinstance(intent, Exception):
+            emit(request, error=f"Intent parsing failed: {intent}")
+            continue
+        try:
+            result = handle_request(rich_df, entities, dict(request, intent=intent), cube, Narrative)
+        except Exception as e:
+            emit(request, error=str(e))
+            continue
+        if isinstance(result, Narrative):
+            prompts.setdefault(result, []).append(request)
+        else:
+            emit(request, answer=result)
+    counts["narratives"] = len(prompts)
+
+    # 3. Narratives, concurrently; answers are written in completion order.
+    async def narrate(prompt):
+        try:
+            return prompt, await scheduler.call(llm_generate_narrative, *prompt), None
+        except Exception as e:
+            return prompt, None, f"AI analysis failed: {e}"
+
+    for done in asyncio.as_completed([narrate(prompt) for prompt in prompts]):
+        prompt, answer, error = await done
+        for request in prompts[prompt]:
+            emit(request, answer, error)
+    return counts
+
+
+def run_batch(path: str, out_path: str = None, concurrency: int = 8, retries: int = 4,
+              rpm: float = None, workers: int = 1):
+    """--batch: answer every request in the JSONL file `path` in this one process."""
+    out_path = out_path or re.sub(r"(\.jsonl)?$", ".answers.jsonl", path, count=1)
+    try:
+        requests = read_batch(path)
+    except OSError as e:
+        print(f"Error reading batch file: {e}")
+        return
+    engine = QueryEngine(workers=workers)
+    if not engine.load():
+        return
+
+    async def answer_all():
+        scheduler = LLMCallScheduler(concurrency, retries, rpm)
+        try:
+            with open(out_path, "w", encoding="utf-8") as out:
+                return await _answer_batch(engine.loaded, requests, out, scheduler), scheduler.stats
+        finally:
+            scheduler.close()
+
+    start = time.perf_counter()
+    counts, stats = asyncio.run(answer_all())
+    print(f"Answered {counts['answered']} of {len(requests)} requests "
+          f"({counts['errors']} errors) in {time.perf_counter() - start:.1f}s → {out_path}")
+    print(f"Gemini calls: {stats['calls']} ({counts['llm_intents']} intents, "
+          f"{counts['narratives']} distinct narratives, {stats['retries']} retries, "
+          f"{stats['rate_limited']} rate-limited)")
+
+
+# ---------------------------------------------------------------------------
+# Sectioned Report (--report)
+# ---------------------------------------------------------------------------
+
+# Largest summary handed to Gemini per section, in estimate_tokens() units.
+REPORT_TOKEN_BUDGET = 800
+REPORT_TOP_N    = 10     # entities listed per ranking
+REPORT_DETAIL_N = 5      # worst entities broken down by reason
+
+# What the section builders read: SummaryStats of the whole dataset and a FailureCube or
+# enriched frame to slice (the cube streamed chunk by chunk in --stream mode).
+ReportData = collections.namedtuple("ReportData", "stats view")
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough Gemini token count of `text`: about four characters per token."""
+    return (len(text) + 3) // 4
+
+
+def trim_to_budget(text: str, budget: int) -> str:
+    """
+    Keep whole lines of `text` from the top while they fit in `budget` tokens. Section
+    summaries put the most important lines first, so the tail is what gets dropped.
+    """
+    if estimate_tokens(text) <= budget:
+        return text
+    lines, kept, used = text.split("\n"), [], 0
+    for line in lines:
+        used += estimate_tokens(line + "\n")
+        if used > budget - 20:      # room for the note below
+            break
+        kept.append(line)
+    kept.append(f"(… {len(lines) - len(kept)} more lines omitted to fit the token budget)")
+    return "\n".join(kept)
+
+
+def _rollup(view, column: str) -> pd.DataFrame:
+    """Orders, failed-or-late orders and failure rate (%) per value of `column`, most failures first."""
+    if isinstance(view, FailureCube):
+        table = _weighted_rows(view, [column]).groupby(column, observed=True)[['orders', 'failures']].sum()
+    else:
+        flags = pd.DataFrame({'orders': 1, 'failures': (view['is_failed'] | view['is_late']).astype(int)},
+                             index=view.index)
+        table = flags.groupby(view[column], observed=True).sum()
+    table['rate'] = table['failures'] / table['orders'] * 100
+    return table.sort_values('failures', ascending=False, kind='stable')
+
+
+def _ranking(table: pd.DataFrame, n: int) -> list:
+    return [f"  • {row.Index}: {row.failures} failed/late of {row.orders} orders ({row.rate:.1f}%)"
+            for row in table.head(n).itertuples()]
+
+
+def _overview_section(data: ReportData):
+    return format_data_summary(data.stats)
+
+
+def _entity_section(column: str, plural: str):
+    """Builder ranking the values of `column` by failures and rate, with the worst broken down."""
+    def build(data: ReportData):
+        if data.view is None or column not in data.view.columns:
+            return None
+        table = _rollup(data.view, column)
+        lines = [f"{plural} by failed/late orders ({len(table)} in total):"] + _ranking(table, REPORT_TOP_N)
+        # Rates are only meaningful with some volume: at least the average per value.
+        busy = table[table['orders'] >= table['orders'].mean()]
+        lines.append(f"\n{plural} with the highest failure rates (at least average volume):")
+        lines += _ranking(busy.sort_values('rate', ascending=False, kind='stable'), REPORT_DETAIL_N)
+        lines.append(f"\nTop reasons at the {REPORT_DETAIL_N} {plural.lower()} with most failures:")
+        for value in table.index[:REPORT_DETAIL_N]:
+            rows = (data.view.equal(column, value) if isinstance(data.view, FailureCube)
+                    else data.view[data.view[column] == value])
+            counts = summary_stats(rows).failure_counts
+            reasons = " | ".join(f"{reason} ({cnt})" for reason, cnt in _top(counts['consolidated_reason'], 3))
+            lines.append(f"  {value}: {reasons or 'no failures'}")
+        return "\n".join(lines)
+    return build
+
+
+def _conditions_section(data: ReportData):
+    if data.view is None:
+        return None
+    stats = data.stats
+    lines = [f"Overall failed/late rate: {stats.failed / max(stats.total, 1) * 100:.1f}% "
+             f"of {stats.total} orders"]
+    for column, label in (('weather_condition', "Weather"), ('traffic_condition', "Traffic")):
+        if column in data.view.columns:
+            table = _rollup(data.view, column).sort_values('rate', ascending=False, kind='stable')
+            lines.append(f"\n{label} conditions by failure rate:")
+            lines += _ranking(table, REPORT_TOP_N)
+    return "\n".join(lines)
+
+
+def _events_section(data: ReportData):
+    if data.view is None or 'event_type' not in data.view.columns:
+        return None
+    stats = data.stats
+    table = _rollup(data.view, 'event_type')
+    quiet_orders = stats.total - int(table['orders'].sum())
+    quiet_failed = stats.failed - int(table['failures'].sum())
+    lines = [f"Orders with no external event: {quiet_failed} failed/late of {quiet_orders} "
+             f"({quiet_failed / max(quiet_orders, 1) * 100:.1f}%)", "\nExternal events:"]
+    return "\n".join(lines + _ranking(table, REPORT_TOP_N))
+
+
+def _feedback_section(data: ReportData):
+    lines = format_feedback(data.stats)
+    if not lines:
+        return None
+    stats = data.stats
+    if stats.ratings and stats.on_time_ratings:
+        means = [sum(rating * n for rating, n in ratings.items()) / sum(ratings.values())
+                 for ratings in (stats.ratings, stats.on_time_ratings)]
+        lines.append(f"\nAverage rating: {means[0]:.2f} for failed/late orders, "
+                     f"{means[1]:.2f} for on-time ones")
+    return "\n".join(lines)
+
+
+ReportSection = collections.namedtuple("ReportSection", "key title question build")
+REPORT_SECTIONS = [
+    ReportSection("overview", "Overview",
+                  "Summarise overall delivery performance and the main root causes of failed or late orders.",
+                  _overview_section),
+    ReportSection("cities", "City Hotspots",
+                  "Which cities are delivery failure hotspots, and what drives the failures in each?",
+                  _entity_section('city', "Cities")),
+    ReportSection("warehouses", "Warehouses",
+                  "Which warehouses are linked to the most failed or late deliveries, and why?",
+                  _entity_section('warehouse_name', "Warehouses")),
+    ReportSection("clients", "Clients",
+                  "Which clients' orders fail or arrive late most often, and why?",
+                  _entity_section('client_name', "Clients")),
+    ReportSection("conditions", "Weather and Traffic",
+                  "How do weather and traffic conditions affect delivery failure rates?",
+                  _conditions_section),
+    ReportSection("events", "External Events",
+                  "How do external events (strikes, festivals, etc.) affect deliveries?",
+                  _events_section),
+    ReportSection("feedback", "Customer Feedback Themes",
+                  "What do customers say about failed or late deliveries, and what themes stand out?",
+                  _feedback_section),
+]
+
+
+def _section_summary(section: ReportSection, data: ReportData, token_budget: int):
+    """The section's summary trimmed to `token_budget`, or None if the data cannot support it."""
+    with span(f"report:{section.key}") as sp:
+        summary = section.build(data)
+        if summary is None:
+            return None
+        trimmed = trim_to_budget(summary, token_budget)
+        sp.set(tokens=estimate_tokens(trimmed), trimmed_tokens=estimate_tokens(summary) - estimate_tokens(trimmed))
+        return trimmed
+
+
+async def _write_sections(data: ReportData, sections: list, token_budget: int, out):
+    """
+    Build every section's summary on a thread and narrate it as soon as it is ready, all
+    sections at once. Sections are written to `out` in order, each as soon as it and the
+    ones before it are done. Returns the number of sections written and the errors.
+    """
+    loop = asyncio.get_running_loop()
+    scheduler = LLMCallScheduler(concurrency=len(sections))
+    written, errors = 0, []
+    try:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=len(sections)) as pool:
+            async def narrate(section):
+                summary = await loop.run_in_executor(pool, _section_summary, section, data, token_budget)
+                if summary is None:
+                    return None
+                return await scheduler.call(llm_generate_narrative, section.question, summary,
+                                            f"Delivery failure report – {section.title}")
+
+            tasks = [asyncio.ensure_future(narrate(section)) for section in sections]
+            for section, task in zip(sections, tasks):
+                try:
+                    text = await task
+                except Exception as e:
+                    errors.append(e)
+                    text = f"_This section could not be generated: {e}_"
+                if text is None:
+                    continue
+                out.write(f"## {section.title}\n\n{text.strip()}\n\n")
+                out.flush()
+                written += 1
+    finally:
+        scheduler.close()
+    return written, errors
+
+
+@traced("write_report")
+def write_report(data: ReportData, sections=None, token_budget: int = REPORT_TOKEN_BUDGET):
+    """
+    Write OUTPUT_REPORT: one narrated section per REPORT_SECTIONS entry the data supports,
+    each from its own summary trimmed to `token_budget` tokens. Summaries and Gemini calls
+    for all sections run concurrently, so the report takes about as long as its slowest
+    section rather than the sum of them.
+    """
+    sections = REPORT_SECTIONS if sections is None else sections
+    print(f"\nGenerating full report → {OUTPUT_REPORT} ...")
+    start = time.perf_counter()
+    with open(OUTPUT_REPORT, "w", encoding="utf-8") as f:
+        f.write("# Delivery Failure Analysis Report\n\n")
+        f.flush()
+        written, errors = asyncio.run(_write_sections(data, sections, token_budget, f))
+    if errors:
+        print(f"Warning: {len(errors)} report section(s) could not be generated: {errors[0]}")
+    print(f"Report saved to {OUTPUT_REPORT} ({written} sections in {time.perf_counter() - start:.1f}s)")
+
+
+# ---------------------------------------------------------------------------
 # Main
 # ---------------------------------------------------------------------------
 
+def _date_arg(value: str) -> pd.Timestamp:
+    try:
+        return pd.Timestamp(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"not a date: {value!r} (expected YYYY-MM-DD)")
+
+
 def main():
     parser = argparse.ArgumentParser(
         description="AI-Powered Delivery Failure Analysis System",
@@ -427,73 +4165,168 @@ def main():
   python delivery_analytics.py --ask "What are the top failure reasons for Warehouse 1?"
   python delivery_analytics.py --ask "What happens during festival periods?"
   python delivery_analytics.py --report
-  python delivery_analytics.py --filter_city "New Delhi" --show_insights"""
+  python delivery_analytics.py --filter_city "New Delhi" --show_insights
+  python delivery_analytics.py --compare_cities Mumbai Pune Chennai
+  python delivery_analytics.py --compare_by warehouse --from 2025-08-01
+  python delivery_analytics.py --filter_city Mumbai --from 2025-08-01 --to 2025-08-31
+  python delivery_analytics.py --stage_durations --filter_city Pune
+  python delivery_analytics.py --serve 127.0.0.1:8765
+  python delivery_analytics.py --repl
+  python delivery_analytics.py --batch nightly_questions.jsonl --batch_concurrency 16"""
     )
     parser.add_argument("--ask",             type=str,  help="Ask any question in plain English (AI-powered)")
     parser.add_argument("--query_order",     type=int,  help="Deep-dive into a specific order ID")
     parser.add_argument("--filter_city",     type=str,  help="Filter analysis by city name")
     parser.add_argument("--filter_client",   type=str,  help="Filter analysis by client name")
     parser.add_argument("--filter_warehouse",type=str,  help="Filter analysis by warehouse name or city")
-    parser.add_argument("--compare_cities",  nargs=2,   help="Compare two cities: --compare_cities CityA CityB")
+    parser.add_argument("--compare_cities",  nargs="+", help="Compare two or more cities: --compare_cities CityA CityB ...")
+    parser.add_argument("--compare_by",      nargs="+", metavar="DIMENSION [NAME]",
+                        help="Compare the cities, clients, warehouses or partners named (all of them "
+                             "when none are): --compare_by warehouse ['Warehouse 1' ...]")
+    parser.add_argument("--from",            dest="from_date", type=_date_arg, metavar="YYYY-MM-DD",
+                        help="Only orders placed on or after this date")
+    parser.add_argument("--to",              dest="to_date", type=_date_arg, metavar="YYYY-MM-DD",
+                        help="Only orders placed on or before this date")
     parser.add_argument("--show_insights",   action="store_true", help="Show aggregate insights")
     parser.add_argument("--report",          action="store_true", help="Generate a full narrative report file")
+    parser.add_argument("--report_budget",   type=int,  default=REPORT_TOKEN_BUDGET,
+                        help=f"Token budget of each report section's data summary (default: {REPORT_TOKEN_BUDGET})")
+    parser.add_argument("--diagnostics",     action="store_true", help="Print per-column memory usage of the unified order table")
+    parser.add_argument("--rebuild_cache",   action="store_true", help="Ignore the cached dataset and rebuild it from the CSVs")
+    parser.add_argument("--refresh",         action="store_true", help="Bring every cached dataset up to date with the CSVs, "
+                                                                        "applying appended rows incrementally")
+    parser.add_argument("--workers",         type=int,  default=1, help="Worker processes for the join + enrichment step (default: 1)")
+    parser.add_argument("--stream",          action="store_true", help="Process orders in bounded chunks (datasets larger than RAM); "
+                                                                        "supports --show_insights, --filter_* and --report")
+    parser.add_argument("--stage_durations", action="store_true", help="Correlate warehouse, fleet and weather events with each order "
+                                                                        "by time and report per-stage durations")
+    parser.add_argument("--chunk_size",      type=int,  default=250_000, help="Rows per chunk in --stream and --stage_durations "
+                                                                        "modes (default: 250000)")
+    parser.add_argument("--max_memory_mb",   type=int,  help="Approximate memory cap for --stream mode; shrinks chunks to fit")
+    parser.add_argument("--no_cache", "--no-cache", dest="no_cache", action="store_true",
+                        help="Bypass the LLM response cache and always call Gemini")
+    parser.add_argument("--serve",           nargs="?", const="127.0.0.1:8765", metavar="HOST:PORT",
+                        help="Keep the data loaded and answer JSON requests over HTTP (default 127.0.0.1:8765)")
+    parser.add_argument("--repl",            action="store_true", help="Keep the data loaded and answer questions interactively")
+    parser.add_argument("--reload_interval", type=float, default=5.0, help="Seconds between source-change checks in --serve mode (default: 5)")
+    parser.add_argument("--batch",           type=str,  metavar="FILE", help="Answer every request in a JSONL file (one JSON object per line, "
+                                                                        "e.g. {\"id\": 1, \"question\": \"...\"}) in one process")
+    parser.add_argument("--batch_out",       type=str,  metavar="FILE", help="Where --batch writes its answers (default: FILE.answers.jsonl)")
+    parser.add_argument("--batch_concurrency", type=int, default=8, help="Gemini calls in flight at once in --batch mode (default: 8)")
+    parser.add_argument("--batch_retries",   type=int,  default=4, help="Retries of a rate-limited or failed Gemini call (default: 4)")
+    parser.add_argument("--batch_rpm",       type=float, help="Cap on Gemini requests started per minute in --batch mode")
+    parser.add_argument("--profile",         action="store_true", help="Print wall/CPU time, peak memory growth and row counts per pipeline stage")
+    parser.add_argument("--profile_trace",   type=str,  metavar="FILE", help="Write the profiled stages as a Chrome trace (chrome://tracing, Perfetto)")
+    parser.add_argument("--profile_cprofile",type=str,  metavar="FILE", help="Write a cProfile dump of the run (python -m pstats FILE)")
     args = parser.parse_args()
+    if args.compare_cities and len(args.compare_cities) < 2:
+        parser.error("--compare_cities takes at least two city names")
+    if args.compare_by and args.compare_by[0] not in COMPARE_DIMENSIONS:
+        parser.error(f"--compare_by takes one of: {', '.join(COMPARE_DIMENSIONS)}")
+    set_llm_cache_enabled(not args.no_cache)
 
-    data = load_data()
-    if not data:
+    filtering = (args.filter_city or args.filter_client or args.filter_warehouse or
+                 args.from_date is not None or args.to_date is not None)
+    if not any([args.ask, args.query_order, args.compare_cities, args.compare_by, args.show_insights,
+                filtering, args.report, args.diagnostics, args.serve, args.repl, args.refresh,
+                args.batch, args.stage_durations]):
+        parser.print_help()
         return
 
-    full_df = combine_data(data)
-    rich_df = enrich_data(full_df)
+    with profiling(args.profile, args.profile_trace, args.profile_cprofile):
+        run(args, filtering)
 
-    # ------------------------------------------------------------------
-    # AI Natural Language path  (--ask)
-    # ------------------------------------------------------------------
-    if args.ask:
-        print(f"\nQuestion: \"{args.ask}\"")
-        print("Thinking...\n" + "-" * 60)
-        try:
-            intent = llm_parse_intent(args.ask, data)
-            action = intent.get('action', 'show_insights')
 
-            if action == 'query_order' and intent.get('order_id'):
-                analyze_order(rich_df, int(intent['order_id']), args.ask)
+def run(args, filtering: bool):
+    """Carry out the command selected by main()'s parsed arguments."""
+    if args.batch:
+        run_batch(args.batch, args.batch_out, args.batch_concurrency, args.batch_retries,
+                  args.batch_rpm, args.workers)
+        return
 
-            elif action == 'compare_cities' and intent.get('cities') and len(intent['cities']) >= 2:
-                analyze_comparison(rich_df, intent['cities'][0], intent['cities'][1], args.ask)
+    if args.refresh:
+        refresh_cache(args.workers)
+        return
 
-            elif action == 'filter_analysis':
-                filters   = intent.get('filters', {}) or {}
-                subset    = rich_df.copy()
-                desc_parts = []
+    if args.stage_durations:
+        run_stage_durations(args)
+        return
 
-                city = filters.get('city')
-                if city:
-                    subset = subset[subset['city'].str.lower() == city.lower()]
-                    desc_parts.append(f"City={city}")
+    if args.serve or args.repl:
+        engine = QueryEngine(workers=args.workers)
+        if not engine.load():
+            return
+        if args.repl:
+            run_repl(engine)
+            return
+        host, _, port = args.serve.rpartition(":")
+        try:
+            asyncio.run(serve(engine, host or "127.0.0.1", int(port), args.reload_interval))
+        except KeyboardInterrupt:
+            print("\nStopped.")
+        return
 
-                client = filters.get('client')
-                if client:
-                    subset = subset[subset['client_name'].str.contains(client, case=False, na=False)]
-                    desc_parts.append(f"Client={client}")
+    if args.stream:
+        if args.ask or args.query_order or args.compare_cities or args.compare_by or args.diagnostics:
+            print("--stream supports --show_insights, --filter_* and --report only.")
+            return
+        run_streaming(args)
+        return
 
-                warehouse = filters.get('warehouse')
-                if warehouse:
-                    mask = (subset['warehouse_name'].str.lower() == warehouse.lower()) | \
-                           (subset['warehouse_city'].str.lower() == warehouse.lower())
-                    subset = subset[mask]
-                    desc_parts.append(f"Warehouse={warehouse}")
+    if args.query_order and not (args.ask or args.diagnostics):
+        # Single-order deep dive: resolve it through the record index, not the full table.
+        try:
+            order_df = lookup_order(args.query_order, ENTRY_POINT_COLUMNS["analyze_order"],
+                                    rebuild_index=args.rebuild_cache)
+        except (OSError, ValueError) as e:
+            print(f"Error loading data: {e}")
+            return
+        print(f"\n{analyze_order(order_df, args.query_order, ORDER_QUESTION.format(args.query_order))}")
+        return
 
-                time_range = intent.get('time_range')
-                if time_range:
-                    desc_parts.append(f"Period={time_range}")
+    if args.ask:
+        columns = ASK_COLUMNS
+    elif args.diagnostics:
+        columns = None
+    else:
+        columns = set()
+        if args.query_order:
+            columns.update(ENTRY_POINT_COLUMNS["analyze_order"])
+        if args.compare_cities or args.compare_by:
+            columns.update(ENTRY_POINT_COLUMNS["analyze_comparison"])
+        if args.show_insights or filtering:
+            columns.update(ENTRY_POINT_COLUMNS["analyze_filtered"])
+        if args.report:
+            columns.update(ENTRY_POINT_COLUMNS["report"])
+        columns = sorted(columns)
 
-                context = f"Filtered view ({', '.join(desc_parts)})" if desc_parts else "Aggregate view"
-                analyze_filtered(subset, args.ask, context)
+    loaded = load_rich_data(columns, entities=bool(args.ask), read_cache=not args.rebuild_cache,
+                            workers=args.workers)
+    if not loaded:
+        return
+    rich_df, entities = loaded
+    cube = None
+    comparing = args.compare_cities or args.compare_by
+    if args.ask or comparing or args.show_insights or filtering or args.report:
+        cube = load_failure_cube(rich_df, columns, entities=bool(args.ask),
+                                 read_cache=not args.rebuild_cache)
 
-            else:
-                analyze_filtered(rich_df, args.ask, "Full dataset – aggregate view")
+    if args.diagnostics:
+        print(memory_report(rich_df))
+        cache = get_llm_cache()
+        if cache is not None:
+            stats = cache.stats()
+            print(f"LLM cache: {stats.get('entries', 0)} entries, "
+                  f"{stats['total_hits']} hits / {stats['total_misses']} misses to date")
 
+    # ------------------------------------------------------------------
+    # AI Natural Language path  (--ask)
+    # ------------------------------------------------------------------
+    if args.ask:
+        print(f"\nQuestion: \"{args.ask}\"")
+        print("Thinking...\n" + "-" * 60)
+        try:
+            print(f"\n{answer_question(rich_df, entities, args.ask, cube)}")
         except EnvironmentError as e:
             print(f"\nConfiguration error:\n{e}")
         except Exception as e:
@@ -504,57 +4337,13 @@ def main():
     # ------------------------------------------------------------------
     # Direct CLI flag paths
     # ------------------------------------------------------------------
-    if args.query_order:
-        analyze_order(rich_df, args.query_order,
-                      f"Give a detailed explanation for why order {args.query_order} failed or was delayed.")
-        return
-
-    if args.compare_cities:
-        analyze_comparison(rich_df, args.compare_cities[0], args.compare_cities[1],
-                           f"Compare delivery failure causes between {args.compare_cities[0]} and {args.compare_cities[1]}.")
-        return
-
-    # Build filtered subset for insight commands
-    subset     = rich_df.copy()
-    desc_parts = []
-
-    if args.filter_city:
-        subset = subset[subset['city'] == args.filter_city]
-        desc_parts.append(f"City={args.filter_city}")
-
-    if args.filter_client:
-        subset = subset[subset['client_name'].str.contains(args.filter_client, case=False, na=False)]
-        desc_parts.append(f"Client={args.filter_client}")
-
-    if args.filter_warehouse:
-        mask = ((subset['warehouse_city'] == args.filter_warehouse) |
-                (subset['warehouse_name'] == args.filter_warehouse))
-        subset = subset[mask]
-        desc_parts.append(f"Warehouse={args.filter_warehouse}")
-
-    if args.show_insights or desc_parts:
-        context = f"Filtered: {', '.join(desc_parts)}" if desc_parts else "Full dataset"
-        question = f"What are the main delivery failure patterns and root causes? ({context})"
-        analyze_filtered(subset, question, context)
+    if args.query_order or comparing or args.show_insights or filtering:
+        print(f"\n{handle_request(rich_df, entities, vars(args), cube)}")
+        if args.query_order or comparing:
+            return
 
     if args.report:
-        print(f"\nGenerating full report → {OUTPUT_REPORT} ...")
-        question = (
-            "Generate a comprehensive delivery failure analysis report. "
-            "Cover: overall stats, top root causes, city/warehouse hotspots, "
-            "weather/traffic impact, and actionable recommendations."
-        )
-        summary   = prepare_data_summary(rich_df)
-        narrative = llm_generate_narrative(question, summary, "Full dataset – executive report")
-        with open(OUTPUT_REPORT, "w", encoding="utf-8") as f:
-            f.write("# Delivery Failure Analysis Report\n\n")
-            f.write(narrative)
-        print(f"Report saved to {OUTPUT_REPORT}")
-
-    if not any([args.ask, args.query_order, args.compare_cities,
-                args.show_insights, args.filter_city, args.filter_client,
-                args.filter_warehouse, args.report]):
-        parser.print_help()
+        write_report(ReportData(summary_stats(cube), cube), token_budget=args.report_budget)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,244 @@
+"""
+Synthetic delivery datasets at any scale, shaped like the sample data.
+
+Every generated order is a copy of a randomly drawn sample order (so status, dates,
+failure reason, city and amount stay consistent with each other, and null rates match
+the sample), with a fresh order_id. It carries copies of that sample order's fleet,
+warehouse, weather and feedback records, so the share of orders with no log and with
+duplicate logs matches too. Clients, drivers and warehouses are the sample tables
+tiled to the requested counts (by default growing with the square root of the order
+count), and foreign keys keep the sample's skew across the tiles.
+
+Output is written in chunks, so memory stays flat from 1e4 up to 1e8 orders.
+
+Usage:
+  python generate_data.py --orders 1000000 --out data-1m
+  python generate_data.py --orders 100000000 --out /mnt/data-100m --duplicate_logs 0.5
+"""
+import argparse
+import csv
+import io
+import math
+import os
+import time
+
+import numpy as np
+
+import delivery_analytics as da
+
+# Primary key and foreign keys (with the table they reference) rewritten in each table.
+KEYS = {
+    "clients":        ('client_id', {}),
+    "drivers":        ('driver_id', {}),
+    "warehouses":     ('warehouse_id', {}),
+    "orders":         ('order_id', {'client_id': "clients"}),
+    "fleet_logs":     ('fleet_log_id', {'order_id': "orders", 'driver_id': "drivers"}),
+    "warehouse_logs": ('log_id', {'order_id': "orders", 'warehouse_id': "warehouses"}),
+    "weather":        ('factor_id', {'order_id': "orders"}),
+    "feedback":       ('feedback_id', {'order_id': "orders"}),
+}
+DIMENSIONS = ("clients", "drivers", "warehouses")
+LOGS       = ("fleet_logs", "warehouse_logs", "weather", "feedback")
+
+
+def _read_sample(name: str, sample_dir: str):
+    """Header and rows (lists of raw strings) of one sample CSV."""
+    with open(os.path.join(sample_dir, da.SOURCE_FILES[name]), newline="", encoding="utf-8") as f:
+        rows = list(csv.reader(f))
+    return rows[0], rows[1:]
+
+
+def _templates(header: list, rows: list, slots: list) -> list:
+    """
+    Render each row as a CSV line with `slots` columns left as str.format() fields
+    {0}, {1}, ... in that order, so a generated record is one template.format() call.
+    """
+    positions = {header.index(column): k for k, column in enumerate(slots)}
+    out, templates = io.StringIO(), []
+    for row in rows:
+        fields = [("{%d}" % positions[i]) if i in positions else
+                  value.replace("{", "{{").replace("}", "}}") for i, value in enumerate(row)]
+        out.seek(0)
+        out.truncate()
+        csv.writer(out, lineterminator="\n").writerow(fields)
+        templates.append(out.getvalue())
+    return templates
+
+
+def _int_column(header: list, rows: list, column: str) -> np.ndarray:
+    """Integer column of raw rows, -1 where empty."""
+    i = header.index(column)
+    return np.array([int(float(r[i])) if r[i] else -1 for r in rows], dtype=np.int64)
+
+
+def _remap(ids: np.ndarray, sample_size: int, size: int, rng) -> np.ndarray:
+    """
+    Map sample foreign keys (1..sample_size) onto a dimension tiled to `size` rows: each
+    reference lands on a random tile of the same sample row, keeping the sample's skew.
+    """
+    if size <= sample_size:
+        return np.where(ids > 0, (ids - 1) % size + 1, ids)
+    tiles  = rng.integers(0, math.ceil(size / sample_size), len(ids))
+    mapped = ids + tiles * sample_size
+    return np.where((ids <= 0), ids, np.where(mapped > size, ids, mapped))
+
+
+def _field(value) -> str:
+    """One CSV field: empty for a missing (negative) id, quoted when the text needs it."""
+    if isinstance(value, str):
+        return '"' + value.replace('"', '""') + '"' if any(c in value for c in ',"\n') else value
+    return "" if value < 0 else str(value)
+
+
+def _write_rows(f, templates: list, picks: np.ndarray, *columns):
+    """Append one rendered line per pick, filling each template's slots from `columns`."""
+    values = [[_field(v) for v in column.tolist()] for column in columns]
+    f.write("".join(templates[p].format(*fields)
+                    for p, fields in zip(picks.tolist(), zip(*values))))
+
+
+def default_counts(orders: int, sample_orders: int, sample_sizes: dict) -> dict:
+    """Dimension table sizes for `orders` orders: the sample sizes scaled by sqrt(growth)."""
+    growth = math.sqrt(max(orders / sample_orders, 1.0))
+    return {name: max(1, round(size * growth)) for name, size in sample_sizes.items()}
+
+
+def generate(out_dir: str, orders: int, sample_dir: str = None, counts: dict = None,
+             duplicate_logs: float = None, chunk_orders: int = 200_000, seed: int = 0) -> dict:
+    """
+    Write a synthetic dataset of `orders` orders to `out_dir` (same file names and columns
+    as the sample in `sample_dir`, default da.DATA_DIR). `counts` overrides the clients,
+    drivers and warehouses sizes; `duplicate_logs` sets the share of logged orders with
+    more than one record in each log (default: as in the sample). Returns the row count
+    written per table.
+    """
+    sample_dir = sample_dir or da.DATA_DIR
+    rng = np.random.default_rng(seed)
+    os.makedirs(out_dir, exist_ok=True)
+    sample = {name: _read_sample(name, sample_dir) for name in da.SOURCE_FILES}
+
+    sizes  = {name: len(sample[name][1]) for name in DIMENSIONS}
+    counts = {**default_counts(orders, len(sample["orders"][1]), sizes), **(counts or {})}
+    written = dict.fromkeys(da.SOURCE_FILES, 0)
+    files = {name: open(os.path.join(out_dir, da.SOURCE_FILES[name]), "w", newline="",
+                        encoding="utf-8") for name in da.SOURCE_FILES}
+    try:
+        for name, f in files.items():
+            f.write(",".join(sample[name][0]) + "\n")
+
+        # Dimension tables: the sample tiled to the requested size; names stay unique.
+        for name in DIMENSIONS:
+            header, rows = sample[name]
+            key = KEYS[name][0]
+            label = {"clients": 'client_name', "warehouses": 'warehouse_name'}.get(name)
+            slots = [key] + ([label] if label else [])
+            templates = _templates(header, rows, slots)
+            ids = np.arange(1, counts[name] + 1)
+            picks = (ids - 1) % len(rows)
+            columns = [ids]
+            if label:
+                base = [r[header.index(label)] for r in rows]
+                tile = (ids - 1) // len(rows)
+                labels = [f"Warehouse {i}" if name == "warehouses" else
+                          (base[p] if t == 0 else f"{base[p]} {t + 1}")
+                          for i, p, t in zip(ids.tolist(), picks.tolist(), tile.tolist())]
+                columns.append(np.array(labels, dtype=object))
+            _write_rows(files[name], templates, picks, *columns)
+            written[name] = counts[name]
+
+        # Orders and their logs, chunk by chunk.
+        header, rows = sample["orders"]
+        order_templates = _templates(header, rows, ['order_id', 'client_id'])
+        sample_ids  = _int_column(header, rows, 'order_id')
+        client_ids  = _int_column(header, rows, 'client_id')
+        position_of = {oid: i for i, oid in enumerate(sample_ids.tolist())}
+        logs = {}
+        for name in LOGS:
+            log_header, log_rows = sample[name]
+            key, refs = KEYS[name]
+            owner = np.array([position_of.get(i, -1) for i in
+                              _int_column(log_header, log_rows, 'order_id').tolist()])
+            order = np.argsort(owner, kind='stable')
+            order = order[owner[order] >= 0]
+            per_order = np.bincount(owner[order], minlength=len(rows))
+            fk = next((c for c in refs if c != 'order_id'), None)
+            logs[name] = {
+                "templates": _templates(log_header, log_rows, [key, 'order_id'] + ([fk] if fk else [])),
+                "rows": order, "count": per_order, "first": np.cumsum(per_order) - per_order,
+                "fk": fk and (_int_column(log_header, log_rows, fk), refs[fk]),
+            }
+            logs[name]["dup_share"] = (per_order > 1).sum() / max((per_order > 0).sum(), 1)
+
+        for start in range(0, orders, chunk_orders):
+            n = min(chunk_orders, orders - start)
+            picks = rng.integers(0, len(rows), n)
+            order_ids = np.arange(start + 1, start + n + 1)
+            clients = _remap(client_ids[picks], sizes["clients"], counts["clients"], rng)
+            _write_rows(files["orders"], order_templates, picks, order_ids, clients)
+            written["orders"] += n
+
+            for name, log in logs.items():
+                count = log["count"][picks]
+                if duplicate_logs is not None:
+                    count = _adjust_duplicates(count, log["dup_share"], duplicate_logs, rng)
+                total = int(count.sum())
+                offset = np.arange(total) - np.repeat(np.cumsum(count) - count, count)
+                source = np.repeat(picks, count)
+                # A record added by _adjust_duplicates() repeats the order's last one.
+                within = np.minimum(offset, np.repeat(log["count"][picks], count) - 1)
+                rows_of = log["rows"][log["first"][source] + within]
+                shuffle = rng.permutation(total)
+                rows_of, owners = rows_of[shuffle], np.repeat(order_ids, count)[shuffle]
+                columns = [np.arange(written[name] + 1, written[name] + total + 1), owners]
+                if log["fk"]:
+                    ref_ids, table = log["fk"]
+                    columns.append(_remap(ref_ids[rows_of], sizes[table], counts[table], rng))
+                _write_rows(files[name], log["templates"], rows_of, *columns)
+                written[name] += total
+    finally:
+        for f in files.values():
+            f.close()
+    return written
+
+
+def _adjust_duplicates(count: np.ndarray, share: float, target: float, rng) -> np.ndarray:
+    """
+    Move the share of logged orders with more than one record from `share` (the sample's)
+    towards `target`: single-record orders gain a second record, or multi-record orders
+    are cut to one, each with the probability that hits `target` in expectation.
+    """
+    count = count.copy()
+    if target > share:
+        grow = (count == 1) & (rng.random(len(count)) < (target - share) / (1 - share))
+        count[grow] = 2
+    elif target < share:
+        cut = (count > 1) & (rng.random(len(count)) < (share - target) / share)
+        count[cut] = 1
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic delivery dataset")
+    parser.add_argument("--orders",         type=int, required=True, help="Number of orders to generate")
+    parser.add_argument("--out",            type=str, required=True, help="Output directory for the CSVs")
+    parser.add_argument("--sample_dir",     type=str, help="Sample dataset to model (default: DELIVERY_DATA_DIR)")
+    parser.add_argument("--clients",        type=int, help="Number of clients (default: grows with sqrt(orders))")
+    parser.add_argument("--drivers",        type=int, help="Number of drivers (default: grows with sqrt(orders))")
+    parser.add_argument("--warehouses",     type=int, help="Number of warehouses (default: grows with sqrt(orders))")
+    parser.add_argument("--duplicate_logs", type=float, help="Share of logged orders with several records per log "
+                                                             "(default: as in the sample)")
+    parser.add_argument("--chunk_orders",   type=int, default=200_000, help="Orders generated per chunk (default: 200000)")
+    parser.add_argument("--seed",           type=int, default=0)
+    args = parser.parse_args()
+
+    counts = {name: getattr(args, name) for name in DIMENSIONS if getattr(args, name)}
+    start = time.perf_counter()
+    written = generate(args.out, args.orders, args.sample_dir, counts, args.duplicate_logs,
+                       args.chunk_orders, args.seed)
+    for name, rows in written.items():
+        print(f"{da.SOURCE_FILES[name]:<20} {rows:>14,} rows")
+    print(f"Generated in {time.perf_counter() - start:.1f}s → {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,36 @@
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# delivery_analytics reads its configuration at import time: point it at the sample data,
+# a throwaway cache and the offline LLM client before any test imports it.
+os.environ["DELIVERY_DATA_DIR"] = os.path.join(ROOT, "third-assignment-sample-data-set")
+os.environ["DELIVERY_CACHE_DIR"] = tempfile.mkdtemp(prefix="delivery-cache-")
+os.environ.setdefault("DELIVERY_FAKE_LLM", "0")
+sys.path.insert(0, ROOT)
+
+import pytest  # noqa: E402
+
+import delivery_analytics as da  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def data():
+    return da.load_data()
+
+
+@pytest.fixture(scope="session")
+def entities(data):
+    return da.extract_entities(data)
+
+
+@pytest.fixture(scope="session")
+def rich_df():
+    return da.load_rich_data(read_cache=False, write_cache=False)[0]
+
+
+@pytest.fixture(scope="session")
+def cube(rich_df):
+    return da.FailureCube.from_frame(rich_df)
@@ -0,0 +1,134 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import delivery_analytics as da
+
+# Filter views checked against a plain scan of the enriched table.
+VIEWS = [{}, {"city": "Mumbai"}, {"client": "Saini"}, {"warehouse": "Warehouse 1"},
+         {"city": "Pune", "period": da.cli_period("2025-04-01", "2025-06-30")}]
+
+
+def assert_cubes_equal(actual, expected):
+    for name in ("cells", "members", "feedback", "on_time"):
+        left, right = getattr(actual, name), getattr(expected, name)
+        assert (left is None) == (right is None), name
+        if left is not None:
+            pd.testing.assert_frame_equal(left.reset_index(drop=True), right.reset_index(drop=True),
+                                          check_categorical=False)
+    if expected.feedback_index is not None:
+        np.testing.assert_array_equal(actual.feedback_index.codes, expected.feedback_index.codes)
+
+
+def summary(view) -> str:
+    return da.format_data_summary(da.summary_stats(view))
+
+
+def test_build_reasons_matches_generate_reason(data):
+    df = da.assess_performance(da.combine_data(data, verbose=False))
+    expected = df.apply(da.generate_reason, axis=1)
+    assert da.build_reasons(df).astype(object).tolist() == expected.tolist()
+
+
+def test_workers_match_serial_path(rich_df):
+    parallel = da.load_rich_data(read_cache=False, write_cache=False, workers=2)[0]
+    pd.testing.assert_frame_equal(parallel, rich_df, check_categorical=False)
+
+
+def test_stream_summaries_match_in_memory():
+    rich_df = da.load_rich_data(da.ENTRY_POINT_COLUMNS["analyze_filtered"], read_cache=False,
+                                write_cache=False)[0]
+    streamed = da.stream_summaries(VIEWS, chunk_rows=1_500)
+    for view, stats in zip(VIEWS, streamed):
+        assert da.format_data_summary(stats) == summary(da.apply_cli_filters(rich_df, **view)), view
+
+
+def test_streamed_cube_matches_in_memory():
+    columns = da.ENTRY_POINT_COLUMNS["report"]
+    rich_df = da.load_rich_data(columns, read_cache=False, write_cache=False)[0]
+    assert_cubes_equal(da.stream_failure_cube(chunk_rows=1_500, columns=columns),
+                       da.FailureCube.from_frame(rich_df))
+
+
+@pytest.mark.parametrize("view", VIEWS)
+def test_cube_summaries_match_frame(rich_df, cube, view):
+    assert summary(da.apply_cli_filters(cube, **view)) == summary(da.apply_cli_filters(rich_df, **view))
+
+
+def test_cube_comparison_matches_frame(rich_df, cube):
+    # The cube has no driver breakdown; every other one must match a scan of the frame.
+    breakdowns = {col: shown for col, shown in da.COMPARISON_BREAKDOWNS.items() if col != "driver_name"}
+    texts = [da.prepare_comparison_summary(view, "city", ["Mumbai", "New Delhi"], breakdowns)
+             for view in (rich_df, cube)]
+    assert texts[0] == texts[1]
+
+
+def _write_prefix(source: str, target: str, share: float):
+    """Copy the header and the first `share` of the records of every CSV in `source`."""
+    ends = {}
+    for filename in da.SOURCE_FILES.values():
+        path = os.path.join(source, filename)
+        starts, stops = da._record_bounds(path)
+        raw = open(path, "rb").read()
+        ends[filename] = (raw, int(stops[int(len(stops) * share) - 1]))
+        with open(os.path.join(target, filename), "wb") as f:
+            f.write(raw[:ends[filename][1]])
+    return ends
+
+
+def test_apply_appends_matches_rebuild(tmp_path, monkeypatch, capsys):
+    source = da.DATA_DIR
+    monkeypatch.setattr(da, "DATA_DIR", str(tmp_path / "data"))
+    monkeypatch.setattr(da, "CACHE_DIR", str(tmp_path / "cache"))
+    monkeypatch.setattr(da, "CACHE_PART_ROWS", 1_000)
+    os.makedirs(da.DATA_DIR)
+    prefixes = _write_prefix(source, da.DATA_DIR, 0.8)
+    rich_df, _ = da.load_rich_data(entities=True)
+    da.load_failure_cube(rich_df, entities=True)
+
+    for filename, (raw, end) in prefixes.items():
+        with open(os.path.join(da.DATA_DIR, filename), "ab") as f:
+            f.write(raw[end:])
+    capsys.readouterr()
+    refreshed, names = da.load_rich_data(entities=True)
+    assert "Applying rows appended" in capsys.readouterr().out
+    rebuilt, rebuilt_names = da.load_rich_data(entities=True, read_cache=False, write_cache=False)
+    pd.testing.assert_frame_equal(refreshed, rebuilt, check_categorical=False)
+    assert names == rebuilt_names
+    assert_cubes_equal(da.load_failure_cube(refreshed, entities=True, write_cache=False),
+                       da.FailureCube.from_frame(rebuilt))
+
+
+@pytest.mark.parametrize("question, action, expected", [
+    ("Why were deliveries delayed in Mumbai last week?", "filter_analysis",
+     {"filters": {"city": "Mumbai"}, "time_range": "last week"}),
+    ("What went wrong in Mumabi?", "filter_analysis", {"filters": {"city": "Mumbai"}}),
+    ("What are the top failure reasons for Warehouse 1?", "filter_analysis",
+     {"filters": {"warehouse": "Warehouse 1"}}),
+    ("How did Warehouse 10 do in August?", "filter_analysis",
+     {"filters": {"warehouse": "Warehouse 10"}, "time_range": "August"}),
+    ("failures for Arora-Kant in Pune", "filter_analysis",
+     {"filters": {"city": "Pune", "client": "Arora-Kant"}}),
+    ("Compare delivery failures between Mumbai and Delhi", "compare_cities",
+     {"cities": ["Mumbai", "New Delhi"]}),
+    ("Why did order 1234 fail?", "query_order", {"order_id": 1234}),
+])
+def test_local_intent_resolves(entities, question, action, expected):
+    intent = da.local_intent(question, entities)
+    assert intent is not None and intent["action"] == action
+    for key, value in expected.items():
+        if key == "filters":
+            assert {k: v for k, v in intent["filters"].items() if v} == value
+        else:
+            assert intent[key] == value
+
+
+@pytest.mark.parametrize("question", [
+    "Tell me about #77",
+    "Compare failures this month vs last month",
+    "Hello there",
+])
+def test_local_intent_defers_to_llm(entities, question):
+    assert da.local_intent(question, entities) is None